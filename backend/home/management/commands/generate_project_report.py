@@ -1,8 +1,92 @@
+import functools
 import json
-import subprocess
+import re
 
 import django
+from django.conf import settings
+from django.contrib.admindocs.views import simplify_regex
 from django.core.management.base import BaseCommand
+from django.urls import URLPattern, URLResolver, get_resolver
+
+# Decorators flagged in each entry's "decorators", as show_urls does by default.
+REPORTED_DECORATORS = ["login_required"]
+
+
+def extract_views(urlpatterns, base="", namespace=None):
+    """
+    ``(callback, regex, name)`` for every route under ``urlpatterns``, walking
+    the already loaded resolver the same way ``show_urls`` does.
+    """
+    views = []
+    for pattern in urlpatterns:
+        if isinstance(pattern, URLPattern):
+            name = pattern.name
+            if namespace and name:
+                name = f"{namespace}:{name}"
+            regex = base + str(pattern.pattern)
+            views.append((pattern.callback, regex, name))
+        elif isinstance(pattern, URLResolver):
+            if namespace and pattern.namespace:
+                child_namespace = f"{namespace}:{pattern.namespace}"
+            else:
+                child_namespace = pattern.namespace or namespace
+            views.extend(
+                extract_views(
+                    pattern.url_patterns,
+                    base + str(pattern.pattern),
+                    child_namespace,
+                )
+            )
+    return views
+
+
+def view_class(callback):
+    # DRF views expose ``cls``; Django class-based views ``view_class``.
+    return getattr(callback, "cls", None) or getattr(callback, "view_class", None)
+
+
+def http_methods(callback):
+    actions = getattr(callback, "actions", None)
+    if actions:
+        return sorted(method.upper() for method in actions)
+    cls = view_class(callback)
+    if cls is None:
+        return None
+    return [
+        method.upper()
+        for method in cls.http_method_names
+        if method != "options" and hasattr(cls, method)
+    ]
+
+
+def route_entry(callback, regex, name):
+    func = callback
+    func_globals = getattr(func, "__globals__", {})
+    decorators = [d for d in REPORTED_DECORATORS if d in func_globals]
+    if isinstance(func, functools.partial):
+        func = func.func
+        decorators.insert(0, "functools.partial")
+    cls = view_class(func)
+    if cls is not None:
+        func = cls
+    if hasattr(func, "__name__"):
+        func_name = func.__name__
+    elif hasattr(func, "__class__"):
+        func_name = f"{func.__class__.__name__}()"
+    else:
+        func_name = re.sub(r" at 0x[0-9a-f]+", "", repr(func))
+
+    actions = getattr(callback, "actions", None)
+    return {
+        "url": simplify_regex(regex),
+        "module": f"{func.__module__}.{func_name}",
+        "name": name or "",
+        "decorators": ", ".join(decorators),
+        "view_class": f"{cls.__module__}.{cls.__name__}" if cls else None,
+        "actions": dict(actions) if actions else None,
+        "http_methods": http_methods(callback),
+        "csrf_exempt": getattr(callback, "csrf_exempt", False),
+    }
 
 
 class Command(BaseCommand):
@@ -12,8 +96,10 @@ class Command(BaseCommand):
         models = django.apps.apps.get_models(
             include_auto_created=True, include_swapped=True
         )
-        cmd = "python3 manage.py show_urls --format=json"
-        loc = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE)
+        urls = [
+            route_entry(callback, regex, name)
+            for callback, regex, name in extract_views(get_resolver().url_patterns)
+        ]
         print(
             json.dumps(
                 {
@@ -21,7 +107,10 @@ class Command(BaseCommand):
                         str(model).split(".")[-1].replace("'", "").strip(">")
                         for model in models
                     ],
-                    "urls": json.loads(loc.stdout.decode().strip()),
+                    "urls": urls,
+                    # Every route goes through the same stack; "csrf_exempt"
+                    # in each entry tells whether CsrfViewMiddleware applies.
+                    "middleware": settings.MIDDLEWARE,
                 }
             )
         )
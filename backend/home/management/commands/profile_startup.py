@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Boot the project in a fresh process and print a JSON breakdown of "
+        "startup time (settings, app imports, URLconf, middleware, sdk_client)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--skip-sdk",
+            action="store_true",
+            help="Don't time the first sdk_client() call (no Palantir token request).",
+        )
+        parser.add_argument(
+            "--output", dest="output", help="Also write the report to this file."
+        )
+
+    def handle(self, *args, **options):
+        command = [sys.executable, "-m", "komtest416_47549.startup_profile"]
+        if options["skip_sdk"]:
+            command.append("--skip-sdk")
+        result = subprocess.run(
+            command, cwd=settings.BASE_DIR, env=os.environ.copy(), stdout=subprocess.PIPE
+        )
+        if result.returncode:
+            raise CommandError(
+                f"Startup profile failed with exit code {result.returncode}"
+            )
+
+        report = json.loads(result.stdout.decode())
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
@@ -1,3 +1,222 @@
-from django.test import TestCase
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from unittest import mock
 
-# Create your tests here.
+from cryptography.fernet import Fernet
+from django.contrib.auth.decorators import login_required
+from django.core.handlers import base
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import SimpleTestCase, override_settings
+from django.urls import include, path
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from google.auth.exceptions import DefaultCredentialsError
+from rest_framework import routers, viewsets
+
+from komtest416_47549 import secret_bootstrap, startup_profile
+from komtest416_47549.secret_bootstrap import SecretFetchTimeout, load_secret_payload
+from modules import manifest
+
+
+class SecretBootstrapTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_path = os.path.join(tmp.name, "settings.secrets")
+        self.cache_key = Fernet.generate_key()
+
+    def load(self, fetch, **kwargs):
+        with mock.patch.object(
+            secret_bootstrap, "fetch_payload", side_effect=fetch
+        ) as fetch_payload:
+            payload, report = load_secret_payload(
+                "django_settings",
+                cache_key=self.cache_key,
+                cache_path=self.cache_path,
+                **kwargs,
+            )
+        return payload, report["source"], fetch_payload.call_count
+
+    def test_fresh_cache_skips_secret_manager(self):
+        self.assertEqual(
+            self.load(["SECRET_KEY=a"]), ("SECRET_KEY=a", "secret_manager", 1)
+        )
+        self.assertEqual(self.load(AssertionError), ("SECRET_KEY=a", "cache", 0))
+
+    def test_expired_cache_used_when_secret_manager_fails(self):
+        self.load(["SECRET_KEY=a"])
+        self.assertEqual(
+            self.load(RuntimeError("unavailable"), cache_ttl=-1),
+            ("SECRET_KEY=a", "stale_cache", 1),
+        )
+
+    def test_expired_cache_refreshed(self):
+        self.load(["SECRET_KEY=a"])
+        self.assertEqual(
+            self.load(["SECRET_KEY=b"], cache_ttl=-1),
+            ("SECRET_KEY=b", "secret_manager", 1),
+        )
+
+    def test_timeout_without_cache_raises(self):
+        with self.assertRaises(SecretFetchTimeout):
+            self.load(SecretFetchTimeout(10))
+
+    def test_timeout_with_cache_uses_it(self):
+        self.load(["SECRET_KEY=a"])
+        self.assertEqual(
+            self.load(SecretFetchTimeout(10), cache_ttl=-1),
+            ("SECRET_KEY=a", "stale_cache", 1),
+        )
+
+    def test_missing_credentials_start_without_secrets(self):
+        self.assertEqual(
+            self.load(DefaultCredentialsError("no credentials")), (None, "none", 1)
+        )
+
+    def test_other_errors_raise(self):
+        with self.assertRaisesMessage(RuntimeError, "unavailable"):
+            self.load(RuntimeError("unavailable"))
+
+    def test_optional_starts_without_secrets(self):
+        with self.assertLogs(secret_bootstrap.logger, "WARNING"):
+            self.assertEqual(
+                self.load(SecretFetchTimeout(10), optional=True), (None, "none", 1)
+            )
+
+
+class SlowMiddleware:
+    def __init__(self, get_response):
+        time.sleep(0.05)
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+
+class StartupProfileTests(SimpleTestCase):
+    def test_discovery_timed_inside_settings_import(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with open(os.path.join(tmp.name, "profiled_settings.py"), "w") as f:
+            f.write("from modules.manifest import get_modules\nMODULES_APPS = get_modules()\n")
+        self.addCleanup(sys.modules.pop, "profiled_settings", None)
+
+        def get_modules():
+            time.sleep(0.05)
+            return ["modules.example"]
+
+        with mock.patch.object(sys, "path", [tmp.name] + sys.path), mock.patch.dict(
+            os.environ, {"DJANGO_SETTINGS_MODULE": "profiled_settings"}
+        ), mock.patch.object(manifest, "get_modules", side_effect=get_modules) as mocked:
+            settings_module, report = startup_profile.profile_settings()
+            self.assertIs(manifest.get_modules, mocked)
+
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(settings_module.MODULES_APPS, ["modules.example"])
+        self.assertGreaterEqual(report["modules_discovery"], 0.05)
+        self.assertGreaterEqual(report["total"], report["modules_discovery"])
+
+    @override_settings(
+        MIDDLEWARE=[
+            "django.middleware.common.CommonMiddleware",
+            "home.tests.SlowMiddleware",
+        ]
+    )
+    def test_each_middleware_instantiation_timed(self):
+        import_string = base.import_string
+        report = startup_profile.profile_middleware()
+
+        self.assertIs(base.import_string, import_string)
+        self.assertEqual(
+            set(report["instantiations"]),
+            {"django.middleware.common.CommonMiddleware", "home.tests.SlowMiddleware"},
+        )
+        self.assertGreaterEqual(report["instantiations"]["home.tests.SlowMiddleware"], 0.05)
+        self.assertGreaterEqual(report["handler"], 0.05)
+
+
+class ReportViewSet(viewsets.ViewSet):
+    def list(self, request):
+        return HttpResponse()
+
+    def retrieve(self, request, pk=None):
+        return HttpResponse()
+
+
+class ReportView(View):
+    def get(self, request):
+        return HttpResponse()
+
+    def post(self, request):
+        return HttpResponse()
+
+
+@login_required
+def private_view(request):
+    return HttpResponse()
+
+
+@csrf_exempt
+def hook_view(request):
+    return HttpResponse()
+
+
+report_router = routers.DefaultRouter()
+report_router.register("items", ReportViewSet, basename="items")
+
+
+class ReportUrls:
+    urlpatterns = [
+        path("api/", include((report_router.urls, "api"), namespace="api")),
+        path("page/", ReportView.as_view(), name="page"),
+        path("private/", private_view, name="private"),
+        path("hook/", hook_view),
+    ]
+
+
+@override_settings(
+    ROOT_URLCONF=ReportUrls,
+    MIDDLEWARE=["django.middleware.common.CommonMiddleware"],
+)
+class GenerateProjectReportTests(SimpleTestCase):
+    def report(self):
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            call_command("generate_project_report")
+        report = json.loads(stdout.getvalue())
+        return report, {entry["url"]: entry for entry in report["urls"]}
+
+    def test_routes_read_from_the_resolver(self):
+        with mock.patch("subprocess.run") as run, mock.patch(
+            "subprocess.check_output"
+        ) as check_output:
+            report, urls = self.report()
+        run.assert_not_called()
+        check_output.assert_not_called()
+
+        self.assertIn("User", report["models"])
+        self.assertEqual(report["middleware"], ["django.middleware.common.CommonMiddleware"])
+
+        items = urls["/api/items/"]
+        self.assertEqual(items["name"], "api:items-list")
+        self.assertEqual(items["view_class"], "home.tests.ReportViewSet")
+        self.assertEqual(items["actions"], {"get": "list"})
+        self.assertEqual(items["http_methods"], ["GET"])
+        self.assertEqual(urls["/api/items/<pk>/"]["actions"], {"get": "retrieve"})
+
+        page = urls["/page/"]
+        self.assertEqual(page["module"], "home.tests.ReportView")
+        self.assertEqual(page["http_methods"], ["GET", "POST"])
+        self.assertIsNone(page["actions"])
+
+        self.assertEqual(urls["/private/"]["module"], "home.tests.private_view")
+        self.assertEqual(urls["/private/"]["decorators"], "login_required")
+        self.assertIsNone(urls["/private/"]["http_methods"])
+        self.assertTrue(urls["/hook/"]["csrf_exempt"])
+        self.assertFalse(page["csrf_exempt"])
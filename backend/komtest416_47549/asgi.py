@@ -0,0 +1,27 @@
+"""
+ASGI config for komtest416_47549 project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+
+os.environ.setdefault(
+    "DJANGO_SETTINGS_MODULE", "komtest416_47549.settings"
+)
+# Views that support it (e.g. the customer endpoints) are served as async
+# views that run their blocking Palantir calls on worker threads.
+os.environ.setdefault("ASYNC_VIEWS", "True")
+
+django.setup(set_prefix=False)
+
+# Django's handler, plus sending the customer exports without blocking the
+# event loop.
+from customer_app.asgi import ASGIHandler  # noqa: E402
+
+application = ASGIHandler()
@@ -0,0 +1,143 @@
+"""
+Secret Manager bootstrap for settings.py.
+
+The settings payload is fetched with a bounded timeout, and when
+``SECRETS_CACHE_KEY`` is set it is kept in a Fernet-encrypted file so every
+worker started within ``SECRETS_CACHE_TTL`` seconds reuses what the first one
+fetched instead of going through credentials discovery again. If Secret
+Manager is slow or failing, an expired cache is used; with no cache at all
+the error is raised.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from cryptography.fernet import Fernet, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+
+class SecretFetchTimeout(Exception):
+    def __init__(self, timeout):
+        self.message = f"Secret Manager did not answer within {timeout}s"
+        super().__init__(self.message)
+
+
+def fetch_payload(settings_name, timeout):
+    """
+    Latest version of secret ``settings_name`` from Secret Manager, decoded.
+    Runs on a daemon thread so a hung metadata server or credentials lookup
+    can't block startup for longer than ``timeout``.
+    """
+    result = {}
+
+    def fetch():
+        try:
+            # Imported here: the client libraries are slow to import and not
+            # needed at all when the cache is fresh.
+            import google.auth
+            from google.cloud import secretmanager
+
+            _, project = google.auth.default()
+            client = secretmanager.SecretManagerServiceClient()
+            name = client.secret_version_path(project, settings_name, "latest")
+            response = client.access_secret_version(name=name, timeout=timeout)
+            result["payload"] = response.payload.data.decode("UTF-8")
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=fetch, name="secret-bootstrap", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise SecretFetchTimeout(timeout)
+    if "error" in result:
+        raise result["error"]
+    return result["payload"]
+
+
+def read_cache(path, fernet, ttl=None):
+    """
+    Cached payload, or None if missing, unreadable, or older than ``ttl``.
+    """
+    try:
+        with open(path, "rb") as f:
+            return fernet.decrypt(f.read(), ttl=ttl).decode("UTF-8")
+    except (OSError, InvalidToken):
+        return None
+
+
+def write_cache(path, fernet, payload):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(fernet.encrypt(payload.encode("UTF-8")))
+    os.replace(tmp_path, path)
+
+
+def is_expected_error(error):
+    """
+    Errors that mean "no Secret Manager here" (e.g. local development), which
+    settings.py has always ignored.
+    """
+    from google.api_core.exceptions import PermissionDenied
+    from google.auth.exceptions import DefaultCredentialsError
+
+    return isinstance(error, (DefaultCredentialsError, PermissionDenied))
+
+
+def load_secret_payload(
+    settings_name,
+    timeout=10,
+    cache_key=None,
+    cache_path=None,
+    cache_ttl=300,
+    optional=False,
+):
+    """
+    The settings payload to feed to ``env.read_env``, or None when there is
+    none to be had. Returns ``(payload, report)``; ``report`` has the
+    ``source`` (cache, secret_manager, stale_cache or none) and ``duration``.
+
+    With ``optional`` any failure without a cache to fall back on starts
+    from the environment alone instead of raising.
+    """
+    start_time = time.monotonic()
+    fernet = Fernet(cache_key) if cache_key else None
+    cache_path = cache_path or os.path.join(
+        tempfile.gettempdir(), f"{settings_name}.secrets"
+    )
+
+    payload = read_cache(cache_path, fernet, ttl=cache_ttl) if fernet else None
+    source = "cache"
+    if payload is None:
+        try:
+            payload = fetch_payload(settings_name, timeout)
+            source = "secret_manager"
+            if fernet:
+                try:
+                    write_cache(cache_path, fernet, payload)
+                except OSError as e:
+                    logger.warning("Could not write secrets cache %s: %s", cache_path, e)
+        except Exception as e:
+            payload = read_cache(cache_path, fernet) if fernet else None
+            if payload is not None:
+                source = "stale_cache"
+                logger.warning("Secret Manager unavailable (%s), using cached secrets", e)
+            elif not isinstance(e, SecretFetchTimeout) and is_expected_error(e):
+                source = "none"
+            elif optional:
+                source = "none"
+                logger.warning(
+                    "Secret Manager unavailable (%s), starting from the environment only", e
+                )
+            else:
+                # Including a timeout: without a cache to fall back on, booting
+                # would only fail later on a missing setting.
+                raise
+
+    report = {"source": source, "duration": round(time.monotonic() - start_time, 3)}
+    logger.info("Secret bootstrap from %(source)s in %(duration)ss", report)
+    return payload, report
@@ -14,15 +14,13 @@ import os
 import io
 import environ
 import logging
+import logging.config
 import json
 import base64
 import binascii
-import google.auth
 from google.oauth2 import service_account
-from google.cloud import secretmanager
-from google.auth.exceptions import DefaultCredentialsError
-from google.api_core.exceptions import PermissionDenied
 from modules.manifest import get_modules
+from komtest416_47549.secret_bootstrap import load_secret_payload
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -34,16 +32,34 @@ env.read_env(env_file)
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = env.bool("DEBUG", default=False)
 
-try:
-    # Pull secrets from Secret Manager
-    _, project = google.auth.default()
-    client = secretmanager.SecretManagerServiceClient()
-    settings_name = os.environ.get("SETTINGS_NAME", "django_settings")
-    name = client.secret_version_path(project, settings_name, "latest")
-    payload = client.access_secret_version(name=name).payload.data.decode("UTF-8")
-    env.read_env(io.StringIO(payload))
-except (DefaultCredentialsError, PermissionDenied):
-    pass
+# The project's own loggers (timings, retries, outbound HTTP latency) go to
+# stderr at LOG_LEVEL. Modules are imported both as "<app>" and "modules.<app>".
+LOG_LEVEL = env.str("LOG_LEVEL", default="INFO")
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"default": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"}},
+    "handlers": {"console": {"class": "logging.StreamHandler", "formatter": "default"}},
+    "loggers": {
+        name: {"handlers": ["console"], "level": LOG_LEVEL, "propagate": False}
+        for name in ["komtest416_47549", "modules", "customer_app", "komatsu_idm"]
+    },
+}
+# Applied now so the secret bootstrap below is logged too; Django applies it
+# again during setup.
+logging.config.dictConfig(LOGGING)
+
+# Pull secrets from Secret Manager (bounded, with an encrypted on-disk cache)
+secret_payload, SECRETS_BOOTSTRAP = load_secret_payload(
+    os.environ.get("SETTINGS_NAME", "django_settings"),
+    timeout=env.float("SECRETS_BOOTSTRAP_TIMEOUT", default=10),
+    cache_key=env.str("SECRETS_CACHE_KEY", default=None),
+    cache_path=env.str("SECRETS_CACHE_PATH", default=None),
+    cache_ttl=env.int("SECRETS_CACHE_TTL", default=300),
+    optional=env.bool("SECRETS_OPTIONAL", default=False),
+)
+if secret_payload:
+    env.read_env(io.StringIO(secret_payload))
 
 
 # Quick-start development settings - unsuitable for production
@@ -140,6 +156,11 @@ if env.str("DATABASE_URL", default=None):
     }
 
 
+# Cache shared by all workers, e.g. rediscache://redis:6379/1 (needs django-redis)
+# or dbcache://django_cache (run createcachetable). The local-memory default is
+# per process.
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -213,6 +234,9 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# Serve async-capable views as async views; set by komtest416_47549.asgi.
+ASYNC_VIEWS = env.bool("ASYNC_VIEWS", default=False)
+
 # Custom user model
 AUTH_USER_MODEL = "users.User"
 
@@ -0,0 +1,173 @@
+"""
+Boot the project step by step in this (fresh) interpreter and print a JSON
+timing breakdown. Run through ``manage.py profile_startup``, which starts
+this module in a new process so nothing is already imported or cached.
+
+Steps, each in seconds:
+
+- settings: evaluating the settings module, with the Secret Manager
+  bootstrap report and a separate timing of module discovery
+- apps: import of every INSTALLED_APPS entry and of its models (flagged when
+  it comes from MODULES_APPS), plus the rest of ``django.setup()``
+- urlconf: importing ``modules.urls`` and building the root resolver
+- middleware: import and instantiation of each MIDDLEWARE entry, and
+  building the whole handler chain
+- sdk_client: the first ``sdk_client()`` call (token fetch and client build)
+"""
+import importlib
+import json
+import os
+import sys
+import time
+
+PROCESS_START = time.perf_counter()
+
+
+def timed(fn):
+    start_time = time.perf_counter()
+    result = fn()
+    return result, round(time.perf_counter() - start_time, 4)
+
+
+def app_module(entry):
+    """
+    Module to import for an INSTALLED_APPS entry, which may name an AppConfig.
+    """
+    module, _, last = entry.rpartition(".")
+    if module and last[:1].isupper():
+        return module
+    return entry
+
+
+def profile_settings():
+    from modules import manifest
+
+    # settings.py runs module discovery itself; time those calls in place.
+    discovery = []
+    get_modules = manifest.get_modules
+
+    def timed_get_modules(*args, **kwargs):
+        result, duration = timed(lambda: get_modules(*args, **kwargs))
+        discovery.append(duration)
+        return result
+
+    manifest.get_modules = timed_get_modules
+    try:
+        settings_module, duration = timed(
+            lambda: importlib.import_module(os.environ["DJANGO_SETTINGS_MODULE"])
+        )
+    finally:
+        manifest.get_modules = get_modules
+    return settings_module, {
+        "total": duration,
+        "secret_bootstrap": getattr(settings_module, "SECRETS_BOOTSTRAP", None),
+        "modules_discovery": round(sum(discovery), 4),
+    }
+
+
+def profile_apps(settings_module):
+    import django
+    from django.apps import AppConfig
+
+    modules_apps = set(getattr(settings_module, "MODULES_APPS", []) or [])
+    apps = {}
+    for entry in settings_module.INSTALLED_APPS:
+        _, duration = timed(lambda: importlib.import_module(app_module(entry)))
+        apps[entry] = {"import": duration, "module_app": entry in modules_apps}
+
+    models_times = {}
+    import_models = AppConfig.import_models
+
+    def timed_import_models(app_config):
+        _, models_times[app_config.name] = timed(lambda: import_models(app_config))
+
+    AppConfig.import_models = timed_import_models
+    try:
+        _, setup = timed(django.setup)
+    finally:
+        AppConfig.import_models = import_models
+
+    for entry, app in apps.items():
+        app["models"] = models_times.get(app_module(entry), models_times.get(entry))
+    return {"apps": apps, "django_setup": setup}
+
+
+def profile_urlconf():
+    from django.urls import get_resolver
+
+    _, modules_urls = timed(lambda: importlib.import_module("modules.urls"))
+    _, resolver = timed(lambda: get_resolver().url_patterns)
+    return {"modules_urls": modules_urls, "root_resolver": resolver}
+
+
+def profile_middleware():
+    from django.conf import settings
+    from django.core.handlers import base
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.utils.module_loading import import_string
+
+    imports = {}
+    for middleware_path in settings.MIDDLEWARE:
+        _, imports[middleware_path] = timed(lambda: import_string(middleware_path))
+
+    # The handler builds the chain by calling each middleware factory; time
+    # every call by handing it wrapped factories.
+    instantiations = {}
+
+    def timed_import_string(middleware_path):
+        factory = import_string(middleware_path)
+
+        def timed_factory(get_response):
+            instance, instantiations[middleware_path] = timed(
+                lambda: factory(get_response)
+            )
+            return instance
+
+        timed_factory.sync_capable = getattr(factory, "sync_capable", True)
+        timed_factory.async_capable = getattr(factory, "async_capable", False)
+        return timed_factory
+
+    base.import_string = timed_import_string
+    try:
+        _, handler = timed(WSGIHandler)
+    finally:
+        base.import_string = import_string
+    return {"imports": imports, "instantiations": instantiations, "handler": handler}
+
+
+def profile_sdk_client():
+    try:
+        main, import_duration = timed(
+            lambda: importlib.import_module(
+                "modules.django_komatsu_idm.komatsu_idm.main"
+            )
+        )
+        _, first_call = timed(main.sdk_client)
+        return {"import": import_duration, "first_call": first_call}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def main(argv):
+    sys.path.insert(0, os.getcwd())
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "komtest416_47549.settings")
+
+    # Anything the project prints while booting goes to stderr so stdout
+    # carries only the report.
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        settings_module, settings_report = profile_settings()
+        report = {"settings": settings_report}
+        report.update(profile_apps(settings_module))
+        report["urlconf"] = profile_urlconf()
+        report["middleware"] = profile_middleware()
+        if "--skip-sdk" not in argv:
+            report["sdk_client"] = profile_sdk_client()
+        report["total"] = round(time.perf_counter() - PROCESS_START, 4)
+    finally:
+        sys.stdout = stdout
+    sys.stdout.write(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,71 @@
+"""
+Streamed customer responses under ASGI.
+
+Django 3.2's ASGI handler iterates a ``StreamingHttpResponse`` synchronously
+on the event loop. ``AsyncStreamingHttpResponse`` carries an async iterator
+instead (see ``concurrency.aiter_in_thread``), which ``ASGIHandler`` sends
+without blocking the loop. The project's ASGI entry point must serve
+``ASGIHandler`` for the exports to work there.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+from django.http import StreamingHttpResponse
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    def __init__(self, streaming_content, *args, **kwargs):
+        super().__init__((), *args, **kwargs)
+        self.async_streaming_content = streaming_content
+
+    def __iter__(self):
+        raise TypeError(
+            "AsyncStreamingHttpResponse can only be sent by customer_app.asgi.ASGIHandler"
+        )
+
+
+def response_headers(response):
+    """
+    ASGI header list of ``response``, cookies included.
+    """
+    headers = []
+    for header, value in response.items():
+        if isinstance(header, str):
+            header = header.encode("ascii")
+        if isinstance(value, str):
+            value = value.encode("latin1")
+        headers.append((bytes(header), bytes(value)))
+    for cookie in response.cookies.values():
+        headers.append(
+            (b"Set-Cookie", cookie.output(header="").encode("ascii").strip())
+        )
+    return headers
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    Django's ASGI handler, plus sending ``AsyncStreamingHttpResponse`` bodies
+    from their async iterator.
+    """
+
+    async def send_response(self, response, send):
+        content = getattr(response, "async_streaming_content", None)
+        if content is None:
+            return await super().send_response(response, send)
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": response_headers(response),
+            }
+        )
+        try:
+            async for part in content:
+                for chunk, _ in self.chunk_bytes(response.make_bytes(part)):
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+        finally:
+            await content.aclose()
+        await send({"type": "http.response.body"})
+        await sync_to_async(response.close, thread_sensitive=True)()
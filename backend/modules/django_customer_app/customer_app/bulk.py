@@ -0,0 +1,52 @@
+"""
+Bulk re-parenting of customer organizations.
+
+Records are fetched with one ``where`` query per chunk of primary keys and
+the edit actions run on a bounded thread pool. Every pk gets its own entry in
+the returned report, so one bad record doesn't hide what happened to the rest.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from customer_app.models import CustomerOrganizationModel
+from customer_app.writes import write_customer
+
+
+def bulk_max_workers():
+    return getattr(settings, "CUSTOMER_APP_BULK_MAX_WORKERS", 8)
+
+
+def bulk_update_parent(sdk_client, pk_list, pk_parent, max_workers=None):
+    """
+    Set ``parent`` to ``pk_parent`` on every customer in ``pk_list``.
+
+    Returns ``{pk: {"success": bool, "error": str (on failure)}}`` in the
+    order of ``pk_list``.
+    """
+    pk_list = list(dict.fromkeys(pk_list))
+    customers = CustomerOrganizationModel.get_objects(pk_list)
+    report = {}
+
+    def edit(pk):
+        write_customer(sdk_client, pk, record=customers[pk], parent=pk_parent)
+
+    found = [pk for pk in pk_list if pk in customers]
+    with ThreadPoolExecutor(max_workers=max_workers or bulk_max_workers()) as pool:
+        futures = {
+            pk: pool.submit(contextvars.copy_context().run, edit, pk) for pk in found
+        }
+
+    for pk in pk_list:
+        if pk not in customers:
+            report[pk] = {
+                "success": False,
+                "error": f"No object found with primary key: {pk}",
+            }
+            continue
+        error = futures[pk].exception()
+        report[pk] = (
+            {"success": True} if error is None else {"success": False, "error": str(error)}
+        )
+    return report
@@ -0,0 +1,106 @@
+"""
+Short-lived cache for ``customer_count`` values.
+
+Counts are keyed by a canonical hash of everything that scopes the query
+(filters, search, parent, distributor, backend) plus a namespace version.
+Any customer write can move a row in or out of an arbitrary filter, so
+``invalidate_counts`` bumps the version, which retires every cached count at
+once without having to enumerate keys.
+
+That only holds if every worker shares the cache: with a process-local
+backend one worker's invalidation would leave the others serving stale
+counts, so caching is off there unless explicitly allowed.
+"""
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+COUNT_VERSION_KEY = "customer_app:count:version"
+COUNT_KEY_PREFIX = "customer_app:count"
+
+logger = logging.getLogger(__name__)
+
+_warned_local = False
+
+
+def process_local_cache():
+    return isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+
+
+def count_cache_ttl():
+    """
+    ``CUSTOMER_APP_COUNT_CACHE_TTL``, or 0 (no caching) when the default cache
+    is process-local and ``CUSTOMER_APP_COUNT_CACHE_ALLOW_LOCAL`` isn't set.
+    """
+    global _warned_local
+    ttl = getattr(settings, "CUSTOMER_APP_COUNT_CACHE_TTL", 60)
+    if (
+        ttl
+        and process_local_cache()
+        and not getattr(settings, "CUSTOMER_APP_COUNT_CACHE_ALLOW_LOCAL", False)
+    ):
+        if not _warned_local:
+            _warned_local = True
+            logger.warning(
+                "Count cache disabled: the default cache is process-local, set "
+                "CACHE_URL to a shared backend or CUSTOMER_APP_COUNT_CACHE_ALLOW_LOCAL"
+            )
+        return 0
+    return ttl
+
+
+def _new_version():
+    # Time based, so a version key that was evicted never comes back with a
+    # value old entries were written under.
+    return int(time.time() * 1000)
+
+
+def _count_version():
+    version = cache.get(COUNT_VERSION_KEY)
+    if version is None:
+        cache.add(COUNT_VERSION_KEY, _new_version(), None)
+        version = cache.get(COUNT_VERSION_KEY)
+    return version
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items() if v not in (None, "")}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def count_cache_key(**query):
+    canonical = json.dumps(_normalize(query), sort_keys=True, default=str)
+    digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    return f"{COUNT_KEY_PREFIX}:{_count_version()}:{digest}"
+
+
+def cached_count(source, object_set, **query):
+    """
+    ``source.count(object_set)``, served from the cache when the same query
+    was counted within ``CUSTOMER_APP_COUNT_CACHE_TTL`` seconds.
+    """
+    ttl = count_cache_ttl()
+    if not ttl:
+        return source.count(object_set)
+
+    key = count_cache_key(backend=source.__name__, **query)
+    count = cache.get(key)
+    if count is None:
+        count = source.count(object_set)
+        cache.set(key, count, ttl)
+    return count
+
+
+def invalidate_counts():
+    try:
+        cache.incr(COUNT_VERSION_KEY)
+    except ValueError:
+        cache.set(COUNT_VERSION_KEY, _new_version(), None)
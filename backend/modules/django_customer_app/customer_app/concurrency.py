@@ -0,0 +1,196 @@
+"""
+Run independent ontology calls (e.g. a count and a page fetch) side by side,
+and run whole sync views and streamed responses off the event loop when served
+over ASGI.
+
+The calling thread always runs one of the calls itself and only hands the
+rest to a process-wide pool. When the pool has no idle thread the remaining
+calls run inline too, so a busy process degrades to sequential calls instead
+of queueing one request's fetches behind another's.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from customer_app.helpers import perf_diff_time
+
+
+def query_workers():
+    """
+    Size of the shared query pool. By default one thread for every request
+    the process is expected to serve at once (``CUSTOMER_APP_QUERY_CONCURRENCY``)
+    times the extra calls each request hands off (the views make two calls,
+    the caller runs one of them).
+    """
+    workers = getattr(settings, "CUSTOMER_APP_QUERY_WORKERS", None)
+    if workers:
+        return workers
+    return getattr(settings, "CUSTOMER_APP_QUERY_CONCURRENCY", 16) * (
+        getattr(settings, "CUSTOMER_APP_QUERY_FAN_OUT", 2) - 1
+    )
+
+
+_query_workers = query_workers()
+_executor = ThreadPoolExecutor(
+    max_workers=_query_workers, thread_name_prefix="customer-query"
+)
+# One slot per pool thread, taken without blocking: a call only goes to the
+# pool when a thread is free to start it right away.
+_slots = threading.BoundedSemaphore(_query_workers)
+
+
+def _timed(fn):
+    start_time = time.time()
+    result = fn()
+    return result, start_time, time.time()
+
+
+def _run_in_slot(fn):
+    try:
+        return _timed(fn)
+    finally:
+        _slots.release()
+
+
+def run_concurrently(calls, concurrent=True):
+    """
+    Run ``calls`` (name -> zero-argument callable) and return
+    ``(results, performance)``, both keyed by name. ``performance`` also has
+    ``"wall"``, which is roughly the slowest call when run concurrently and
+    the sum when not. Exceptions from any call are re-raised.
+    """
+    start_time = time.time()
+    names = list(calls)
+    futures, inline = {}, names[:1]
+    for name in names[1:]:
+        if concurrent and _slots.acquire(blocking=False):
+            # Each call gets a copy of the caller's context (request scope etc.).
+            futures[name] = _executor.submit(
+                contextvars.copy_context().run, _run_in_slot, calls[name]
+            )
+        else:
+            inline.append(name)
+
+    timed = {}
+    try:
+        for name in inline:
+            timed[name] = _timed(calls[name])
+    finally:
+        # Wait for the pool calls even if an inline one failed.
+        for name, future in futures.items():
+            if future.exception() is None:
+                timed[name] = future.result()
+    for future in futures.values():
+        if future.exception() is not None:
+            raise future.exception()
+
+    results = {name: timed[name][0] for name in names}
+    performance = {
+        name: perf_diff_time(timed[name][1], timed[name][2]) for name in names
+    }
+    performance["wall"] = perf_diff_time(start_time, time.time())
+    return results, performance
+
+
+_view_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "CUSTOMER_APP_ASYNC_VIEW_WORKERS", 64),
+    thread_name_prefix="customer-view",
+)
+
+
+def _run_view(view, request, *args, **kwargs):
+    # Worker threads keep their own DB connection; recycle it per request the
+    # way request_started/request_finished do for sync views.
+    close_old_connections()
+    try:
+        return view(request, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def offload_view(view):
+    """
+    Async view running the sync ``view`` on a worker thread, so the event loop
+    keeps serving other requests while this one waits on Palantir. Attributes
+    DRF and the router read from the view (``cls``, ``actions``...) are kept.
+    """
+
+    async def async_view(request, *args, **kwargs):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            _view_executor,
+            functools.partial(context.run, _run_view, view, request, *args, **kwargs),
+        )
+
+    return functools.wraps(view)(async_view)
+
+
+_DONE = object()
+
+
+def aiter_in_thread(iterable):
+    """
+    Async generator yielding the items of ``iterable``, which is iterated on a
+    thread of its own. Under ASGI streamed responses are sent from the event
+    loop, where the ORM refuses to run and any blocking read would stall every
+    other request. The thread keeps up to ``CUSTOMER_APP_STREAM_PREFETCH``
+    items ready and hands them over with ``call_soon_threadsafe``, so the loop
+    never waits on it. One thread per stream keeps a replica cursor on one
+    database connection.
+    """
+    context = contextvars.copy_context()
+    prefetch = getattr(settings, "CUSTOMER_APP_STREAM_PREFETCH", 64)
+
+    async def consume():
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        room = threading.Semaphore(prefetch)
+        stopped = threading.Event()
+
+        def put(entry):
+            # Give up once the consumer is gone rather than block forever.
+            while not stopped.is_set():
+                if room.acquire(timeout=0.5):
+                    try:
+                        loop.call_soon_threadsafe(items.put_nowait, entry)
+                    except RuntimeError:
+                        # The event loop is closed.
+                        return False
+                    return True
+            return False
+
+        def produce():
+            close_old_connections()
+            try:
+                for item in iterable:
+                    if not put((item, None)):
+                        return
+                put((_DONE, None))
+            except Exception as e:
+                put((_DONE, e))
+            finally:
+                close_old_connections()
+
+        threading.Thread(
+            target=context.run, args=(produce,), name="customer-stream", daemon=True
+        ).start()
+        try:
+            while True:
+                item, error = await items.get()
+                room.release()
+                if error is not None:
+                    raise error
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            # The client went away or the response was closed early.
+            stopped.set()
+
+    return consume()
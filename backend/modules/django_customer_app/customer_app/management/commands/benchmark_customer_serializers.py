@@ -0,0 +1,113 @@
+import json
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customer_app.serializer import (
+    CustomerListSerializer,
+    ParentCustomerListSerializer,
+    compiled_customer_list,
+    compiled_parent_customer_list,
+)
+
+
+def sample_rows(count):
+    """
+    Synthetic ``_asdict()`` payloads shaped like list-endpoint rows.
+    """
+    rows = []
+    for i in range(count):
+        rows.append(
+            {
+                "customerName": f"Customer {i}",
+                "customerAccountCode": f"C{i:06d}",
+                "industry": "Mining" if i % 2 else "Construction",
+                "parent": "" if i % 3 else f"C{i // 3:06d}",
+                "distributor": "Distributor",
+                "dbCode": f"D{i % 20:03d}",
+                "status": i % 5 != 0,
+                "locationCount": i % 7,
+                "userCount": i % 11,
+                "machineCount": i % 13,
+                "displayName": f"Customer {i}",
+                "billingAddress1": f"{i} Main St",
+                "billingAddress2": "" if i % 2 else "Suite 100",
+                "billingCity": "Milwaukee",
+                "billingState": "WI",
+                "billingCountry": "US",
+                "billingZip": "53202",
+                "shippingAddress1": f"{i} Harbor Dr",
+                "shippingAddress2": None,
+                "shippingCity": "Milwaukee",
+                "shippingState": "WI",
+                "shippingCountry": "US",
+                "shippingZip": "53202",
+                "perm_deactivate": True,
+                "perm_edit": True,
+                "perm_delete": True,
+                "perm_activate": True,
+            }
+        )
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Compare DRF list serializers with their compiled fast path."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-size",
+            dest="page_sizes",
+            type=int,
+            action="append",
+            help="Rows per serialized page (repeatable, default 20, 100 and 500).",
+        )
+        parser.add_argument(
+            "--repeat",
+            dest="repeat",
+            type=int,
+            default=20,
+            help="Serializations per measurement.",
+        )
+
+    def handle(self, *args, **options):
+        page_sizes = options["page_sizes"] or [20, 100, 500]
+        repeat = options["repeat"]
+        pairs = [
+            ("CustomerListSerializer", CustomerListSerializer, compiled_customer_list),
+            (
+                "ParentCustomerListSerializer",
+                ParentCustomerListSerializer,
+                compiled_parent_customer_list,
+            ),
+        ]
+
+        results = []
+        for page_size in page_sizes:
+            rows = sample_rows(page_size)
+            for name, drf_class, compiled in pairs:
+                drf_data = json.dumps(drf_class(rows, many=True).data)
+                if drf_data != json.dumps(compiled.many(rows)):
+                    raise CommandError(f"{name}: compiled output differs from DRF")
+
+                drf_time = min(
+                    timeit.repeat(
+                        lambda: drf_class(rows, many=True).data,
+                        number=repeat,
+                        repeat=3,
+                    )
+                )
+                compiled_time = min(
+                    timeit.repeat(lambda: compiled.many(rows), number=repeat, repeat=3)
+                )
+                results.append(
+                    {
+                        "serializer": name,
+                        "page_size": page_size,
+                        "drf_ms": round(drf_time / repeat * 1000, 3),
+                        "compiled_ms": round(compiled_time / repeat * 1000, 3),
+                        "speedup": round(drf_time / compiled_time, 2),
+                    }
+                )
+
+        self.stdout.write(json.dumps(results, indent=2))
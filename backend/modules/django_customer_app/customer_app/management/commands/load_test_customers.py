@@ -0,0 +1,104 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def fetch(url, headers, timeout):
+    request = urllib.request.Request(url, headers=headers)
+    start_time = time.time()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, OSError) as e:
+        status = type(e).__name__
+    return status, time.time() - start_time
+
+
+def percentile(latencies, fraction):
+    return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent GET requests at a customer endpoint and report "
+        "throughput and latency, e.g. to compare a WSGI and an ASGI server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "url",
+            help="Endpoint to load, e.g. http://localhost:8000/modules/customer-app/customer/",
+        )
+        parser.add_argument(
+            "--requests", dest="requests", type=int, default=200, help="Total requests."
+        )
+        parser.add_argument(
+            "--concurrency",
+            dest="concurrency",
+            type=int,
+            default=20,
+            help="Requests in flight at once.",
+        )
+        parser.add_argument(
+            "--header",
+            dest="headers",
+            action="append",
+            default=[],
+            help='Request header as "Name: value" (repeatable), e.g. the bearer token.',
+        )
+        parser.add_argument(
+            "--timeout", dest="timeout", type=float, default=60, help="Seconds per request."
+        )
+
+    def handle(self, *args, **options):
+        headers = {}
+        for header in options["headers"]:
+            name, sep, value = header.partition(":")
+            if not sep:
+                raise CommandError(f'Invalid header "{header}", expected "Name: value"')
+            headers[name.strip()] = value.strip()
+        for option in ("requests", "concurrency"):
+            if options[option] < 1:
+                raise CommandError(f"--{option} must be at least 1")
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            results = list(
+                pool.map(
+                    lambda _: fetch(options["url"], headers, options["timeout"]),
+                    range(options["requests"]),
+                )
+            )
+        wall = time.time() - start_time
+
+        statuses = {}
+        for status, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        latencies = sorted(latency for _, latency in results)
+        self.stdout.write(
+            json.dumps(
+                {
+                    "url": options["url"],
+                    "requests": len(results),
+                    "concurrency": options["concurrency"],
+                    "statuses": statuses,
+                    "wall_s": round(wall, 3),
+                    "requests_per_s": round(len(results) / wall, 2),
+                    "latency_ms": {
+                        "mean": round(statistics.mean(latencies) * 1000, 1),
+                        "p50": round(percentile(latencies, 0.5) * 1000, 1),
+                        "p95": round(percentile(latencies, 0.95) * 1000, 1),
+                        "max": round(latencies[-1] * 1000, 1),
+                    },
+                },
+                indent=2,
+            )
+        )
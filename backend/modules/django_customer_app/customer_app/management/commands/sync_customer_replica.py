@@ -0,0 +1,44 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from modules.django_customer_app.customer_app.replica.sync import (
+    sync_customer_replica,
+)
+
+
+class Command(BaseCommand):
+    help = "Sync MyKomatsuCustomerOrganization from Palantir into the local replica."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            default=False,
+            help="Ignore the stored cursor and rescan every customer organization.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            dest="batch_size",
+            type=int,
+            default=500,
+            help="Number of rows written per transaction.",
+        )
+        parser.add_argument(
+            "--interval",
+            dest="interval",
+            type=int,
+            default=0,
+            help="Keep running and sync every N seconds (0 runs once).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            stats = sync_customer_replica(
+                full=options["full"], batch_size=options["batch_size"]
+            )
+            self.stdout.write(json.dumps(stats))
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,68 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="CustomerOrganizationReplica",
+            fields=[
+                (
+                    "customer_account_code",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                (
+                    "customer_name",
+                    models.CharField(db_index=True, max_length=255, null=True),
+                ),
+                ("display_name", models.CharField(max_length=255, null=True)),
+                (
+                    "industry",
+                    models.CharField(db_index=True, max_length=255, null=True),
+                ),
+                ("parent", models.CharField(db_index=True, max_length=255, null=True)),
+                (
+                    "distributor",
+                    models.CharField(db_index=True, max_length=255, null=True),
+                ),
+                ("db_code", models.CharField(db_index=True, max_length=255, null=True)),
+                (
+                    "primary_branch",
+                    models.CharField(db_index=True, max_length=255, null=True),
+                ),
+                ("status", models.BooleanField(null=True)),
+                ("location_count", models.IntegerField(null=True)),
+                ("user_count", models.IntegerField(null=True)),
+                ("machine_count", models.IntegerField(null=True)),
+                (
+                    "soft_delete_flag",
+                    models.CharField(db_index=True, max_length=255, null=True),
+                ),
+                ("raw", models.JSONField(default=dict)),
+                ("row_hash", models.CharField(max_length=64)),
+                ("synced_at", models.DateTimeField(auto_now=True)),
+                (
+                    "deleted_at",
+                    models.DateTimeField(blank=True, db_index=True, null=True),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CustomerReplicaSyncState",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("cursor", models.JSONField(blank=True, null=True)),
+                ("last_run_at", models.DateTimeField(blank=True, null=True)),
+                ("last_full_sync_at", models.DateTimeField(blank=True, null=True)),
+                ("rows_seen", models.IntegerField(default=0)),
+                ("rows_changed", models.IntegerField(default=0)),
+            ],
+        ),
+    ]
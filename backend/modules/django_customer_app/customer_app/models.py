@@ -1,7 +1,22 @@
+import ast
+import operator
+from functools import reduce
+
 from modules.django_komatsu_idm.komatsu_idm.main import sdk_client as client
+from komatsu_idm.request_scope import memoize, prime
 from dev_mykomatsu_sdk.ontology.objects import MyKomatsuCustomerOrganization
 from django.conf import settings
 
+from customer_app.pagination import paginate
+
+# Django models live in the ``replica`` package and are always imported by
+# their full dotted path so they register exactly once, no matter which name
+# this module was imported under.
+from modules.django_customer_app.customer_app.replica.models import (  # noqa
+    CustomerOrganizationReplica,
+    CustomerReplicaSyncState,
+)
+
 
 class FilterTypes:
     CONTAINS = "contains"
@@ -13,6 +28,11 @@ class FilterTypes:
     EQUALS = "equals"
 
 
+class FilterModes:
+    STRICT = "strict"
+    FALLBACK = "fallback"
+
+
 class InvalidSortByAttribute(Exception):
     """
     Custom exception class for invalid sort_by attribute.
@@ -23,7 +43,29 @@ class InvalidSortByAttribute(Exception):
         super().__init__(self.message)
 
 
+class SinceNotSupported(Exception):
+    """
+    Custom exception class for ``since`` queries without a change timestamp.
+    """
+
+    def __init__(self):
+        self.message = (
+            "since requires CUSTOMER_APP_MODIFIED_PROPERTY or the local replica"
+        )
+        super().__init__(self.message)
+
+
+def modified_property():
+    """
+    Ontology property that increases on every change to a customer
+    organization (e.g. a last-modified timestamp), if one is configured.
+    """
+    return getattr(settings, "CUSTOMER_APP_MODIFIED_PROPERTY", None)
+
+
 class CustomerOrganizationModel(MyKomatsuCustomerOrganization):
+    # Queries are remote round trips, worth overlapping (see run_concurrently).
+    REMOTE = True
     FILTER_KEYS = [
         "customer_name",
         "customer_account_code",
@@ -36,16 +78,22 @@ class CustomerOrganizationModel(MyKomatsuCustomerOrganization):
         "machine_count",
         "status",
     ]
+    SEARCH_FIELDS = [
+        "customer_name",
+        "customer_account_code",
+    ]
 
     @classmethod
     def objects(cls):
         try:
-            sdk_client = client()
-            return sdk_client.ontology.objects.MyKomatsuCustomerOrganization.where(
-                ~MyKomatsuCustomerOrganization.soft_delete_flag.__eq__(
-                    settings.DELETE_FLAG
-                )
-                # & MyKomatsuCustomerOrganization.industry.contains_any_term(['Mining'])
+            return memoize(
+                "customer_objects",
+                lambda: client().ontology.objects.MyKomatsuCustomerOrganization.where(
+                    ~MyKomatsuCustomerOrganization.soft_delete_flag.__eq__(
+                        settings.DELETE_FLAG
+                    )
+                    # & MyKomatsuCustomerOrganization.industry.contains_any_term(['Mining'])
+                ),
             )
         except Exception as e:
             # Handle and log the exception appropriately
@@ -54,23 +102,46 @@ class CustomerOrganizationModel(MyKomatsuCustomerOrganization):
     @classmethod
     def deleted_objects(cls):
         try:
-            sdk_client = client()
-            return sdk_client.ontology.objects.MyKomatsuCustomerOrganization.where(
-                MyKomatsuCustomerOrganization.soft_delete_flag.__eq__(
-                    settings.DELETE_FLAG
-                )
+            return memoize(
+                "deleted_customer_objects",
+                lambda: client().ontology.objects.MyKomatsuCustomerOrganization.where(
+                    MyKomatsuCustomerOrganization.soft_delete_flag.__eq__(
+                        settings.DELETE_FLAG
+                    )
+                ),
             )
         except Exception as e:
             # Handle and log the exception appropriately
             raise e
 
+    @classmethod
+    def deleted_since(cls, since):
+        """
+        Soft-deleted customers changed after ``since``. Palantir keeps no
+        deletion time, so this relies on the configured modified property.
+        """
+        prop = modified_property()
+        if not prop:
+            raise SinceNotSupported
+        return cls.deleted_objects().where(
+            getattr(cls, prop).__gt__(since.isoformat())
+        )
+
+    @staticmethod
+    def scope_key(pk):
+        """
+        Key of customer ``pk`` in the request-scoped identity map.
+        """
+        return ("MyKomatsuCustomerOrganization", pk)
+
     @classmethod
     def get_object(cls, pk):
         try:
-            return (
-                cls.objects()
+            return memoize(
+                cls.scope_key(pk),
+                lambda: cls.objects()
                 .where(MyKomatsuCustomerOrganization.customer_account_code.__eq__(pk))
-                .take(1)[0]
+                .take(1)[0],
             )
         except IndexError:
             # Handle if the object with the specified primary key is not found
@@ -79,11 +150,166 @@ class CustomerOrganizationModel(MyKomatsuCustomerOrganization):
             # Handle and log the exception appropriately
             raise e
 
+    @classmethod
+    def get_objects(cls, pks, chunk_size=100):
+        """
+        Fetch many customers by primary key with one query per ``chunk_size``
+        keys. Returns a dict keyed by customer_account_code; keys that don't
+        exist are simply absent.
+        """
+        found = {}
+        pks = list(dict.fromkeys(pks))
+        for i in range(0, len(pks), chunk_size):
+            where = reduce(
+                operator.or_,
+                [
+                    MyKomatsuCustomerOrganization.customer_account_code.__eq__(pk)
+                    for pk in pks[i : i + chunk_size]
+                ],
+            )
+            for obj in cls.objects().where(where).iterate():
+                found[obj.customer_account_code] = obj
+                prime(cls.scope_key(obj.customer_account_code), obj)
+        return found
+
+    @classmethod
+    def all_objects(cls):
+        """
+        Every customer organization, including soft-deleted ones.
+        """
+        return client().ontology.objects.MyKomatsuCustomerOrganization
+
+    @classmethod
+    def by_parent(cls, parent):
+        return cls.objects().where(MyKomatsuCustomerOrganization.parent.__eq__(parent))
+
+    @classmethod
+    def by_distributor(cls, distributor_id):
+        return cls.objects().where(cls.db_code.__eq__(distributor_id))
+
+    @classmethod
+    def orphans(cls):
+        return cls.objects().where(
+            MyKomatsuCustomerOrganization.parent.__eq__("")
+            | MyKomatsuCustomerOrganization.parent.is_null()
+        )
+
+    @classmethod
+    def count(cls, object_set):
+        return object_set.count().compute()
+
+    @classmethod
+    def iterate(cls, object_set):
+        return object_set.iterate()
+
+    @classmethod
+    def paginate(cls, object_set, page_size, **kwargs):
+        return paginate(cls, object_set, page_size, **kwargs)
+
+    @classmethod
+    def parse_sort_by(cls, sort_by):
+        """
+        Split a ``sort_by`` query value ("field" or "-field") into the
+        attribute name and the sort direction, validating the attribute.
+        """
+        is_asc, sort_by = (False, sort_by[1:]) if sort_by[0] == "-" else (True, sort_by)
+        valid_attributes = [
+            attr
+            for attr in dir(cls)
+            if not callable(getattr(cls, attr)) and not attr.startswith("__")
+        ]
+        if sort_by not in valid_attributes:
+            raise InvalidSortByAttribute
+        return sort_by, is_asc
+
+    @classmethod
+    def filter_clause(cls, key, filter_type, value):
+        """
+        Build the ontology clause for one ``filter_and_sort`` filter, or
+        ``None`` for filter types Palantir can't express yet.
+        """
+        field = getattr(cls, key)
+        if filter_type == FilterTypes.CONTAINS:
+            return field.contains_any_terms([value])
+        elif filter_type == FilterTypes.STARTS_WITH:
+            return field.starts_with([value])
+        # TODO: implement once provided by Palantir
+        # elif filter_type == FilterTypes.ENDS_WITH:
+        #     return field.ends_with([value])
+        elif filter_type == FilterTypes.IS_EMPTY:
+            return field.is_null()
+        elif filter_type == FilterTypes.IS_NOT_EMPTY:
+            return ~field.is_null()
+        elif filter_type == FilterTypes.IS_ANY_OF:
+            return field.contains_any_term(ast.literal_eval(value))
+        elif filter_type == FilterTypes.EQUALS:
+            return field.__eq__(value)
+        return None
+
+    @classmethod
+    def compile_query(cls, filters, search_query=None):
+        """
+        Compile filters (AND-ed) and the search query (OR-ed across
+        SEARCH_FIELDS) into a single where-clause, or ``None`` if there is
+        nothing to filter on.
+        """
+        clauses = []
+        for k, v in filters.items():
+            filter_type, value = v
+            clause = cls.filter_clause(k, filter_type, value)
+            if clause is not None:
+                clauses.append(clause)
+
+        if search_query:
+            search_clauses = [
+                getattr(cls, field).starts_with([search_query])
+                for field in cls.SEARCH_FIELDS
+            ]
+            clauses.append(reduce(operator.or_, search_clauses))
+
+        return reduce(operator.and_, clauses) if clauses else None
+
     @classmethod
     def filter_and_sort(cls, **kwargs):
         """
         Filters and sorts MyKomatsuCustomerOrganization objects based on provided criteria.
+
+        In ``FilterModes.STRICT`` (the default) the whole query is compiled
+        into one ObjectSet and no count is run here. ``FilterModes.FALLBACK``
+        keeps the original behaviour of probing each filter with a count and
+        ignoring search fields that match nothing.
         """
+        try:
+            mode = kwargs.pop("mode", None) or getattr(
+                settings, "CUSTOMER_APP_FILTER_MODE", FilterModes.STRICT
+            )
+            if mode == FilterModes.FALLBACK:
+                return cls._filter_and_sort_fallback(**kwargs)
+
+            sort_by = kwargs.pop("sort_by", None)
+            search_query = kwargs.pop("search", None)
+
+            data = cls.objects()
+            where = cls.compile_query(kwargs, search_query)
+            if where is not None:
+                data = data.where(where)
+
+            if sort_by:
+                sort_by, is_asc = cls.parse_sort_by(sort_by)
+                data = data.order_by(
+                    getattr(cls, sort_by).asc()
+                    if is_asc
+                    else getattr(cls, sort_by).desc()
+                )
+
+            return data
+
+        except Exception as e:
+            # Handle exceptions
+            raise e
+
+    @classmethod
+    def _filter_and_sort_fallback(cls, **kwargs):
         try:
             sort_by = kwargs.pop("sort_by", None)
             search_query = kwargs.pop("search", None)
@@ -92,27 +318,10 @@ class CustomerOrganizationModel(MyKomatsuCustomerOrganization):
 
             for k, v in kwargs.items():
                 filter_type, value = v
-                if filter_type == FilterTypes.CONTAINS:
-                    filtered_data = data.where(
-                        MyKomatsuCustomerOrganization.customer_name.contains_any_terms(
-                            [value]
-                        )
-                    )
-                elif filter_type == FilterTypes.STARTS_WITH:
-                    filtered_data = data.where(getattr(cls, k).starts_with([value]))
-                # TODO: implement once provided by Palantir
-                # elif filter_type == FilterTypes.ENDS_WITH:
-                #     filtered_data = data.where(getattr(cls, k).__eq__(v))
-                elif filter_type == FilterTypes.IS_EMPTY:
-                    filtered_data = data.where(getattr(cls, k).is_null())
-                elif filter_type == FilterTypes.IS_NOT_EMPTY:
-                    filtered_data = data.where(~getattr(cls, k).is_null())
-                elif filter_type == FilterTypes.IS_ANY_OF:
-                    filtered_data = data.where(
-                        getattr(cls, k).contains_any_term(eval(value))
-                    )
-                elif filter_type == FilterTypes.EQUALS:
-                    filtered_data = data.where(getattr(cls, k).__eq__(value))
+                clause = cls.filter_clause(k, filter_type, value)
+                if clause is None:
+                    continue
+                filtered_data = data.where(clause)
 
                 if filtered_data.count().compute() > 0:
                     data = filtered_data
@@ -132,23 +341,12 @@ class CustomerOrganizationModel(MyKomatsuCustomerOrganization):
 
             skip_sort_by = True if filtered_res.count().compute() == 0 else False
             if sort_by and not skip_sort_by:
-                is_asc, sort_by = (
-                    (False, sort_by[1:]) if sort_by[0] == "-" else (True, sort_by)
+                sort_by, is_asc = cls.parse_sort_by(sort_by)
+                filtered_res = filtered_res.order_by(
+                    getattr(cls, sort_by).asc()
+                    if is_asc
+                    else getattr(cls, sort_by).desc()
                 )
-                valid_attributes = [
-                    attr
-                    for attr in dir(cls)
-                    if not callable(getattr(cls, attr)) and not attr.startswith("__")
-                ]
-
-                if sort_by in valid_attributes:
-                    filtered_res = filtered_res.order_by(
-                        getattr(cls, sort_by).asc()
-                        if is_asc
-                        else getattr(cls, sort_by).desc()
-                    )
-                else:
-                    raise InvalidSortByAttribute
 
             return filtered_res
 
@@ -0,0 +1,78 @@
+from django.db import models
+
+
+# Palantir attribute name -> key in the ``_asdict()`` payload, for every
+# property the replica keeps in its own indexed column.
+REPLICA_COLUMNS = {
+    "customer_account_code": "customerAccountCode",
+    "customer_name": "customerName",
+    "display_name": "displayName",
+    "industry": "industry",
+    "parent": "parent",
+    "distributor": "distributor",
+    "db_code": "dbCode",
+    "primary_branch": "primaryBranch",
+    "status": "status",
+    "location_count": "locationCount",
+    "user_count": "userCount",
+    "machine_count": "machineCount",
+    "soft_delete_flag": "softDeleteFlag",
+}
+
+
+class CustomerOrganizationReplica(models.Model):
+    """
+    Local read replica of MyKomatsuCustomerOrganization.
+
+    Filterable/sortable properties get their own indexed column; the full
+    ``_asdict()`` payload is kept in ``raw`` so serializers see exactly what
+    the ontology returned.
+    """
+
+    customer_account_code = models.CharField(max_length=255, primary_key=True)
+    customer_name = models.CharField(max_length=255, null=True, db_index=True)
+    display_name = models.CharField(max_length=255, null=True)
+    industry = models.CharField(max_length=255, null=True, db_index=True)
+    parent = models.CharField(max_length=255, null=True, db_index=True)
+    distributor = models.CharField(max_length=255, null=True, db_index=True)
+    db_code = models.CharField(max_length=255, null=True, db_index=True)
+    primary_branch = models.CharField(max_length=255, null=True, db_index=True)
+    status = models.BooleanField(null=True)
+    location_count = models.IntegerField(null=True)
+    user_count = models.IntegerField(null=True)
+    machine_count = models.IntegerField(null=True)
+    soft_delete_flag = models.CharField(max_length=255, null=True, db_index=True)
+    raw = models.JSONField(default=dict)
+    row_hash = models.CharField(max_length=64)
+    synced_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        app_label = "customer_app"
+
+    def __str__(self):
+        return self.customer_account_code
+
+    def _asdict(self):
+        # Same shape as the SDK objects, so views and serializers don't need
+        # to know which backend the row came from.
+        return dict(self.raw)
+
+
+class CustomerReplicaSyncState(models.Model):
+    """
+    Bookkeeping for the replica sync job (one row per replicated object type).
+    """
+
+    name = models.CharField(max_length=100, primary_key=True)
+    cursor = models.JSONField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    rows_seen = models.IntegerField(default=0)
+    rows_changed = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = "customer_app"
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,187 @@
+"""
+Read path over the local customer replica.
+
+``CustomerReplicaSource`` exposes the same query helpers as
+``CustomerOrganizationModel`` (objects, get_object, filter_and_sort, count,
+paginate, ...) but answers them from ``CustomerOrganizationReplica``, so the
+views can switch backends with ``customer_source()``.
+"""
+import ast
+
+from django.conf import settings
+from django.db.models import Q
+
+from customer_app.models import (
+    CustomerOrganizationModel,
+    FilterModes,
+    FilterTypes,
+    InvalidSortByAttribute,
+)
+from customer_app.pagination import paginate_queryset
+from modules.django_customer_app.customer_app.replica.models import (
+    REPLICA_COLUMNS,
+    CustomerOrganizationReplica,
+)
+
+
+def use_replica():
+    return getattr(settings, "CUSTOMER_APP_READ_FROM_REPLICA", False)
+
+
+def customer_source():
+    """
+    Backend the read endpoints should query: the local replica when
+    ``CUSTOMER_APP_READ_FROM_REPLICA`` is enabled, Palantir otherwise.
+    """
+    return CustomerReplicaSource if use_replica() else CustomerOrganizationModel
+
+
+class CustomerReplicaSource:
+    # Local indexed queries; not worth a thread hop.
+    REMOTE = False
+    FILTER_KEYS = CustomerOrganizationModel.FILTER_KEYS
+
+    @classmethod
+    def all_objects(cls):
+        return CustomerOrganizationReplica.objects.all()
+
+    @classmethod
+    def objects(cls):
+        return CustomerOrganizationReplica.objects.exclude(
+            soft_delete_flag=settings.DELETE_FLAG
+        )
+
+    @classmethod
+    def deleted_objects(cls):
+        return CustomerOrganizationReplica.objects.filter(
+            soft_delete_flag=settings.DELETE_FLAG
+        )
+
+    @classmethod
+    def deleted_since(cls, since):
+        # deleted_at is recorded by the sync job when it sees the flag flip.
+        return cls.deleted_objects().filter(deleted_at__gt=since)
+
+    @classmethod
+    def get_object(cls, pk):
+        try:
+            return cls.objects().get(customer_account_code=pk)
+        except CustomerOrganizationReplica.DoesNotExist:
+            raise ValueError(f"No object found with primary key: {pk}")
+
+    @classmethod
+    def by_parent(cls, parent):
+        return cls.objects().filter(parent=parent)
+
+    @classmethod
+    def by_distributor(cls, distributor_id):
+        return cls.objects().filter(db_code=distributor_id)
+
+    @classmethod
+    def orphans(cls):
+        return cls.objects().filter(Q(parent="") | Q(parent__isnull=True))
+
+    @classmethod
+    def count(cls, queryset):
+        return queryset.count()
+
+    @classmethod
+    def iterate(cls, queryset):
+        return queryset.iterator()
+
+    @classmethod
+    def paginate(cls, queryset, page_size, **kwargs):
+        return paginate_queryset(cls, queryset, page_size, **kwargs)
+
+    @classmethod
+    def parse_sort_by(cls, sort_by):
+        is_asc, sort_by = (False, sort_by[1:]) if sort_by[0] == "-" else (True, sort_by)
+        if sort_by not in REPLICA_COLUMNS:
+            raise InvalidSortByAttribute
+        return sort_by, is_asc
+
+    @classmethod
+    def filter_q(cls, key, filter_type, value):
+        """
+        Django equivalent of one ``filter_and_sort`` filter clause.
+        """
+        if key not in REPLICA_COLUMNS:
+            return None
+        if filter_type == FilterTypes.CONTAINS:
+            return Q(**{f"{key}__icontains": value})
+        elif filter_type == FilterTypes.STARTS_WITH:
+            return Q(**{f"{key}__istartswith": value})
+        elif filter_type == FilterTypes.IS_EMPTY:
+            return Q(**{f"{key}__isnull": True})
+        elif filter_type == FilterTypes.IS_NOT_EMPTY:
+            return Q(**{f"{key}__isnull": False})
+        elif filter_type == FilterTypes.IS_ANY_OF:
+            return Q(**{f"{key}__in": ast.literal_eval(value)})
+        elif filter_type == FilterTypes.EQUALS:
+            return Q(**{key: value})
+        return None
+
+    @classmethod
+    def compile_query(cls, filters, search_query=None):
+        where = Q()
+        for k, v in filters.items():
+            filter_type, value = v
+            clause = cls.filter_q(k, filter_type, value)
+            if clause is not None:
+                where &= clause
+
+        if search_query:
+            search = Q()
+            for field in CustomerOrganizationModel.SEARCH_FIELDS:
+                if field in REPLICA_COLUMNS:
+                    search |= Q(**{f"{field}__istartswith": search_query})
+            where &= search
+
+        return where
+
+    @classmethod
+    def filter_and_sort(cls, **kwargs):
+        """
+        Mirrors ``CustomerOrganizationModel.filter_and_sort``, including the
+        ``FilterModes.FALLBACK`` behaviour.
+        """
+        mode = kwargs.pop("mode", None) or getattr(
+            settings, "CUSTOMER_APP_FILTER_MODE", FilterModes.STRICT
+        )
+        sort_by = kwargs.pop("sort_by", None)
+        search_query = kwargs.pop("search", None)
+
+        if mode == FilterModes.FALLBACK:
+            data = cls._filter_fallback(kwargs, search_query)
+        else:
+            data = cls.objects().filter(cls.compile_query(kwargs, search_query))
+
+        if sort_by:
+            sort_by, is_asc = cls.parse_sort_by(sort_by)
+            data = data.order_by(sort_by if is_asc else f"-{sort_by}")
+
+        return data
+
+    @classmethod
+    def _filter_fallback(cls, filters, search_query):
+        data = cls.objects()
+        for k, v in filters.items():
+            filter_type, value = v
+            clause = cls.filter_q(k, filter_type, value)
+            if clause is None:
+                continue
+            filtered_data = data.filter(clause)
+            if filtered_data.exists():
+                data = filtered_data
+            else:
+                return filtered_data
+
+        if search_query and data.exists():
+            for field in CustomerOrganizationModel.SEARCH_FIELDS:
+                if field not in REPLICA_COLUMNS:
+                    continue
+                searched = data.filter(**{f"{field}__istartswith": search_query})
+                if searched.exists():
+                    data = searched
+
+        return data
@@ -0,0 +1,168 @@
+"""
+Incremental sync of MyKomatsuCustomerOrganization into the local replica.
+
+If ``CUSTOMER_APP_MODIFIED_PROPERTY`` names a monotonically increasing
+ontology property (e.g. a last-modified timestamp), each run only pulls the
+objects changed at or after the last value seen by the previous run; rows at
+that boundary come back again and are skipped by their unchanged content
+hash. Without it every run is a full scan, but rows are still diffed by
+content hash so only changed rows are written, and rows that disappeared
+upstream are removed.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from customer_app.cache import invalidate_counts
+from customer_app.helpers import perf_diff_time
+from customer_app.models import CustomerOrganizationModel, modified_property
+from customer_app.pagination import decode_sort_value, encode_sort_value
+from modules.django_customer_app.customer_app.replica.models import (
+    REPLICA_COLUMNS,
+    CustomerOrganizationReplica,
+    CustomerReplicaSyncState,
+)
+
+SYNC_NAME = "customer_organization"
+UPDATE_FIELDS = [
+    column for column in REPLICA_COLUMNS if column != "customer_account_code"
+] + ["raw", "row_hash", "deleted_at"]
+
+
+def row_hash(data):
+    canonical = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _is_deleted(data):
+    return data.get(REPLICA_COLUMNS["soft_delete_flag"]) == settings.DELETE_FLAG
+
+
+def _build_row(data, previous=None):
+    row = CustomerOrganizationReplica(
+        **{column: data.get(key) for column, key in REPLICA_COLUMNS.items()},
+        raw=data,
+        row_hash=row_hash(data),
+    )
+    if _is_deleted(data) and previous is not None:
+        # Keep the original deletion time if the row was already deleted;
+        # new deletions are stamped once their batch has committed.
+        row.deleted_at = previous.deleted_at
+    return row
+
+
+def _apply_batch(batch, stats):
+    # An object listed twice in one batch is written once.
+    batch = list(
+        {data[REPLICA_COLUMNS["customer_account_code"]]: data for data in batch}.values()
+    )
+    pks = [data[REPLICA_COLUMNS["customer_account_code"]] for data in batch]
+    existing = CustomerOrganizationReplica.objects.only(
+        "customer_account_code", "row_hash", "deleted_at"
+    ).in_bulk(pks)
+
+    to_create, to_update = [], []
+    for data in batch:
+        previous = existing.get(data[REPLICA_COLUMNS["customer_account_code"]])
+        if previous is not None and previous.row_hash == row_hash(data):
+            continue
+        row = _build_row(data, previous)
+        (to_create if previous is None else to_update).append(row)
+
+    with transaction.atomic():
+        if to_create:
+            CustomerOrganizationReplica.objects.bulk_create(to_create)
+        if to_update:
+            CustomerOrganizationReplica.objects.bulk_update(to_update, UPDATE_FIELDS)
+
+    # Stamped after the commit, not when the rows were built: a reader whose
+    # ``as_of`` falls inside the batch transaction must still find these rows
+    # after that ``as_of`` on its next ``since`` query.
+    newly_deleted = [
+        row.customer_account_code
+        for row in to_create + to_update
+        if _is_deleted(row.raw) and row.deleted_at is None
+    ]
+    if newly_deleted:
+        CustomerOrganizationReplica.objects.filter(
+            customer_account_code__in=newly_deleted, deleted_at__isnull=True
+        ).update(deleted_at=timezone.now())
+
+    stats["rows_created"] += len(to_create)
+    stats["rows_updated"] += len(to_update)
+    return pks
+
+
+def sync_customer_replica(full=False, batch_size=500):
+    """
+    Pull changed customer organizations into the replica and return a dict of
+    run statistics.
+    """
+    start_time = time.time()
+    state, _ = CustomerReplicaSyncState.objects.get_or_create(name=SYNC_NAME)
+    cursor_property = modified_property()
+    incremental = bool(cursor_property and state.cursor and not full)
+
+    # Typed, so timestamps compare as timestamps rather than as strings.
+    cursor = decode_sort_value(state.cursor)
+    object_set = CustomerOrganizationModel.all_objects()
+    if incremental:
+        # Not strictly after: other objects may share the cursor value and
+        # not have been seen yet.
+        object_set = object_set.where(
+            getattr(CustomerOrganizationModel, cursor_property).__ge__(cursor)
+        )
+
+    stats = {
+        "mode": "incremental" if incremental else "full",
+        "rows_seen": 0,
+        "rows_created": 0,
+        "rows_updated": 0,
+        "rows_removed": 0,
+    }
+    seen = set()
+    batch = []
+    for obj in object_set.iterate():
+        batch.append(obj._asdict())
+        if cursor_property:
+            value = getattr(obj, cursor_property, None)
+            if value is not None and (cursor is None or value > cursor):
+                cursor = value
+        if len(batch) >= batch_size:
+            seen.update(_apply_batch(batch, stats))
+            batch = []
+    if batch:
+        seen.update(_apply_batch(batch, stats))
+    stats["rows_seen"] = len(seen)
+
+    if not incremental:
+        # Only a full scan can tell that a row was hard-deleted upstream.
+        stale = set(
+            CustomerOrganizationReplica.objects.values_list(
+                "customer_account_code", flat=True
+            )
+        ).difference(seen)
+        stale = list(stale)
+        for i in range(0, len(stale), batch_size):
+            CustomerOrganizationReplica.objects.filter(
+                customer_account_code__in=stale[i : i + batch_size]
+            ).delete()
+        stats["rows_removed"] = len(stale)
+        state.last_full_sync_at = timezone.now()
+
+    state.cursor = encode_sort_value(cursor)
+    state.last_run_at = timezone.now()
+    state.rows_seen = stats["rows_seen"]
+    state.rows_changed = (
+        stats["rows_created"] + stats["rows_updated"] + stats["rows_removed"]
+    )
+    state.save()
+    if state.rows_changed:
+        invalidate_counts()
+
+    stats["duration"] = perf_diff_time(start_time, time.time())
+    return stats
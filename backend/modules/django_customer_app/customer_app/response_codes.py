@@ -19,6 +19,26 @@ custom_res_codes={
             'success':False,
             'msg':'Email already exist!'
         },
+        'E104':{
+            'code':'E104',
+            'success':False,
+            'msg':'Invalid page token'
+        },
+        'E105':{
+            'code':'E105',
+            'success':False,
+            'msg':'Unsupported export format'
+        },
+        'E106':{
+            'code':'E106',
+            'success':False,
+            'msg':'Invalid since value'
+        },
+        'E107':{
+            'code':'E107',
+            'success':False,
+            'msg':'Some customers could not be mapped'
+        },
         'S100':{
             'code':'S100',
             'success':True,
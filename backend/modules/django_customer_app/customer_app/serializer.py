@@ -1,4 +1,29 @@
 from rest_framework import serializers
+from rest_framework.fields import empty
+
+BILLING_ADDRESS_KEYS = (
+    "billingAddress1",
+    "billingAddress2",
+    "billingCity",
+    "billingState",
+    "billingCountry",
+    "billingZip",
+)
+SHIPPING_ADDRESS_KEYS = (
+    "shippingAddress1",
+    "shippingAddress2",
+    "shippingCity",
+    "shippingState",
+    "shippingCountry",
+    "shippingZip",
+)
+
+
+def format_address(obj, keys):
+    """
+    Join the non-empty address parts of ``obj`` with ", ".
+    """
+    return ", ".join([part for part in map(obj.get, keys) if part])
 
 
 class CustomerSerializer(serializers.Serializer):
@@ -65,35 +90,24 @@ class CustomerListSerializer(serializers.Serializer):
     perm_activate = serializers.BooleanField(default=True)
     billing_address = serializers.SerializerMethodField()
 
+    # Address fields and the payload keys they are built from, shared with
+    # CompiledSerializer.
+    ADDRESS_FIELDS = {
+        "billing_address": BILLING_ADDRESS_KEYS,
+        "shipping_address": SHIPPING_ADDRESS_KEYS,
+    }
+
     def get_billing_address(self, obj):
         """
         Get formatted billing address.
         """
-        address_parts = [
-            obj.get("billingAddress1", ""),
-            obj.get("billingAddress2", ""),
-            obj.get("billingCity", ""),
-            obj.get("billingState", ""),
-            obj.get("billingCountry", ""),
-            obj.get("billingZip", ""),
-        ]
-        result = ", ".join(filter(None, address_parts))
-        return result
+        return format_address(obj, BILLING_ADDRESS_KEYS)
 
     def get_shipping_address(self, obj):
         """
         Get formatted shipping address.
         """
-        address_parts = [
-            obj.get("shippingAddress1", ""),
-            obj.get("shippingAddress2", ""),
-            obj.get("shippingCity", ""),
-            obj.get("shippingState", ""),
-            obj.get("shippingCountry", ""),
-            obj.get("shippingZip", ""),
-        ]
-        result = ", ".join(filter(None, address_parts))
-        return result
+        return format_address(obj, SHIPPING_ADDRESS_KEYS)
 
 
 class ParentCustomerListSerializer(serializers.Serializer):
@@ -109,3 +123,93 @@ class ParentCustomerListSerializer(serializers.Serializer):
     perm_edit = serializers.BooleanField(default=True)
     perm_delete = serializers.BooleanField(default=True)
     perm_activate = serializers.BooleanField(default=True)
+
+
+class CompiledSerializer:
+    """
+    Read-only fast path for flat ``Serializer`` classes over dicts.
+
+    The field list, sources, defaults and converters of ``serializer_class``
+    are resolved once at construction; ``many()`` then produces the same
+    output as ``serializer_class(objs, many=True).data`` with a plain loop
+    instead of DRF's per-field machinery.
+    """
+
+    def __init__(self, serializer_class):
+        serializer = serializer_class()
+        address_fields = getattr(serializer_class, "ADDRESS_FIELDS", {})
+        # Each entry: (output name, source key or None, converter, field).
+        # A None source means the converter builds the value from the whole
+        # object (address and method fields).
+        self._plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if name in address_fields:
+                keys = address_fields[name]
+                self._plan.append(
+                    (name, None, lambda obj, keys=keys: format_address(obj, keys), field)
+                )
+            elif isinstance(field, serializers.SerializerMethodField):
+                self._plan.append(
+                    (name, None, getattr(serializer, field.method_name), field)
+                )
+            else:
+                self._plan.append((name, field.source, self._converter(field), field))
+        self._plan = tuple(self._plan)
+
+    @staticmethod
+    def _converter(field):
+        field_type = type(field)
+        if field_type is serializers.CharField:
+            return str
+        if field_type is serializers.IntegerField:
+            return int
+        if field_type is serializers.BooleanField:
+            true_values, false_values = field.TRUE_VALUES, field.FALSE_VALUES
+            null_values, allow_null = field.NULL_VALUES, field.allow_null
+
+            def to_bool(value):
+                try:
+                    if value in true_values:
+                        return True
+                    if value in false_values:
+                        return False
+                    if value in null_values and allow_null:
+                        return None
+                except TypeError:
+                    pass
+                return bool(value)
+
+            return to_bool
+        return field.to_representation
+
+    def to_representation(self, obj):
+        ret = {}
+        for name, source, convert, field in self._plan:
+            if source is None:
+                ret[name] = convert(obj)
+                continue
+            try:
+                value = obj[source]
+            except KeyError:
+                # Same fallbacks as Field.get_attribute.
+                if field.default is not empty:
+                    value = field.get_default()
+                elif field.allow_null:
+                    value = None
+                elif not field.required:
+                    continue
+                else:
+                    raise
+            ret[name] = None if value is None else convert(value)
+        return ret
+
+    def many(self, objs):
+        to_representation = self.to_representation
+        return [to_representation(obj) for obj in objs]
+
+
+compiled_customer = CompiledSerializer(CustomerSerializer)
+compiled_customer_list = CompiledSerializer(CustomerListSerializer)
+compiled_parent_customer_list = CompiledSerializer(ParentCustomerListSerializer)
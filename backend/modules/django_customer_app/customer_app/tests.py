@@ -1,3 +1,1149 @@
-from django.test import TestCase
+import asyncio
+import csv
+import functools
+import io
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from customer_app import concurrency
+from customer_app.asgi import ASGIHandler
+from customer_app.bulk import bulk_update_parent
+from customer_app.cache import (
+    COUNT_VERSION_KEY,
+    cached_count,
+    count_cache_key,
+    invalidate_counts,
+)
+from customer_app.management.commands.benchmark_customer_serializers import (
+    sample_rows,
+)
+from customer_app.models import CustomerOrganizationModel, FilterModes, FilterTypes
+from customer_app.pagination import (
+    InvalidPageToken,
+    decode_page_token,
+    decode_sort_value,
+    encode_page_token,
+    encode_sort_value,
+    paginate,
+)
+from customer_app.serializer import (
+    CustomerListSerializer,
+    ParentCustomerListSerializer,
+    compiled_customer_list,
+    compiled_parent_customer_list,
+)
+from customer_app.views import CustomerViewset
+from customer_app.writes import edit_payload, write_customer
+from komatsu_idm import request_scope
+from modules.django_customer_app.customer_app.replica.models import (
+    CustomerOrganizationReplica,
+    CustomerReplicaSyncState,
+)
+from modules.django_customer_app.customer_app.replica.source import (
+    CustomerReplicaSource,
+    customer_source,
+)
+from modules.django_customer_app.customer_app.replica.sync import (
+    sync_customer_replica,
+)
+
+
+class FakeClause:
+    """
+    In-memory stand-in for an ObjectSet where clause.
+    """
+
+    def __init__(self, test):
+        self.test = test
+
+    def __and__(self, other):
+        return FakeClause(lambda row: self.test(row) and other.test(row))
+
+    def __or__(self, other):
+        return FakeClause(lambda row: self.test(row) or other.test(row))
+
+    def __invert__(self):
+        return FakeClause(lambda row: not self.test(row))
+
+
+class FakeField:
+    """
+    In-memory stand-in for an SDK object property.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def value(self, row):
+        return getattr(row, self.name)
+
+    def asc(self):
+        return self, True
+
+    def desc(self):
+        return self, False
+
+    def __gt__(self, value):
+        return FakeClause(lambda row: self.value(row) is not None and self.value(row) > value)
+
+    def __lt__(self, value):
+        return FakeClause(lambda row: self.value(row) is not None and self.value(row) < value)
+
+    def __eq__(self, value):
+        return FakeClause(lambda row: self.value(row) == value)
+
+    def is_null(self):
+        return FakeClause(lambda row: self.value(row) is None)
+
+
+class FakeObjectSet:
+    """
+    In-memory ObjectSet with the SDK's ordering (nulls as the largest values)
+    and paging.
+    """
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def order_by(self, *keys):
+        def compare(a, b):
+            for field, is_asc in keys:
+                x, y = field.value(a), field.value(b)
+                if x == y:
+                    continue
+                if x is None or y is None:
+                    order = 1 if x is None else -1
+                else:
+                    order = (x > y) - (x < y)
+                return order if is_asc else -order
+            return 0
+
+        return FakeObjectSet(sorted(self.rows, key=functools.cmp_to_key(compare)))
+
+    def where(self, clause):
+        return FakeObjectSet(row for row in self.rows if clause.test(row))
+
+    def take(self, count):
+        return self.rows[:count]
+
+    def page(self, page_size):
+        for start in range(0, len(self.rows), page_size):
+            yield self.rows[start : start + page_size]
+
+
+class FakeModel:
+    customer_account_code = FakeField("customer_account_code")
+    industry = FakeField("industry")
+    created = FakeField("created")
+
+    @classmethod
+    def parse_sort_by(cls, sort_by):
+        return (sort_by[1:], False) if sort_by[0] == "-" else (sort_by, True)
+
+
+class KeysetPaginationTests(SimpleTestCase):
+    def setUp(self):
+        self.object_set = FakeObjectSet(
+            SimpleNamespace(
+                customer_account_code=f"C{i:02d}",
+                # Ties and nulls in the sort field.
+                industry=None if i % 4 == 0 else ("Mining" if i % 2 else "Forestry"),
+                created=None if i % 5 == 0 else datetime(2024, 1, 1 + i % 3),
+            )
+            for i in range(11)
+        )
+
+    def paginate(self, page_size, **kwargs):
+        return paginate(FakeModel, self.object_set, page_size, **kwargs)
+
+    def walk(self, page_size, sort_by=None):
+        pks, token, pages = [], None, 0
+        while True:
+            page = self.paginate(page_size, page_token=token, sort_by=sort_by)
+            pks.extend(row.customer_account_code for row in page.objects)
+            pages += 1
+            token = page.next_page_token
+            if token is None:
+                return pks, pages
+
+    def by_page_num(self, page_size, sort_by=None):
+        pks, page_num = [], 1
+        while True:
+            page = self.paginate(page_size, page_num=page_num, sort_by=sort_by)
+            if not page.objects:
+                return pks
+            pks.extend(row.customer_account_code for row in page.objects)
+            page_num += 1
+
+    def test_tokens_walk_every_row_once(self):
+        for sort_by in [
+            None,
+            "industry",
+            "-industry",
+            "created",
+            "-created",
+            "-customer_account_code",
+        ]:
+            with self.subTest(sort_by=sort_by):
+                pks, pages = self.walk(3, sort_by)
+                self.assertEqual(len(pks), 11)
+                self.assertEqual(set(pks), {f"C{i:02d}" for i in range(11)})
+                self.assertEqual(pks, self.by_page_num(3, sort_by))
+                self.assertEqual(pages, 4)
+
+    def test_descending_puts_nulls_first(self):
+        pks, _ = self.walk(3, "-industry")
+        self.assertEqual(pks[:3], ["C08", "C04", "C00"])
+
+    def test_sort_values_keep_their_type(self):
+        for value in [
+            datetime(2024, 1, 2, 3, 4, 5),
+            date(2024, 1, 2),
+            Decimal("1.10"),
+            "2024-01-02",
+            3,
+            None,
+        ]:
+            with self.subTest(value=value):
+                token = encode_page_token(
+                    {"v": 1, "q": "", "s": "x", "k": [encode_sort_value(value), "C1"]}
+                )
+                decoded = decode_sort_value(decode_page_token(token)["k"][0])
+                self.assertEqual(decoded, value)
+                self.assertIs(type(decoded), type(value))
+
+    def test_page_num_token_continues_that_page(self):
+        page = self.paginate(4, page_num=2, sort_by="industry")
+        following = self.paginate(
+            4, page_token=page.next_page_token, sort_by="industry"
+        )
+        self.assertEqual(
+            [row.customer_account_code for row in following.objects],
+            self.by_page_num(4, "industry")[8:],
+        )
+
+    def test_token_rejected_for_another_query(self):
+        page = self.paginate(3, sort_by="industry", fingerprint="a")
+        for kwargs in [
+            {"sort_by": "industry", "fingerprint": "b"},
+            {"sort_by": "-industry", "fingerprint": "a"},
+        ]:
+            with self.assertRaises(InvalidPageToken):
+                self.paginate(3, page_token=page.next_page_token, **kwargs)
+
+    def test_malformed_tokens(self):
+        for token in ["not-base64!", encode_page_token({"v": 99}), encode_page_token([1])]:
+            with self.assertRaises(InvalidPageToken):
+                decode_page_token(token)
+        for value in [{"t": "datetime", "v": "yesterday"}, {"t": "set", "v": []}]:
+            with self.assertRaises(InvalidPageToken):
+                decode_sort_value(value)
+
+
+class FakeObject:
+    """
+    Stand-in for an SDK customer organization.
+    """
+
+    def __init__(self, **data):
+        self.data = data
+
+    def _asdict(self):
+        return dict(self.data)
+
+
+def customer_data(pk, deleted=False, **extra):
+    """
+    ``_asdict()`` payload of an SDK customer organization.
+    """
+    return {
+        "customerName": "Customer 0",
+        "customerAccountCode": pk,
+        "industry": "Construction",
+        "parent": "C000000",
+        "distributor": "Distributor",
+        "dbCode": "D000",
+        "status": False,
+        "locationCount": 0,
+        "userCount": 0,
+        "machineCount": 0,
+        "displayName": "Customer 0",
+        "billingAddress1": "0 Main St",
+        "billingAddress2": "Suite 100",
+        "billingCity": "Milwaukee",
+        "billingState": "WI",
+        "billingCountry": "US",
+        "billingZip": "53202",
+        "shippingAddress1": "0 Harbor Dr",
+        "shippingAddress2": None,
+        "shippingCity": "Milwaukee",
+        "shippingState": "WI",
+        "shippingCountry": "US",
+        "shippingZip": "53202",
+        "shippingSameAsBilling": "false",
+        "canAccessShopManuals": "True",
+        "canOrderParts": "True",
+        "primaryBranch": "B1",
+        "softDeleteFlag": "deleted" if deleted else None,
+        "perm_deactivate": True,
+        "perm_edit": True,
+        "perm_delete": True,
+        "perm_activate": True,
+        **extra,
+    }
+
+
+def sync_rows(*rows):
+    """
+    Full replica sync from ``rows`` (SDK ``_asdict()`` payloads).
+    """
+    object_set = mock.Mock()
+    object_set.iterate.return_value = [FakeObject(**row) for row in rows]
+    with mock.patch(
+        "customer_app.models.CustomerOrganizationModel.all_objects",
+        return_value=object_set,
+    ):
+        return sync_customer_replica(full=True)
+
+
+@override_settings(DELETE_FLAG="deleted", CUSTOMER_APP_MODIFIED_PROPERTY=None)
+class ReplicaSyncTests(TestCase):
+    def test_full_sync_writes_only_changes(self):
+        stats = sync_rows(customer_data("C1"), customer_data("C2"), customer_data("C3"))
+        self.assertEqual((stats["mode"], stats["rows_created"]), ("full", 3))
+
+        stats = sync_rows(customer_data("C1"), customer_data("C2"), customer_data("C3"))
+        self.assertEqual(
+            (stats["rows_created"], stats["rows_updated"], stats["rows_removed"]),
+            (0, 0, 0),
+        )
+
+        stats = sync_rows(customer_data("C1", industry="Forestry"), customer_data("C2"))
+        self.assertEqual((stats["rows_updated"], stats["rows_removed"]), (1, 1))
+        self.assertEqual(
+            CustomerOrganizationReplica.objects.get(pk="C1").industry, "Forestry"
+        )
+        self.assertFalse(CustomerOrganizationReplica.objects.filter(pk="C3").exists())
+        self.assertEqual(CustomerReplicaSyncState.objects.get().rows_changed, 2)
+
+    def test_batches(self):
+        rows = [customer_data(f"C{i}") for i in range(7)]
+        object_set = mock.Mock()
+        object_set.iterate.return_value = [FakeObject(**row) for row in rows]
+        with mock.patch(
+            "customer_app.models.CustomerOrganizationModel.all_objects",
+            return_value=object_set,
+        ):
+            stats = sync_customer_replica(full=True, batch_size=3)
+        self.assertEqual((stats["rows_seen"], stats["rows_created"]), (7, 7))
+
+    @override_settings(CUSTOMER_APP_MODIFIED_PROPERTY="updated_at")
+    def test_incremental_sync_resumes_from_cursor(self):
+        def sync(*rows, full=False):
+            objects = []
+            for row, updated_at in rows:
+                obj = FakeObject(**row)
+                obj.updated_at = updated_at
+                objects.append(obj)
+            object_set = mock.MagicMock()
+            object_set.iterate.return_value = objects
+            object_set.where.return_value.iterate.return_value = objects
+            with mock.patch(
+                "customer_app.models.CustomerOrganizationModel.all_objects",
+                return_value=object_set,
+            ), mock.patch.object(
+                CustomerOrganizationModel, "updated_at", mock.MagicMock(), create=True
+            ) as updated_at:
+                stats = sync_customer_replica(full=full)
+            return stats, object_set, updated_at
+
+        day = [datetime(2024, 1, d, 12) for d in range(1, 4)]
+        stats, object_set, _ = sync(
+            (customer_data("C1"), day[0]), (customer_data("C2"), day[1])
+        )
+        self.assertEqual(stats["mode"], "full")
+        cursor = CustomerReplicaSyncState.objects.get().cursor
+        self.assertEqual(decode_sort_value(cursor), day[1])
+
+        # The boundary row comes back with one that shares its value.
+        stats, object_set, updated_at = sync(
+            (customer_data("C2"), day[1]), (customer_data("C3"), day[1])
+        )
+        self.assertEqual(stats["mode"], "incremental")
+        updated_at.__ge__.assert_called_once_with(day[1])
+        self.assertEqual((stats["rows_created"], stats["rows_updated"]), (1, 0))
+
+        changed = customer_data("C2", industry="Forestry")
+        stats, object_set, _ = sync((changed, day[2]), (changed, day[2]))
+        self.assertEqual(stats["rows_updated"], 1)
+        # Rows the incremental run didn't see are kept.
+        self.assertTrue(CustomerOrganizationReplica.objects.filter(pk="C1").exists())
+        cursor = CustomerReplicaSyncState.objects.get().cursor
+        self.assertEqual(decode_sort_value(cursor), day[2])
+
+        stats, _, _ = sync((customer_data("C2"), day[2]), full=True)
+        self.assertEqual((stats["mode"], stats["rows_removed"]), ("full", 2))
+
+    def test_replica_reads(self):
+        sync_rows(
+            customer_data("C1", parent=""),
+            customer_data("C2", parent="C1"),
+            customer_data("C3", parent="C1", deleted=True),
+        )
+        self.assertEqual(
+            sorted(row.pk for row in CustomerReplicaSource.objects()), ["C1", "C2"]
+        )
+        self.assertEqual([row.pk for row in CustomerReplicaSource.by_parent("C1")], ["C2"])
+        self.assertEqual([row.pk for row in CustomerReplicaSource.orphans()], ["C1"])
+        self.assertEqual(CustomerReplicaSource.get_object("C2").parent, "C1")
+        with self.assertRaises(ValueError):
+            CustomerReplicaSource.get_object("C3")
+
+    def test_source_follows_setting(self):
+        with self.settings(CUSTOMER_APP_READ_FROM_REPLICA=True):
+            self.assertIs(customer_source(), CustomerReplicaSource)
+        self.assertIs(customer_source(), CustomerOrganizationModel)
+
+
+@override_settings(
+    DELETE_FLAG="deleted",
+    CUSTOMER_APP_MODIFIED_PROPERTY=None,
+    CUSTOMER_APP_READ_FROM_REPLICA=True,
+    CUSTOMER_APP_COUNT_CACHE_TTL=0,
+)
+class PageTokenTests(TestCase):
+    def setUp(self):
+        rows = [customer_data(f"C{i:02d}") for i in range(11)]
+        # Ties and nulls in the sort field.
+        for i, row in enumerate(rows):
+            row["industry"] = None if i % 4 == 0 else ("Mining" if i % 2 else "Forestry")
+        sync_rows(*rows)
+
+    def walk(self, page_size, sort_by=None, fingerprint="q"):
+        pks, token, pages = [], None, 0
+        while True:
+            page = CustomerReplicaSource.paginate(
+                CustomerReplicaSource.objects(),
+                page_size,
+                page_token=token,
+                sort_by=sort_by,
+                fingerprint=fingerprint,
+            )
+            pks.extend(row.pk for row in page.objects)
+            pages += 1
+            token = page.next_page_token
+            if token is None:
+                return pks, pages
+
+    def by_page_num(self, page_size, sort_by=None):
+        pks, page_num = [], 1
+        while True:
+            page = CustomerReplicaSource.paginate(
+                CustomerReplicaSource.objects(),
+                page_size,
+                page_num=page_num,
+                sort_by=sort_by,
+            )
+            if not page.objects:
+                return pks
+            pks.extend(row.pk for row in page.objects)
+            page_num += 1
+
+    def test_tokens_walk_every_row_once(self):
+        for sort_by in [None, "industry", "-industry", "-customer_account_code"]:
+            with self.subTest(sort_by=sort_by):
+                pks, pages = self.walk(3, sort_by)
+                self.assertEqual(len(pks), 11)
+                self.assertEqual(set(pks), {f"C{i:02d}" for i in range(11)})
+                self.assertEqual(pks, self.by_page_num(3, sort_by))
+                self.assertEqual(pages, 4)
+
+    def test_page_num_token_continues_that_page(self):
+        page = CustomerReplicaSource.paginate(
+            CustomerReplicaSource.objects(), 4, page_num=2, sort_by="industry"
+        )
+        following = CustomerReplicaSource.paginate(
+            CustomerReplicaSource.objects(),
+            4,
+            page_token=page.next_page_token,
+            sort_by="industry",
+        )
+        self.assertEqual(
+            [row.pk for row in following.objects],
+            self.by_page_num(4, "industry")[8:],
+        )
+
+    def test_token_rejected_for_another_query(self):
+        page = CustomerReplicaSource.paginate(
+            CustomerReplicaSource.objects(), 3, sort_by="industry", fingerprint="a"
+        )
+        for kwargs in [
+            {"sort_by": "industry", "fingerprint": "b"},
+            {"sort_by": "-industry", "fingerprint": "a"},
+        ]:
+            with self.assertRaises(InvalidPageToken):
+                CustomerReplicaSource.paginate(
+                    CustomerReplicaSource.objects(),
+                    3,
+                    page_token=page.next_page_token,
+                    **kwargs,
+                )
+
+    def test_list_view_rejects_mismatched_token(self):
+        view = CustomerViewset.as_view({"get": "list"})
+
+        def get(**params):
+            request = APIRequestFactory().get("/customer/", params)
+            request.palantir_user = mock.Mock(distributor_id=None)
+            return view(request)
+
+        first = get(page_size=5, sort_by="industry")
+        self.assertEqual(first.status_code, 200)
+        second = get(page_size=5, sort_by="industry", page_token=first.data["next_page_token"])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(len(second.data["customer_obj"]), 5)
+
+        response = get(page_size=5, sort_by="-industry", page_token=first.data["next_page_token"])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["code"], "E104")
+
+
+@override_settings(DELETE_FLAG="deleted", CUSTOMER_APP_MODIFIED_PROPERTY=None)
+class FilterAndSortTests(TestCase):
+    def setUp(self):
+        sync_rows(
+            customer_data("C1", customerName="Alpha Mining", industry="Mining"),
+            customer_data("C2", customerName="Beta Forestry", industry="Forestry"),
+            customer_data("A3", customerName="Cedar Mining", industry="Mining"),
+        )
+
+    def pks(self, **kwargs):
+        return [row.pk for row in CustomerReplicaSource.filter_and_sort(**kwargs)]
+
+    def test_filters_and_search_combined(self):
+        self.assertEqual(
+            self.pks(industry=(FilterTypes.EQUALS, "Mining"), sort_by="-customer_name"),
+            ["A3", "C1"],
+        )
+        self.assertEqual(
+            self.pks(
+                industry=(FilterTypes.IS_ANY_OF, "['Mining', 'Forestry']"),
+                sort_by="customer_account_code",
+            ),
+            ["A3", "C1", "C2"],
+        )
+        # A prefix of either search field matches.
+        self.assertEqual(self.pks(search="A", sort_by="customer_account_code"), ["A3", "C1"])
+        self.assertEqual(
+            self.pks(industry=(FilterTypes.EQUALS, "Forestry"), search="A"), []
+        )
+
+    def test_strict_and_fallback_modes(self):
+        no_match = {"industry": (FilterTypes.EQUALS, "Fishing")}
+        self.assertEqual(self.pks(**no_match), [])
+        self.assertEqual(self.pks(mode=FilterModes.FALLBACK, **no_match), [])
+
+        # Fallback skips a search that matches nothing; strict doesn't.
+        self.assertEqual(self.pks(search="Zulu"), [])
+        self.assertEqual(
+            sorted(self.pks(mode=FilterModes.FALLBACK, search="Zulu")),
+            ["A3", "C1", "C2"],
+        )
+
+    def test_palantir_query_compiled_without_counts(self):
+        object_set = mock.MagicMock()
+        with mock.patch.object(
+            CustomerOrganizationModel, "objects", return_value=object_set
+        ), mock.patch.object(
+            CustomerOrganizationModel, "filter_clause", return_value=mock.MagicMock()
+        ), mock.patch.object(
+            CustomerOrganizationModel, "customer_name", mock.MagicMock(), create=True
+        ), mock.patch.object(
+            CustomerOrganizationModel, "customer_account_code", mock.MagicMock(), create=True
+        ), mock.patch.object(
+            CustomerOrganizationModel,
+            "parse_sort_by",
+            return_value=("customer_name", True),
+        ):
+            result = CustomerOrganizationModel.filter_and_sort(
+                industry=(FilterTypes.EQUALS, "Mining"),
+                status=(FilterTypes.EQUALS, "true"),
+                search="Al",
+                sort_by="customer_name",
+            )
+            object_set.where.assert_called_once()
+            object_set.count.assert_not_called()
+            self.assertIs(result, object_set.where.return_value.order_by.return_value)
+
+            object_set.where.return_value.count.return_value.compute.return_value = 1
+            CustomerOrganizationModel.filter_and_sort(
+                industry=(FilterTypes.EQUALS, "Mining"), mode=FilterModes.FALLBACK
+            )
+            object_set.where.return_value.count.assert_called()
+
+
+class CountingSource:
+    __name__ = "CountingSource"
+
+    def __init__(self):
+        self.count = mock.Mock(side_effect=lambda object_set: len(object_set))
+
+
+@override_settings(
+    CUSTOMER_APP_COUNT_CACHE_TTL=60, CUSTOMER_APP_COUNT_CACHE_ALLOW_LOCAL=True
+)
+class CountCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.source = CountingSource()
+
+    def test_same_query_counted_once(self):
+        for _ in range(3):
+            self.assertEqual(
+                cached_count(self.source, [1, 2], filters={"industry": ["Mining"]}), 2
+            )
+        self.assertEqual(self.source.count.call_count, 1)
+
+        # Missing or empty scope values don't change the key.
+        cached_count(self.source, [1, 2], filters={"industry": ["Mining"]}, search="")
+        self.assertEqual(self.source.count.call_count, 1)
+
+        cached_count(self.source, [1], filters={"industry": ["Forestry"]})
+        cached_count(self.source, [1], parent="C1")
+        self.assertEqual(self.source.count.call_count, 3)
+
+    def test_scope_is_part_of_the_key(self):
+        self.assertNotEqual(count_cache_key(parent="C1"), count_cache_key(parent="C2"))
+        self.assertNotEqual(
+            count_cache_key(distributor="D1"), count_cache_key(parent="D1")
+        )
+        self.assertEqual(
+            count_cache_key(filters={"a": ["x"], "b": ["y"]}),
+            count_cache_key(filters={"b": ["y"], "a": ["x"]}),
+        )
+
+    def test_invalidation_retires_every_count(self):
+        cached_count(self.source, [1], parent="C1")
+        cached_count(self.source, [1, 2], search="Cust")
+        invalidate_counts()
+        cached_count(self.source, [1], parent="C1")
+        cached_count(self.source, [1, 2], search="Cust")
+        self.assertEqual(self.source.count.call_count, 4)
+
+    def test_invalidation_after_version_eviction(self):
+        cached_count(self.source, [1], parent="C1")
+        cache.delete(COUNT_VERSION_KEY)
+        # A later millisecond than the evicted version was created in.
+        with mock.patch("customer_app.cache.time.time", return_value=time.time() + 1):
+            invalidate_counts()
+        self.assertIsNotNone(cache.get(COUNT_VERSION_KEY))
+        cached_count(self.source, [1], parent="C1")
+        self.assertEqual(self.source.count.call_count, 2)
+
+    @override_settings(CUSTOMER_APP_COUNT_CACHE_TTL=0)
+    def test_disabled(self):
+        cached_count(self.source, [1], parent="C1")
+        cached_count(self.source, [1], parent="C1")
+        self.assertEqual(self.source.count.call_count, 2)
+
+    @override_settings(CUSTOMER_APP_COUNT_CACHE_ALLOW_LOCAL=False)
+    def test_process_local_cache_needs_opt_in(self):
+        with mock.patch("customer_app.cache._warned_local", False):
+            with self.assertLogs("customer_app.cache", "WARNING"):
+                cached_count(self.source, [1], parent="C1")
+            cached_count(self.source, [1], parent="C1")
+        self.assertEqual(self.source.count.call_count, 2)
+
+    @mock.patch("customer_app.views.client")
+    @mock.patch("customer_app.views.write_customer", return_value={})
+    def test_writes_invalidate(self, write_customer, client):
+        factory = APIRequestFactory()
+        requests = [
+            ("update", factory.put("/customer/C1/", {"industry": "Mining"}, format="json")),
+            ("destroy", factory.delete("/customer/C1/")),
+        ]
+        for action, request in requests:
+            with self.subTest(action=action):
+                cached_count(self.source, [1], parent="C1")
+                calls = self.source.count.call_count
+                view = CustomerViewset.as_view({"put": "update", "delete": "destroy"})
+                self.assertEqual(view(request, pk="C1").status_code, 200)
+                cached_count(self.source, [1], parent="C1")
+                self.assertEqual(self.source.count.call_count, calls + 1)
+
+    @override_settings(DELETE_FLAG="deleted", CUSTOMER_APP_MODIFIED_PROPERTY=None)
+    def test_replica_sync_invalidates_only_on_change(self):
+        def sync(*rows):
+            object_set = mock.Mock()
+            object_set.iterate.return_value = [FakeObject(**row) for row in rows]
+            with mock.patch(
+                "customer_app.models.CustomerOrganizationModel.all_objects",
+                return_value=object_set,
+            ):
+                sync_customer_replica(full=True)
+
+        sync(customer_data("C1"))
+        cached_count(self.source, [1], parent="C1")
+        sync(customer_data("C1"))
+        cached_count(self.source, [1], parent="C1")
+        self.assertEqual(self.source.count.call_count, 1)
+
+        sync(customer_data("C1", industry="Forestry"))
+        cached_count(self.source, [1], parent="C1")
+        self.assertEqual(self.source.count.call_count, 2)
+
+
+class BulkUpdateParentTests(SimpleTestCase):
+    def test_reports_each_pk(self):
+        customers = {"C1": object(), "C2": object()}
+
+        def write(sdk_client, pk, **kwargs):
+            if pk == "C2":
+                raise ValueError("edit rejected")
+
+        with mock.patch(
+            "customer_app.bulk.CustomerOrganizationModel.get_objects",
+            return_value=customers,
+        ), mock.patch("customer_app.bulk.write_customer", side_effect=write):
+            report = bulk_update_parent(None, ["C1", "C2", "C3", "C1"], "P1")
+
+        self.assertEqual(list(report), ["C1", "C2", "C3"])
+        self.assertEqual(report["C1"], {"success": True})
+        self.assertEqual(report["C2"], {"success": False, "error": "edit rejected"})
+        self.assertFalse(report["C3"]["success"])
+
+    def update_parent(self, report):
+        view = CustomerViewset.as_view({"patch": "update_parent"})
+        request = APIRequestFactory().patch(
+            "/update-parent/",
+            {"pk_list": list(report), "pk_parent": "P1"},
+            format="json",
+        )
+        with mock.patch("customer_app.views.client"), mock.patch(
+            "customer_app.views.invalidate_counts"
+        ), mock.patch("customer_app.views.bulk_update_parent", return_value=report):
+            return view(request)
+
+    def test_all_mapped(self):
+        response = self.update_parent({"C1": {"success": True}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["code"], "S101")
+        self.assertTrue(response.data["success"])
+
+    def test_partial_failure_is_not_a_success(self):
+        response = self.update_parent(
+            {"C1": {"success": True}, "C2": {"success": False, "error": "x"}}
+        )
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data["code"], "E107")
+        self.assertFalse(response.data["success"])
+        self.assertEqual(response.data["failed_ids"], ["C2"])
+        self.assertEqual(response.data["succeeded"], 1)
+
+
+def edit_data(**extra):
+    """
+    Update payload as the API receives it (serializer field names).
+    """
+    return {
+        "customer_name": "Alpha",
+        "billing_address1": "1 Main St",
+        "billing_address2": "",
+        "shipping_address1": "2 Harbor Dr",
+        "shipping_address2": None,
+        "permission1": "True",
+        "permission2": "False",
+        "location_count": 1,
+        "user_count": 2,
+        "machine_count": 3,
+        **extra,
+    }
+
+
+class CustomerWriteTests(SimpleTestCase):
+    def test_edit_payload(self):
+        payload = edit_payload(edit_data(primary_phone_number="+1 555"), parent="C9")
+        self.assertEqual(payload["billing_address_1"], "1 Main St")
+        self.assertNotIn("billing_address1", payload)
+        self.assertIs(payload["can_access_shop_manuals"], True)
+        self.assertIs(payload["can_order_parts"], False)
+        self.assertEqual(payload["primary_phone_number"], "+1 555")
+        self.assertEqual(payload["secondary_phone_number"], "+1 (555) 555-1212")
+        self.assertEqual(payload["parent"], "C9")
+
+    def test_record_only_consulted_for_missing_fields(self):
+        data = edit_data()
+        del data["machine_count"]
+        payload = edit_payload(data, mock.Mock(machine_count=7, user_count=99))
+        self.assertEqual((payload["user_count"], payload["machine_count"]), (2, 7))
+
+    @mock.patch("customer_app.writes.CustomerOrganizationModel.get_object")
+    def test_complete_update_skips_the_fetch(self, get_object):
+        sdk_client = mock.Mock()
+        write_customer(sdk_client, "C1", data=edit_data())
+        get_object.assert_not_called()
+
+        edit = sdk_client.ontology.actions.my_komatsu_customer_organization_edit
+        edit.assert_called_once()
+        kwargs = edit.call_args.kwargs
+        self.assertEqual(kwargs["my_komatsu_customer_organization"], "C1")
+        self.assertEqual(kwargs["customer_name"], "Alpha")
+
+    @mock.patch("customer_app.writes.CustomerOrganizationModel.get_object")
+    def test_partial_update_fetches_once(self, get_object):
+        get_object.return_value = mock.Mock(location_count=4, user_count=5, machine_count=6)
+        data = edit_data()
+        for field in ["location_count", "user_count", "machine_count"]:
+            del data[field]
+        payload = write_customer(mock.Mock(), "C1", data=data)
+        get_object.assert_called_once_with("C1")
+        self.assertEqual(
+            (payload["location_count"], payload["user_count"], payload["machine_count"]),
+            (4, 5, 6),
+        )
+
+    @mock.patch("customer_app.writes.CustomerOrganizationModel.get_object")
+    @mock.patch("customer_app.writes.record_payload", return_value={"parent": ""})
+    def test_delete_rewrites_the_record(self, record_payload, get_object):
+        sdk_client = mock.Mock()
+        write_customer(sdk_client, "C1", soft_delete_flag="deleted")
+        record_payload.assert_called_once_with(
+            get_object.return_value, soft_delete_flag="deleted"
+        )
+        edit = sdk_client.ontology.actions.my_komatsu_customer_organization_edit
+        self.assertEqual(edit.call_args.kwargs["parent"], "")
+
+
+class CompiledSerializerTests(SimpleTestCase):
+    def test_customer_list_matches_drf(self):
+        rows = sample_rows(50)
+        self.assertEqual(
+            compiled_customer_list.many(rows),
+            [dict(row) for row in CustomerListSerializer(rows, many=True).data],
+        )
+
+    def test_parent_customer_list_matches_drf(self):
+        rows = sample_rows(50)
+        self.assertEqual(
+            compiled_parent_customer_list.many(rows),
+            [dict(row) for row in ParentCustomerListSerializer(rows, many=True).data],
+        )
+
+    def test_missing_defaulted_fields_fall_back_like_drf(self):
+        rows = sample_rows(3)
+        for row in rows:
+            del row["perm_edit"]
+            row["status"] = "false"
+            row["billingAddress1"] = None
+        self.assertEqual(
+            compiled_customer_list.many(rows),
+            [dict(row) for row in CustomerListSerializer(rows, many=True).data],
+        )
+
+
+@override_settings(
+    DELETE_FLAG="deleted",
+    CUSTOMER_APP_MODIFIED_PROPERTY=None,
+    CUSTOMER_APP_READ_FROM_REPLICA=True,
+)
+class ExportTests(TestCase):
+    def setUp(self):
+        sync_rows(
+            customer_data("C1", industry="Mining", parent=""),
+            customer_data("C2", industry="Forestry", parent="C1"),
+            customer_data("C3", industry="Mining", parent="C1"),
+            customer_data("C4", deleted=True),
+        )
+
+    def export(self, distributor_id=None, **params):
+        view = CustomerViewset.as_view({"get": "export"})
+        request = APIRequestFactory().get("/customer/export/", params)
+        request.palantir_user = mock.Mock(distributor_id=distributor_id)
+        return view(request)
+
+    def body(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response = self.export(sort_by="-customer_account_code")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertIn('filename="customers.ndjson"', response["Content-Disposition"])
+        rows = [json.loads(line) for line in self.body(response).splitlines()]
+        self.assertEqual(
+            [row["customer_account_code"] for row in rows], ["C3", "C2", "C1"]
+        )
+
+    def test_csv_with_filters(self):
+        response = self.export(
+            export_format="csv",
+            industry=["equals", "Mining"],
+            sort_by="customer_account_code",
+        )
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(self.body(response))))
+        self.assertEqual([row["customer_account_code"] for row in rows], ["C1", "C3"])
+        self.assertEqual({row["industry"] for row in rows}, {"Mining"})
+
+    def test_parent_scope(self):
+        rows = self.body(self.export(parent="C1")).splitlines()
+        self.assertEqual(
+            sorted(json.loads(row)["customer_account_code"] for row in rows), ["C2", "C3"]
+        )
+
+    def test_unknown_format(self):
+        response = self.export(export_format="xlsx")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["code"], "E105")
+
+    def test_no_count_or_paging(self):
+        with mock.patch.object(
+            CustomerReplicaSource, "count", side_effect=AssertionError("count")
+        ), mock.patch.object(
+            CustomerReplicaSource, "paginate", side_effect=AssertionError("paginate")
+        ):
+            lines = self.body(self.export()).splitlines()
+        self.assertEqual(len(lines), 3)
+
+
+@override_settings(DELETE_FLAG="deleted", CUSTOMER_APP_MODIFIED_PROPERTY=None)
+class DeletedFeedTests(TestCase):
+    def sync(self, *rows):
+        return sync_rows(*rows)
+
+    def test_deletion_stamped_after_commit_and_kept(self):
+        self.sync(customer_data("C1"), customer_data("C2"))
+        before = timezone.now()
+        self.sync(customer_data("C1"), customer_data("C2", deleted=True))
+
+        deleted_at = CustomerOrganizationReplica.objects.get(pk="C2").deleted_at
+        self.assertGreaterEqual(deleted_at, before)
+        self.assertEqual(
+            [row.pk for row in CustomerReplicaSource.deleted_since(before)], ["C2"]
+        )
+
+        # Any later change to the deleted row keeps the original deletion time.
+        self.sync(customer_data("C1"), customer_data("C2", True, industry="Mining"))
+        self.assertEqual(
+            CustomerOrganizationReplica.objects.get(pk="C2").deleted_at, deleted_at
+        )
+
+    def test_restored_row_clears_deletion(self):
+        self.sync(customer_data("C1", deleted=True))
+        self.sync(customer_data("C1"))
+        self.assertIsNone(CustomerOrganizationReplica.objects.get(pk="C1").deleted_at)
+
+    def get_deleted(self, **params):
+        view = CustomerViewset.as_view({"get": "get_deleted_entries"})
+        return view(APIRequestFactory().get("/deleted/", params))
+
+    @override_settings(CUSTOMER_APP_READ_FROM_REPLICA=True)
+    def test_as_of_overlaps_the_request(self):
+        self.sync(customer_data("C1", deleted=True))
+        before = timezone.now()
+        response = self.get_deleted()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row["customer_account_code"] for row in response.data["data"]], ["C1"]
+        )
+        self.assertLessEqual(
+            response.data["as_of"], (before - timedelta(seconds=29)).isoformat()
+        )
+
+    def test_malformed_since(self):
+        for since in ["yesterday", "2024-02-30T00:00:00"]:
+            response = self.get_deleted(since=since)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data["code"], "E106")
+
+
+class RunConcurrentlyTests(SimpleTestCase):
+    def test_calls_overlap_when_a_thread_is_free(self):
+        start_time = time.monotonic()
+        results, _ = concurrency.run_concurrently(
+            {
+                "a": lambda: time.sleep(0.2) or threading.get_ident(),
+                "b": lambda: time.sleep(0.2) or threading.get_ident(),
+            }
+        )
+        self.assertLess(time.monotonic() - start_time, 0.35)
+        self.assertEqual(results["a"], threading.get_ident())
+        self.assertNotEqual(results["b"], threading.get_ident())
+
+    def test_busy_pool_runs_inline(self):
+        with mock.patch.object(concurrency, "_slots", threading.BoundedSemaphore(1)):
+            concurrency._slots.acquire()
+            results, _ = concurrency.run_concurrently(
+                {"a": threading.get_ident, "b": threading.get_ident}
+            )
+        self.assertEqual(set(results.values()), {threading.get_ident()})
+
+    def test_slot_is_released(self):
+        with mock.patch.object(concurrency, "_slots", threading.BoundedSemaphore(1)):
+            for _ in range(3):
+                results, _ = concurrency.run_concurrently(
+                    {"a": threading.get_ident, "b": threading.get_ident}
+                )
+                self.assertNotEqual(results["b"], threading.get_ident())
+
+    def test_errors_are_raised(self):
+        def fail():
+            raise ValueError("boom")
+
+        for calls in ({"a": fail, "b": lambda: 1}, {"a": lambda: 1, "b": fail}):
+            with self.assertRaisesMessage(ValueError, "boom"):
+                concurrency.run_concurrently(calls)
+
+
+def asgi_get(path, query_string=""):
+    """
+    Status and body of a GET served by the project's ASGI handler.
+    """
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query_string.encode(),
+        "headers": [],
+        "server": ("testserver", 80),
+    }
+    asyncio.run(ASGIHandler()(scope, receive, send))
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return messages[0]["status"], body
+
+
+class AsgiUrls:
+    urlpatterns = []
+
+
+@override_settings(
+    ASYNC_VIEWS=True,
+    MIDDLEWARE=[],
+    ROOT_URLCONF=AsgiUrls,
+    DELETE_FLAG="deleted",
+    CUSTOMER_APP_MODIFIED_PROPERTY=None,
+    CUSTOMER_APP_READ_FROM_REPLICA=True,
+    CUSTOMER_APP_STREAM_PREFETCH=2,
+)
+class AsgiStreamingTests(TransactionTestCase):
+    def setUp(self):
+        # Built with ASYNC_VIEWS on, as under komtest416_47549.asgi.
+        AsgiUrls.urlpatterns = [
+            path(
+                "deleted/",
+                CustomerViewset.as_view({"get": "get_deleted_entries"}),
+            )
+        ]
+        object_set = mock.Mock()
+        object_set.iterate.return_value = [
+            FakeObject(**customer_data(f"C{i}", deleted=True)) for i in range(5)
+        ]
+        with mock.patch(
+            "customer_app.models.CustomerOrganizationModel.all_objects",
+            return_value=object_set,
+        ):
+            sync_customer_replica(full=True)
+
+    def test_replica_export_streams_under_asgi(self):
+        status, body = asgi_get("/deleted/", "export_format=ndjson")
+
+        self.assertEqual(status, 200)
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(
+            sorted(row["customer_account_code"] for row in rows),
+            [f"C{i}" for i in range(5)],
+        )
+
+    def test_stream_does_not_block_the_event_loop(self):
+        def rows():
+            for i in range(3):
+                time.sleep(0.1)
+                yield f"{i}\n"
+
+        async def stream():
+            ticks = 0
+            done = asyncio.Event()
+
+            async def tick():
+                nonlocal ticks
+                while not done.is_set():
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            ticker = asyncio.ensure_future(tick())
+            lines = [line async for line in concurrency.aiter_in_thread(rows())]
+            done.set()
+            await ticker
+            return lines, ticks
+
+        lines, ticks = asyncio.run(stream())
+
+        self.assertEqual(lines, ["0\n", "1\n", "2\n"])
+        # The loop kept running while the thread slept between rows.
+        self.assertGreater(ticks, 10)
+
+    def test_stream_error_surfaces(self):
+        def rows():
+            yield "first\n"
+            raise ValueError("boom")
+
+        async def stream():
+            lines = concurrency.aiter_in_thread(rows())
+            self.assertEqual(await lines.__anext__(), "first\n")
+            with self.assertRaisesMessage(ValueError, "boom"):
+                await lines.__anext__()
+
+        asyncio.run(stream())
+
+
+class RequestScopedLookupTests(SimpleTestCase):
+    def setUp(self):
+        self.object_set = mock.Mock()
+        self.object_set.where.return_value.take.side_effect = lambda n: [object()]
+        for patcher in [
+            mock.patch.object(
+                CustomerOrganizationModel, "objects", return_value=self.object_set
+            ),
+            mock.patch("customer_app.models.MyKomatsuCustomerOrganization"),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        token = request_scope.open_scope()
+        self.addCleanup(request_scope.close_scope, token)
+
+    def fetches(self):
+        return self.object_set.where.return_value.take.call_count
+
+    def test_customer_fetched_once_per_request(self):
+        first = CustomerOrganizationModel.get_object("C1")
+        self.assertIs(CustomerOrganizationModel.get_object("C1"), first)
+        self.assertEqual(self.fetches(), 1)
+
+    @mock.patch("customer_app.writes.record_payload", return_value={})
+    @mock.patch("customer_app.writes.apply_edit")
+    def test_write_evicts_the_customer(self, apply_edit, record_payload):
+        first = CustomerOrganizationModel.get_object("C1")
+        write_customer(mock.Mock(), "C1", soft_delete_flag="deleted")
+        # The write reused the request's record, then dropped it.
+        record_payload.assert_called_once_with(first, soft_delete_flag="deleted")
+        self.assertIsNot(CustomerOrganizationModel.get_object("C1"), first)
+        self.assertEqual(self.fetches(), 2)
@@ -1,15 +1,24 @@
 import time
-
-from customer_app.models import CustomerOrganizationModel
+from datetime import timedelta
+
+from customer_app.bulk import bulk_update_parent
+from customer_app.cache import cached_count, invalidate_counts
+from customer_app.concurrency import offload_view, run_concurrently
+from customer_app.export import EXPORT_FORMATS, NDJSON, stream_response
+from customer_app.models import CustomerOrganizationModel, SinceNotSupported
+from customer_app.pagination import InvalidPageToken, query_fingerprint
 from customer_app.serializer import (
-    CustomerListSerializer,
     CustomerSerializer,
-    ParentCustomerListSerializer,
+    compiled_customer,
+    compiled_customer_list,
+    compiled_parent_customer_list,
 )
-from dev_mykomatsu_sdk.ontology.objects import MyKomatsuCustomerOrganization
-from dev_mykomatsu_sdk.types import ActionConfig, ActionMode
+from customer_app.writes import write_customer
 from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from helpers import perf_diff_time, value_exists
+from modules.django_customer_app.customer_app.replica.source import customer_source
 from modules.django_komatsu_idm.komatsu_idm.main import sdk_client as client
 from modules.django_komatsu_permissions.permissions.common import *
 from response_codes import custom_res_codes
@@ -24,6 +33,8 @@ class CustomerViewset(viewsets.ViewSet):
         param:
             page_num (default=1)
             page_size (default=20)
+            page_token (continuation token from a previous "next_page_token";
+                        takes precedence over page_num)
     POST:
         create single obj (NOT IMPLEMENTED YET)
 
@@ -32,10 +43,26 @@ class CustomerViewset(viewsets.ViewSet):
     PUT: Update single object
     DELETE: Delete single object
 
+    Under ASGI (settings.ASYNC_VIEWS) every action is served as an async view
+    that runs on a worker thread, see concurrency.offload_view.
     """
 
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if getattr(settings, "ASYNC_VIEWS", False):
+            return offload_view(view)
+        return view
+
     # permission_classes = [IsCustomer|IsDistributor]
 
+    def get_filter_dict(self):
+        filter_dict = {}
+        for key in CustomerOrganizationModel.FILTER_KEYS:
+            if self.request.query_params.get(key, None):
+                filter_dict[key] = self.request.query_params.getlist(key, None)
+        return filter_dict
+
     def list(self, request, *args, **kwargs):
         # GET
         try:
@@ -45,65 +72,44 @@ class CustomerViewset(viewsets.ViewSet):
             page_size = int(
                 self.request.query_params.get("page_size", settings.PAGE_SIZE)
             )
+            page_token = self.request.query_params.get("page_token", None)
             parent = self.request.query_params.get("parent", None)
             sort_by_field = self.request.query_params.get("sort_by", None)
             search_query = self.request.query_params.get("search", None)
 
-            filter_dict = {}
-            for key in CustomerOrganizationModel.FILTER_KEYS:
-                if self.request.query_params.get(key, None):
-                    filter_dict[key] = self.request.query_params.getlist(key, None)
+            filter_dict = self.get_filter_dict()
 
+            Customers = customer_source()
             performance_data = {}
             view_start_time = time.time()
             if value_exists(parent):
-                start_time = time.time()
-
-                customer_count = (
-                    CustomerOrganizationModel.objects()
-                    .where(MyKomatsuCustomerOrganization.parent.__eq__(parent))
-                    .count()
-                    .compute()
-                )
-
-                customer_obj = (
-                    CustomerOrganizationModel.objects()
-                    .where(MyKomatsuCustomerOrganization.parent.__eq__(parent))
-                    .page(page_size=page_size)
-                )
-
-                performance_data["customer_count_fetch"] = perf_diff_time(
-                    start_time, time.time()
-                )
-
-                start_time = time.time()
-
-                customer_count = (
-                    CustomerOrganizationModel.objects()
-                    .where(MyKomatsuCustomerOrganization.parent.__eq__(parent))
-                    .count()
-                    .compute()
-                )
-                customer_obj = (
-                    CustomerOrganizationModel.objects()
-                    .where(MyKomatsuCustomerOrganization.parent.__eq__(parent))
-                    .page(page_size=page_size)
-                )
-                for _ in range(page_no):
-                    customer = next(customer_obj)
-
-                performance_data["customer_iterate"] = perf_diff_time(
-                    start_time, time.time()
+                parent_obj = Customers.by_parent(parent)
+                results, fetch_performance = run_concurrently(
+                    {
+                        "customer_count_fetch": lambda: cached_count(
+                            Customers, parent_obj, parent=parent
+                        ),
+                        "customer_iterate": lambda: Customers.paginate(
+                            parent_obj,
+                            page_size,
+                            page_num=page_no,
+                            page_token=page_token,
+                            fingerprint=query_fingerprint(parent=parent),
+                        ),
+                    },
+                    concurrent=Customers.REMOTE,
                 )
+                customer_count = results["customer_count_fetch"]
+                customer_page = results["customer_iterate"]
+                performance_data.update(fetch_performance)
 
                 response = []
-                for obj in customer:
+                for obj in customer_page.objects:
                     response.append(obj._asdict())
 
                 start_time = time.time()
 
-                customer_serialized = ParentCustomerListSerializer(response, many=True)
-                customer_serialized_data = customer_serialized.data
+                customer_serialized_data = compiled_parent_customer_list.many(response)
 
                 performance_data["customer_serializer"] = perf_diff_time(
                     start_time, time.time()
@@ -118,28 +124,53 @@ class CustomerViewset(viewsets.ViewSet):
                     "performance": performance_data,
                     "customer_count": customer_count,
                     "customer_obj": customer_serialized_data,
+                    "next_page_token": customer_page.next_page_token,
                 }
                 return Response(result_dict, status=200)
             else:
                 if request.palantir_user.distributor_id:
-                    cust_obj = CustomerOrganizationModel.objects().where(
-                        CustomerOrganizationModel.db_code.__eq__(
-                            request.palantir_user.distributor_id
-                        )
+                    cust_obj = Customers.by_distributor(
+                        request.palantir_user.distributor_id
+                    )
+                    count_scope = {"distributor": request.palantir_user.distributor_id}
+                    fingerprint = query_fingerprint(
+                        **count_scope, sort_by=sort_by_field
                     )
                 else:
-                    cust_obj = CustomerOrganizationModel.filter_and_sort(
-                        **filter_dict, sort_by=sort_by_field, search=search_query
+                    # Ordering is applied by the paginator so it can add the
+                    # tie-breaker that keeps continuation tokens stable.
+                    cust_obj = Customers.filter_and_sort(
+                        **filter_dict, search=search_query
+                    )
+                    count_scope = {"filters": filter_dict, "search": search_query}
+                    fingerprint = query_fingerprint(
+                        **count_scope, sort_by=sort_by_field
                     )
 
-                customer_count = cust_obj.count().compute()
-                customer_obj = cust_obj.page(page_size=page_size)
-
-                for _ in range(page_no):
-                    customer = next(customer_obj)
+                results, fetch_performance = run_concurrently(
+                    {
+                        "customer_count_fetch": lambda: cached_count(
+                            Customers, cust_obj, **count_scope
+                        ),
+                        "customer_iterate": lambda: Customers.paginate(
+                            cust_obj,
+                            page_size,
+                            page_num=page_no,
+                            page_token=page_token,
+                            sort_by=sort_by_field
+                            if value_exists(sort_by_field)
+                            else None,
+                            fingerprint=fingerprint,
+                        ),
+                    },
+                    concurrent=Customers.REMOTE,
+                )
+                customer_count = results["customer_count_fetch"]
+                customer_page = results["customer_iterate"]
+                performance_data.update(fetch_performance)
 
                 response = []
-                for obj in customer:
+                for obj in customer_page.objects:
                     obj = obj._asdict()
                     obj.update(
                         {
@@ -151,15 +182,35 @@ class CustomerViewset(viewsets.ViewSet):
                     )
                     response.append(obj)
 
-                customer_serialized = CustomerListSerializer(response, many=True)
-                customer_serialized_data = customer_serialized.data
+                start_time = time.time()
+
+                customer_serialized_data = compiled_customer_list.many(response)
+
+                performance_data["customer_serializer"] = perf_diff_time(
+                    start_time, time.time()
+                )
+
+                performance_data = {
+                    **{"full_view": perf_diff_time(view_start_time, time.time())},
+                    **performance_data,
+                }
 
                 result_dict = {
+                    "performance": performance_data,
                     "customer_count": customer_count,
                     "customer_obj": customer_serialized_data,
+                    "next_page_token": customer_page.next_page_token,
                 }
                 return Response(result_dict, status=200)
 
+        except InvalidPageToken as e:
+            result_dict = {
+                "customer_count": 0,
+                "customer_obj": [],
+            }
+            result_dict.update(custom_res_codes["E104"])
+            result_dict.update({"error": str(e)})
+            return Response(result_dict, status=400)
         except Exception as e:
             # Handle and log the exception appropriately
             result_dict = {
@@ -179,9 +230,7 @@ class CustomerViewset(viewsets.ViewSet):
             customer_account_code = pk
 
             if value_exists(customer_account_code):
-                customer_obj = CustomerOrganizationModel.get_object(
-                    customer_account_code
-                )
+                customer_obj = customer_source().get_object(customer_account_code)
                 customer_serialized = CustomerSerializer(customer_obj._asdict())
                 customer_serialized_data = customer_serialized.data
                 response = custom_res_codes["S100"]
@@ -197,58 +246,8 @@ class CustomerViewset(viewsets.ViewSet):
         # PUT/id/
         try:
             sdk_client = client()
-            customer_account_code = pk
-            customer_data = request.data
-            # TODO: remove code once renaming done at palantir's end
-            customer_data["billing_address_1"] = customer_data.pop("billing_address1")
-            customer_data["billing_address_2"] = customer_data.pop("billing_address2")
-            customer_data["can_access_shop_manuals"] = customer_data.pop("permission1")
-            customer_data["shipping_address_1"] = customer_data.pop("shipping_address1")
-            customer_data["shipping_address_2"] = customer_data.pop("shipping_address2")
-            customer_data["can_order_parts"] = customer_data.pop("permission2")
-            customer_data["secondary_phone_number"] = customer_data.pop(
-                "secondary_phone_number", "+1 (555) 555-1212"
-            )
-            customer_data["primary_phone_number"] = customer_data.pop(
-                "primary_phone_number", "+1 (555) 555-1212"
-            )
-
-            customer_obj = CustomerOrganizationModel.get_object(
-                pk=customer_account_code
-            )
-
-            customer_data["location_count"] = customer_data.pop(
-                "location_count", customer_obj.location_count
-            )
-            customer_data["user_count"] = customer_data.pop(
-                "user_count", customer_obj.user_count
-            )
-            customer_data["machine_count"] = customer_data.pop(
-                "machine_count", customer_obj.machine_count
-            )
-
-            # TODO: update this after rework by frontend team
-            customer_data.update(
-                {
-                    "can_order_parts": True
-                    if customer_data["can_order_parts"] == "True"
-                    else False
-                }
-            )
-            customer_data.update(
-                {
-                    "can_access_shop_manuals": True
-                    if customer_data["can_access_shop_manuals"] == "True"
-                    else False
-                }
-            )
-
-            # customer_data.pop('customer_account_code')
-            sdk_client.ontology.actions.my_komatsu_customer_organization_edit(
-                my_komatsu_customer_organization=customer_account_code,
-                action_config=ActionConfig(mode=ActionMode.APPLY),
-                **customer_data
-            )
+            customer_data = write_customer(sdk_client, pk, data=request.data)
+            invalidate_counts()
             return Response(customer_data, status=200)
 
         except Exception as e:
@@ -259,59 +258,10 @@ class CustomerViewset(viewsets.ViewSet):
         # DELETE/id/
         try:
             sdk_client = client()
-            customer_account_code = pk
-            customer_data = CustomerOrganizationModel.get_object(customer_account_code)
-            customer_serialized = CustomerSerializer(customer_data._asdict())
-            customer_data = customer_serialized.data
-            # TODO: remove code once renaming done at palantir's end
-            customer_data["billing_address_1"] = customer_data.pop("billing_address1")
-            customer_data["billing_address_2"] = customer_data.pop("billing_address2")
-            customer_data["can_access_shop_manuals"] = customer_data.pop("permission1")
-            customer_data["shipping_address_1"] = customer_data.pop("shipping_address1")
-            customer_data["shipping_address_2"] = customer_data.pop("shipping_address2")
-            customer_data["can_order_parts"] = customer_data.pop("permission2")
-            customer_data["secondary_phone_number"] = customer_data.pop(
-                "secondary_phone_number", "+1 (555) 555-1212"
-            )
-            customer_data["primary_phone_number"] = customer_data.pop(
-                "primary_phone_number", "+1 (555) 555-1212"
-            )
-            customer_obj = CustomerOrganizationModel.get_object(
-                pk=customer_account_code
-            )
-
-            customer_data["location_count"] = customer_data.pop(
-                "location_count", customer_obj.location_count
-            )
-            customer_data["user_count"] = customer_data.pop(
-                "user_count", customer_obj.user_count
-            )
-            customer_data["machine_count"] = customer_data.pop(
-                "machine_count", customer_obj.machine_count
-            )
-
-            customer_data.update(
-                {
-                    "can_order_parts": True
-                    if customer_data["can_order_parts"] == "True"
-                    else False
-                }
-            )
-            customer_data.update(
-                {
-                    "can_access_shop_manuals": True
-                    if customer_data["can_access_shop_manuals"] == "True"
-                    else False
-                }
-            )
-
-            # customer_data.pop('customer_account_code')
-            customer_data.update({"soft_delete_flag": settings.DELETE_FLAG})
-            sdk_client.ontology.actions.my_komatsu_customer_organization_edit(
-                my_komatsu_customer_organization=customer_account_code,
-                action_config=ActionConfig(mode=ActionMode.APPLY),
-                **customer_data
+            customer_data = write_customer(
+                sdk_client, pk, soft_delete_flag=settings.DELETE_FLAG
             )
+            invalidate_counts()
             return Response(customer_data, status=200)
 
         except Exception as e:
@@ -329,70 +279,20 @@ class CustomerViewset(viewsets.ViewSet):
             pk_list = request.data.pop("pk_list", None)
             pk_parent = request.data.pop("pk_parent", None)
             sdk_client = client()
-            for pk in pk_list:
-                cust_obj = CustomerOrganizationModel.get_object(pk)
-                customer_data = CustomerSerializer(cust_obj._asdict()).data
-                # TODO: remove code once renaming done at palantir's end
-                customer_data["billing_address_1"] = customer_data.pop(
-                    "billing_address1"
-                )
-                customer_data["billing_address_2"] = customer_data.pop(
-                    "billing_address2"
-                )
-                customer_data["can_access_shop_manuals"] = customer_data.pop(
-                    "permission1"
-                )
-                customer_data["shipping_address_1"] = customer_data.pop(
-                    "shipping_address1"
-                )
-                customer_data["shipping_address_2"] = customer_data.pop(
-                    "shipping_address2"
-                )
-                customer_data["can_order_parts"] = customer_data.pop("permission2")
-                customer_obj = CustomerOrganizationModel.get_object(pk=pk)
-
-                customer_data["location_count"] = customer_data.pop(
-                    "location_count", customer_obj.location_count
-                )
-                customer_data["user_count"] = customer_data.pop(
-                    "user_count", customer_obj.user_count
-                )
-                customer_data["machine_count"] = customer_data.pop(
-                    "machine_count", customer_obj.machine_count
-                )
+            results = bulk_update_parent(sdk_client, pk_list, pk_parent)
+            invalidate_counts()
 
-                customer_data["secondary_phone_number"] = customer_data.pop(
-                    "secondary_phone_number", "+1 (555) 555-1212"
-                )
-                customer_data["primary_phone_number"] = customer_data.pop(
-                    "primary_phone_number", "+1 (555) 555-1212"
-                )
-
-                # TODO: update this after rework by frontend team
-                customer_data.update(
-                    {
-                        "can_order_parts": True
-                        if customer_data["can_order_parts"] == "True"
-                        else False
-                    }
-                )
-                customer_data.update(
-                    {
-                        "can_access_shop_manuals": True
-                        if customer_data["can_access_shop_manuals"] == "True"
-                        else False
-                    }
-                )
-                customer_data.update({"parent": pk_parent})
-                # TODO: need to update response
-                sdk_client.ontology.actions.my_komatsu_customer_organization_edit(
-                    my_komatsu_customer_organization=pk,
-                    action_config=ActionConfig(mode=ActionMode.APPLY),
-                    **customer_data
-                )
-
-            response = custom_res_codes["S101"]
-            return Response(response, status=200)
+            failed = [pk for pk, result in results.items() if not result["success"]]
+            response = dict(custom_res_codes["E107" if failed else "S101"])
+            response.update(
+                {
+                    "succeeded": len(results) - len(failed),
+                    "failed": len(failed),
+                    "failed_ids": failed,
+                    "results": results,
+                }
+            )
+            return Response(response, status=207 if failed else 200)
 
         except Exception as e:
             # Handle and log the exception appropriately
@@ -412,40 +312,88 @@ class CustomerViewset(viewsets.ViewSet):
             page_size = int(
                 self.request.query_params.get("page_size", settings.PAGE_SIZE)
             )
-            customer_count = (
-                CustomerOrganizationModel.objects()
-                .where(
-                    MyKomatsuCustomerOrganization.parent.__eq__("")
-                    | MyKomatsuCustomerOrganization.parent.is_null()
-                )
-                .count()
-                .compute()
-            )
-            customer_obj = (
-                CustomerOrganizationModel.objects()
-                .where(
-                    MyKomatsuCustomerOrganization.parent.__eq__("")
-                    | MyKomatsuCustomerOrganization.parent.is_null()
-                )
-                .page(page_size=page_size)
+            page_token = self.request.query_params.get("page_token", None)
+            Customers = customer_source()
+            view_start_time = time.time()
+            orphan_obj = Customers.orphans()
+            results, performance_data = run_concurrently(
+                {
+                    "customer_count_fetch": lambda: cached_count(
+                        Customers, orphan_obj, orphan=True
+                    ),
+                    "customer_iterate": lambda: Customers.paginate(
+                        orphan_obj,
+                        page_size,
+                        page_num=page_no,
+                        page_token=page_token,
+                        fingerprint=query_fingerprint(orphan=True),
+                    ),
+                },
+                concurrent=Customers.REMOTE,
             )
-
-            for _ in range(page_no):
-                customer = next(customer_obj)
+            customer_count = results["customer_count_fetch"]
+            customer_page = results["customer_iterate"]
 
             response = []
-            for obj in customer:
+            for obj in customer_page.objects:
                 response.append(obj._asdict())
 
-            customer_serialized = ParentCustomerListSerializer(response, many=True)
-            customer_serialized_data = customer_serialized.data
+            customer_serialized_data = compiled_parent_customer_list.many(response)
+
+            performance_data = {
+                **{"full_view": perf_diff_time(view_start_time, time.time())},
+                **performance_data,
+            }
 
             result_dict = {
+                "performance": performance_data,
                 "customer_count": customer_count,
                 "customer_obj": customer_serialized_data,
+                "next_page_token": customer_page.next_page_token,
             }
             return Response(result_dict, status=200)
 
+        except InvalidPageToken as e:
+            response = dict(custom_res_codes["E104"])
+            response.update({"error": str(e)})
+            return Response(response, status=400)
+        except Exception as e:
+            # Handle and log the exception appropriately
+            return Response({"error": str(e)}, status=500)
+
+    @action(methods=["get"], detail=False, url_path="export", url_name="export")
+    def export(self, request, *args, **kwargs):
+        """
+        Stream every customer matching the list filters as NDJSON (default)
+        or CSV (?export_format=csv).
+        """
+        try:
+            export_format = self.request.query_params.get("export_format", NDJSON)
+            if export_format not in EXPORT_FORMATS:
+                return Response(custom_res_codes["E105"], status=400)
+
+            parent = self.request.query_params.get("parent", None)
+            sort_by_field = self.request.query_params.get("sort_by", None)
+            search_query = self.request.query_params.get("search", None)
+
+            Customers = customer_source()
+            if value_exists(parent):
+                cust_obj = Customers.by_parent(parent)
+            elif request.palantir_user.distributor_id:
+                cust_obj = Customers.by_distributor(
+                    request.palantir_user.distributor_id
+                )
+            else:
+                cust_obj = Customers.filter_and_sort(
+                    **self.get_filter_dict(),
+                    sort_by=sort_by_field if value_exists(sort_by_field) else None,
+                    search=search_query,
+                )
+
+            return stream_response(
+                Customers.iterate(cust_obj), compiled_customer, export_format, "customers"
+            )
+
         except Exception as e:
             # Handle and log the exception appropriately
             return Response({"error": str(e)}, status=500)
@@ -453,17 +401,82 @@ class CustomerViewset(viewsets.ViewSet):
     # TODO: Temp code to get the deleted entries
     @action(methods=["get"], detail=False, url_path="deleted", url_name="deleted")
     def get_deleted_entries(self, request, *args, **kwargs):
+        """
+        GET:
+            param:
+                since (ISO 8601 datetime; only customers deleted after it)
+                page_num / page_size / page_token (same as list)
+                export_format (ndjson streams every match instead of a page)
+        """
         try:
-            deleted_objs = CustomerOrganizationModel.deleted_objects()
-            response = []
-            for obj in deleted_objs.iterate():
-                obj = obj._asdict()
-                response.append(obj)
-            deleted_serialized = CustomerSerializer(response, many=True)
-            response = custom_res_codes["S100"]
-            response.update({"data": deleted_serialized.data})
+            # Handed back a little early so changes committed while this
+            # request runs are picked up again by the next ?since= query.
+            as_of = timezone.now() - timedelta(
+                seconds=getattr(settings, "CUSTOMER_APP_DELETED_SINCE_OVERLAP", 30)
+            )
+            since = self.request.query_params.get("since", None)
+            if value_exists(since):
+                try:
+                    since = parse_datetime(since)
+                except ValueError:
+                    since = None
+                if since is None:
+                    return Response(custom_res_codes["E106"], status=400)
+                if timezone.is_naive(since):
+                    since = timezone.make_aware(since, timezone.utc)
+
+            Customers = customer_source()
+            if since:
+                deleted_objs = Customers.deleted_since(since)
+            else:
+                deleted_objs = Customers.deleted_objects()
+
+            export_format = self.request.query_params.get("export_format", None)
+            if export_format:
+                if export_format not in EXPORT_FORMATS:
+                    return Response(custom_res_codes["E105"], status=400)
+                return stream_response(
+                    Customers.iterate(deleted_objs),
+                    compiled_customer,
+                    export_format,
+                    "deleted_customers",
+                )
+
+            page_no = int(self.request.query_params.get("page_num", settings.PAGE_NUM))
+            page_size = int(
+                self.request.query_params.get("page_size", settings.PAGE_SIZE)
+            )
+            deleted_page = Customers.paginate(
+                deleted_objs,
+                page_size,
+                page_num=page_no,
+                page_token=self.request.query_params.get("page_token", None),
+                fingerprint=query_fingerprint(
+                    deleted=True, since=since.isoformat() if since else None
+                ),
+            )
+
+            response = dict(custom_res_codes["S100"])
+            response.update(
+                {
+                    "data": compiled_customer.many(
+                        obj._asdict() for obj in deleted_page.objects
+                    ),
+                    "next_page_token": deleted_page.next_page_token,
+                    # Pass back as ?since= on the next sync.
+                    "as_of": as_of.isoformat(),
+                }
+            )
             return Response(response, status=200)
 
+        except InvalidPageToken as e:
+            response = dict(custom_res_codes["E104"])
+            response.update({"error": str(e)})
+            return Response(response, status=400)
+        except SinceNotSupported as e:
+            response = dict(custom_res_codes["E106"])
+            response.update({"error": str(e)})
+            return Response(response, status=400)
         except Exception as e:
             # Handle and log the exception appropriately
             return Response({"error": str(e)}, status=500)
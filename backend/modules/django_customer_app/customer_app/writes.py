@@ -0,0 +1,114 @@
+"""
+Write pipeline for MyKomatsuCustomerOrganization edits.
+
+Every write (update, destroy, update-parent) goes through the same three
+steps: fetch the current record at most once, transform the API payload into
+the ``my_komatsu_customer_organization_edit`` parameters using the tables
+below, and apply the action. Each step is timed and logged here.
+"""
+import logging
+import time
+
+from dev_mykomatsu_sdk.types import ActionConfig, ActionMode
+from komatsu_idm.request_scope import evict
+
+from customer_app.helpers import perf_diff_time
+from customer_app.models import CustomerOrganizationModel
+from customer_app.serializer import CustomerSerializer
+
+logger = logging.getLogger(__name__)
+
+# TODO: remove renames once renaming done at palantir's end
+# API/serializer field name -> Palantir action parameter name.
+FIELD_RENAMES = {
+    "billing_address1": "billing_address_1",
+    "billing_address2": "billing_address_2",
+    "permission1": "can_access_shop_manuals",
+    "shipping_address1": "shipping_address_1",
+    "shipping_address2": "shipping_address_2",
+    "permission2": "can_order_parts",
+}
+
+# Parameters filled with a placeholder when the payload doesn't carry them.
+FIELD_DEFAULTS = {
+    "secondary_phone_number": "+1 (555) 555-1212",
+    "primary_phone_number": "+1 (555) 555-1212",
+}
+
+# Parameters taken from the current record when the payload doesn't carry them.
+RECORD_FIELDS = ["location_count", "user_count", "machine_count"]
+
+# TODO: update this after rework by frontend team
+# Parameters the frontend sends as "True"/"False" strings.
+BOOLEAN_FIELDS = ["can_order_parts", "can_access_shop_manuals"]
+
+
+def needs_record(data):
+    return any(field not in data for field in RECORD_FIELDS)
+
+
+def edit_payload(data, record=None, **overrides):
+    """
+    Transform ``data`` (API field names) into edit action parameters.
+    ``record`` is only consulted for RECORD_FIELDS missing from ``data``.
+    """
+    payload = dict(data)
+    for api_name, palantir_name in FIELD_RENAMES.items():
+        payload[palantir_name] = payload.pop(api_name)
+    for field, default in FIELD_DEFAULTS.items():
+        payload[field] = payload.pop(field, default)
+    for field in RECORD_FIELDS:
+        if field not in payload:
+            payload[field] = getattr(record, field)
+    for field in BOOLEAN_FIELDS:
+        payload[field] = payload[field] in (True, "True")
+    payload.update(overrides)
+    return payload
+
+
+def record_payload(record, **overrides):
+    """
+    Edit action parameters that rewrite ``record`` as-is, plus ``overrides``.
+    """
+    return edit_payload(
+        CustomerSerializer(record._asdict()).data, record, **overrides
+    )
+
+
+def apply_edit(sdk_client, pk, payload):
+    sdk_client.ontology.actions.my_komatsu_customer_organization_edit(
+        my_komatsu_customer_organization=pk,
+        action_config=ActionConfig(mode=ActionMode.APPLY),
+        **payload
+    )
+
+
+def write_customer(sdk_client, pk, data=None, record=None, **overrides):
+    """
+    Run the full pipeline for one customer and return the applied payload.
+
+    With ``data`` the payload comes from the request and the record is only
+    fetched if ``data`` lacks one of RECORD_FIELDS; without it the current
+    record is rewritten with ``overrides`` applied.
+    """
+    performance = {}
+    start_time = time.time()
+    if record is None and (data is None or needs_record(data)):
+        record = CustomerOrganizationModel.get_object(pk)
+        performance["fetch"] = perf_diff_time(start_time, time.time())
+
+    start_time = time.time()
+    if data is None:
+        payload = record_payload(record, **overrides)
+    else:
+        payload = edit_payload(data, record, **overrides)
+    performance["transform"] = perf_diff_time(start_time, time.time())
+
+    start_time = time.time()
+    apply_edit(sdk_client, pk, payload)
+    # The memoized record is stale now.
+    evict(CustomerOrganizationModel.scope_key(pk))
+    performance["apply"] = perf_diff_time(start_time, time.time())
+
+    logger.info("customer write %s: %s", pk, performance)
+    return payload
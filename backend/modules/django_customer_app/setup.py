@@ -1,4 +1,4 @@
-from setuptools import setup
+from setuptools import find_packages, setup
 from setuptools.command.build import build
 
 
@@ -12,7 +12,7 @@ class BuildCommand(build):
 setup(
     name="cb_django_customer_app",
     version="0.1",
-    packages=["customer_app"],
+    packages=find_packages(),
     install_requires=[],
     cmdclass={"build": BuildCommand},
 )
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+Local stand-in for the Entra token endpoint and the parts of Microsoft Graph
+used by provisioning: ``$batch`` with ``POST /users``, ``GET /users/{upn}``
+and ``POST /users/{id}/authentication/emailMethods``. Users live in memory.
+
+Point ``ENTRA_LOGIN_URL`` at ``stub.url`` and ``ENTRA_GRAPH_URL`` at
+``stub.graph_url`` (or run ``manage.py run_graph_stub``) to exercise
+provisioning without touching a real tenant.
+"""
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+GRAPH_PATH = "/v1.0"
+
+
+def graph_error(status, code, message, details=None):
+    body = {"error": {"code": code, "message": message}}
+    if details:
+        body["error"]["details"] = [{"code": details, "message": message}]
+    return status, {}, body
+
+
+class GraphStub:
+    """
+    ``throttle`` makes that many sub-requests answer ``429`` with
+    ``Retry-After: retry_after`` before they are processed.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, throttle=0, retry_after=0):
+        self.users = {}
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.batches = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def graph_url(self):
+        return f"{self.url}{GRAPH_PATH}"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="graph-stub", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_user(self, principal_name, **fields):
+        user = {"id": str(uuid.uuid4()), "userPrincipalName": principal_name, **fields}
+        with self._lock:
+            self.users[principal_name] = user
+        return user
+
+    def user_by_id(self, user_id):
+        return next((u for u in self.users.values() if u["id"] == user_id), None)
+
+    def handle(self, method, path, body):
+        """
+        ``(status, headers, body)`` for one Graph request (``path`` relative to
+        ``GRAPH_PATH``).
+        """
+        path = urlsplit(path).path
+        with self._lock:
+            if self.throttle:
+                self.throttle -= 1
+                return (
+                    429,
+                    {"Retry-After": str(self.retry_after)},
+                    {"error": {"code": "TooManyRequests", "message": "Throttled"}},
+                )
+
+            parts = [unquote(part) for part in path.strip("/").split("/")]
+            if method == "POST" and parts == ["users"]:
+                principal_name = body.get("userPrincipalName")
+                if principal_name in self.users:
+                    return graph_error(
+                        400,
+                        "Request_BadRequest",
+                        "Another object with the same value for property "
+                        "userPrincipalName already exists.",
+                        details="ObjectConflict",
+                    )
+                user = {"id": str(uuid.uuid4()), **body, "emailMethods": []}
+                self.users[principal_name] = user
+                return 201, {}, {"id": user["id"], "userPrincipalName": principal_name}
+
+            if method == "GET" and len(parts) == 2 and parts[0] == "users":
+                user = self.users.get(parts[1]) or self.user_by_id(parts[1])
+                if user is None:
+                    return graph_error(404, "Request_ResourceNotFound", "Not found")
+                return 200, {}, {"id": user["id"]}
+
+            if (
+                method == "POST"
+                and len(parts) == 4
+                and parts[0] == "users"
+                and parts[2:] == ["authentication", "emailMethods"]
+            ):
+                user = self.user_by_id(parts[1])
+                if user is None:
+                    return graph_error(404, "Request_ResourceNotFound", "Not found")
+                methods = user.setdefault("emailMethods", [])
+                if methods:
+                    return graph_error(
+                        409, "conflict", "An email method already exists."
+                    )
+                methods.append(body["emailAddress"])
+                return 201, {}, {"id": str(uuid.uuid4()), **body}
+
+        return graph_error(400, "BadRequest", f"Unsupported: {method} {path}")
+
+    def handle_batch(self, body):
+        self.batches += 1
+        responses = []
+        for sub_request in body["requests"]:
+            status, headers, sub_body = self.handle(
+                sub_request["method"], sub_request["url"], sub_request.get("body") or {}
+            )
+            responses.append(
+                {
+                    "id": sub_request["id"],
+                    "status": status,
+                    "headers": headers,
+                    "body": sub_body,
+                }
+            )
+        return 200, {}, {"responses": responses}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, headers, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    return json.loads(raw or b"{}")
+                return raw.decode()
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def _dispatch(self, method):
+                body = self._body()
+                if self.path.endswith("/oauth2/v2.0/token"):
+                    return self._reply(
+                        200,
+                        {},
+                        {
+                            "token_type": "Bearer",
+                            "access_token": "graph-stub-token",
+                            "expires_in": 3600,
+                        },
+                    )
+                if not self.path.startswith(GRAPH_PATH):
+                    return self._reply(*graph_error(404, "NotFound", self.path))
+                path = self.path[len(GRAPH_PATH):]
+                if method == "POST" and path == "/$batch":
+                    return self._reply(*stub.handle_batch(body))
+                return self._reply(*stub.handle(method, path, body))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,160 @@
+"""
+Shared HTTP layer for outbound calls to Palantir, Entra and Microsoft Graph.
+
+One pooled ``requests.Session`` per process keeps connections alive between
+calls. ``request`` adds default timeouts, retries 429/5xx with jittered
+exponential backoff, and records per-endpoint latency (see ``latency_stats``),
+which is logged every ``IDM_HTTP_STATS_LOG_INTERVAL`` seconds.
+"""
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Statuses that mean the server didn't act on the request, so even a
+# non-idempotent call (e.g. creating a user) can safely be sent again.
+UNPROCESSED_STATUSES = {429, 503}
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+
+_latency = {}
+_latency_lock = threading.Lock()
+_latency_logged_at = time.time()
+
+
+def session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = getattr(settings, "IDM_HTTP_POOL_SIZE", 20)
+                adapter = HTTPAdapter(
+                    pool_connections=pool_size, pool_maxsize=pool_size
+                )
+                new_session = requests.Session()
+                new_session.mount("https://", adapter)
+                new_session.mount("http://", adapter)
+                _session = new_session
+    return _session
+
+
+def max_retry_delay():
+    return getattr(settings, "IDM_HTTP_MAX_RETRY_DELAY", 30)
+
+
+def retry_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number ``attempt`` (from 0): the server's
+    ``Retry-After`` when it sent one in seconds, jittered backoff otherwise,
+    never more than ``IDM_HTTP_MAX_RETRY_DELAY``. None when ``Retry-After``
+    asks for longer than that, meaning give up rather than park the thread.
+    """
+    max_delay = max_retry_delay()
+    if retry_after and str(retry_after).isdigit():
+        retry_after = int(retry_after)
+        return retry_after if retry_after <= max_delay else None
+    backoff = getattr(settings, "IDM_HTTP_BACKOFF", 0.5)
+    # Full jitter: callers that failed together don't retry together.
+    return random.uniform(0, min(backoff * 2 ** attempt, max_delay))
+
+
+def _record(endpoint, elapsed, failed):
+    global _latency_logged_at
+    interval = getattr(settings, "IDM_HTTP_STATS_LOG_INTERVAL", 300)
+    with _latency_lock:
+        stats = _latency.setdefault(
+            endpoint, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+        )
+        stats["count"] += 1
+        stats["errors"] += int(failed)
+        stats["total_ms"] += elapsed * 1000
+        stats["max_ms"] = max(stats["max_ms"], elapsed * 1000)
+        log_now = bool(interval) and time.time() - _latency_logged_at >= interval
+        if log_now:
+            _latency_logged_at = time.time()
+    if log_now:
+        logger.info("Outbound HTTP latency: %s", json.dumps(latency_stats()))
+
+
+def latency_stats():
+    """
+    ``{endpoint: {"count", "errors", "avg_ms", "max_ms"}}`` since process start.
+    Every attempt, including retries, counts.
+    """
+    with _latency_lock:
+        return {
+            endpoint: {
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "avg_ms": round(stats["total_ms"] / stats["count"], 1),
+                "max_ms": round(stats["max_ms"], 1),
+            }
+            for endpoint, stats in _latency.items()
+        }
+
+
+def request(method, url, endpoint, idempotent=None, **kwargs):
+    """
+    Send a request through the shared session and return the response
+    (without raising for status; callers still call ``raise_for_status``).
+
+    ``endpoint`` names the call in ``latency_stats``. Non-idempotent methods
+    are only retried on UNPROCESSED_STATUSES unless ``idempotent=True``.
+    """
+    if idempotent is None:
+        idempotent = method.upper() in ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+    retry_statuses = RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES
+    retries = getattr(settings, "IDM_HTTP_RETRIES", 3)
+    kwargs.setdefault(
+        "timeout",
+        (
+            getattr(settings, "IDM_HTTP_CONNECT_TIMEOUT", 3.05),
+            getattr(settings, "IDM_HTTP_READ_TIMEOUT", 30),
+        ),
+    )
+
+    attempt = 0
+    while True:
+        start_time = time.time()
+        response = None
+        try:
+            response = session().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            _record(endpoint, time.time() - start_time, True)
+            # A non-idempotent call may have reached the server; don't resend it.
+            if attempt >= retries or not idempotent:
+                raise
+        else:
+            failed = response.status_code >= 400
+            _record(endpoint, time.time() - start_time, failed)
+            if response.status_code not in retry_statuses or attempt >= retries:
+                return response
+        retry_after = (
+            response.headers.get("Retry-After") if response is not None else None
+        )
+        delay = retry_delay(attempt, retry_after)
+        if delay is None:
+            logger.warning(
+                "%s asked to retry after %ss, giving up", endpoint, retry_after
+            )
+            return response
+        time.sleep(delay)
+        attempt += 1
+
+
+def get(url, endpoint, **kwargs):
+    return request("GET", url, endpoint, **kwargs)
+
+
+def post(url, endpoint, **kwargs):
+    return request("POST", url, endpoint, **kwargs)
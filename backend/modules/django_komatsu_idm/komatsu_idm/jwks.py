@@ -0,0 +1,154 @@
+"""
+In-process caches for JWT verification: the signing keys published in a JWKS
+document (parsed once, looked up by ``kid``) and the claims of tokens that
+already passed verification (kept until they expire).
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from django.conf import settings
+
+from komatsu_idm import http
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownSigningKey(Exception):
+    def __init__(self, kid):
+        self.message = f"No signing key with kid: {kid}"
+        super().__init__(self.message)
+
+
+class JWKSCache:
+    """
+    RSA public keys from ``url`` keyed by ``kid``. The document is fetched on
+    first use, again once it is older than ``ttl`` seconds, and again when a
+    token names a kid we don't know (key rotation). Fetch attempts, failed or
+    not, are at least ``min_refresh_interval`` seconds apart so garbage kids
+    or an unreachable endpoint can't trigger a fetch per request. When a
+    refresh fails the keys already fetched keep being served.
+    """
+
+    def __init__(self, url, ttl=None, min_refresh_interval=None):
+        self.url = url
+        self.ttl = ttl if ttl is not None else getattr(settings, "JWT_JWKS_TTL", 3600)
+        self.min_refresh_interval = (
+            min_refresh_interval
+            if min_refresh_interval is not None
+            else getattr(settings, "JWT_JWKS_MIN_REFRESH_INTERVAL", 60)
+        )
+        self._keys = {}
+        self._fetched_at = None
+        self._attempted_at = None
+        self._lock = threading.Lock()
+
+    def get_key(self, kid):
+        key = self._keys.get(kid)
+        if key is not None:
+            if self._is_stale() and self._lock.acquire(blocking=False):
+                # Known kid, old document: refresh, but let other threads keep
+                # using the cached key meanwhile, and keep it if this fails.
+                try:
+                    self._try_refresh()
+                finally:
+                    self._lock.release()
+                key = self._keys.get(kid, key)
+            return key
+
+        # Only a kid we don't know has to wait for a refresh.
+        with self._lock:
+            key = self._keys.get(kid)
+            if key is None:
+                self._try_refresh()
+                key = self._keys.get(kid)
+        if key is None:
+            raise UnknownSigningKey(kid)
+        return key
+
+    def _is_stale(self):
+        return self._fetched_at is None or time.time() - self._fetched_at > self.ttl
+
+    def _may_refresh(self):
+        return (
+            self._attempted_at is None
+            or time.time() - self._attempted_at > self.min_refresh_interval
+        )
+
+    def _try_refresh(self):
+        if not self._may_refresh():
+            return
+        self._attempted_at = time.time()
+        try:
+            self._refresh()
+        except Exception as e:
+            logger.warning("Could not refresh JWKS from %s: %s", self.url, e)
+
+    def _refresh(self):
+        response = http.get(self.url, "jwks")
+        response.raise_for_status()
+        keys = {}
+        for jwk in response.json()["keys"]:
+            if jwk.get("kty") == "RSA" and "kid" in jwk:
+                keys[jwk["kid"]] = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+        self._keys = keys
+        self._fetched_at = time.time()
+
+
+_jwks_caches = {}
+_jwks_caches_lock = threading.Lock()
+
+
+def get_jwks(url):
+    """
+    Process-wide JWKSCache for ``url``.
+    """
+    with _jwks_caches_lock:
+        if url not in _jwks_caches:
+            _jwks_caches[url] = JWKSCache(url)
+        return _jwks_caches[url]
+
+
+class ClaimsCache:
+    """
+    Bounded LRU of verified claims keyed by the SHA-256 of the token. Entries
+    are dropped once the token's ``exp`` has passed.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or getattr(settings, "JWT_CLAIMS_CACHE_SIZE", 1024)
+        self._claims = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def token_hash(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        key = self.token_hash(token)
+        with self._lock:
+            claims = self._claims.get(key)
+            if claims is None:
+                return None
+            if claims.get("exp", 0) <= time.time():
+                del self._claims[key]
+                return None
+            self._claims.move_to_end(key)
+            return dict(claims)
+
+    def set(self, token, claims):
+        if "exp" not in claims:
+            return
+        key = self.token_hash(token)
+        with self._lock:
+            self._claims[key] = dict(claims)
+            self._claims.move_to_end(key)
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+
+
+claims_cache = ClaimsCache()
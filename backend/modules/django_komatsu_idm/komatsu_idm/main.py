@@ -1,13 +1,14 @@
 import requests
-from datetime import datetime, timedelta
+import threading
 from dev_mykomatsu_sdk import FoundryClient
 from dev_mykomatsu_sdk.core.api import UserTokenAuth
 import jwt
 from cryptography.hazmat.primitives import serialization
-import json
-from sendgrid.helpers.mail import Mail
-from sendgrid import SendGridAPIClient
 from django.conf import settings
+from komatsu_idm import http
+from komatsu_idm.jwks import get_jwks
+from komatsu_idm.request_scope import memoize
+from komatsu_idm.tokens import TokenManager, shared_cache_key
 
 
 class SDKClient:
@@ -16,9 +17,13 @@ class SDKClient:
         self._client_secret = client_secret
         self.auth_url = f"{hostname}/multipass/api/oauth2/token"
         self._token = None
-        self.token_expiry = None
         self.hostname = hostname
         self.client = None
+        self.tokens = TokenManager(
+            self.request_new_token,
+            cache_key=shared_cache_key("palantir", client_id),
+        )
+        self._client_lock = threading.Lock()
 
     def request_new_token(self):
         try:
@@ -29,7 +34,9 @@ class SDKClient:
                 "client_secret": self._client_secret,
                 "scope": "api:read-data",
             }
-            response = requests.post(url=self.auth_url, data=post_data)
+            response = http.post(
+                self.auth_url, "palantir_token", data=post_data, idempotent=True
+            )
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
@@ -38,23 +45,23 @@ class SDKClient:
 
     def authenticate(self):
         try:
-            # Authenticate using the obtained access token
-            token_data = self.request_new_token()
-            self._token = token_data["access_token"]
-            expires_in = token_data["expires_in"]
-            self.token_expiry = datetime.now() + timedelta(seconds=expires_in - 300)
-            return self._token
+            # Current access token, refreshed by the token manager as needed
+            return self.tokens.token()
         except Exception as e:
             print(f"Authentication error: {e}")
             raise
 
     def get_client(self):
-        # Retrieve the SDK client, renewing the token if necessary
-        if not self._token or datetime.now() > self.token_expiry:
-            self.client = FoundryClient(
-                auth=UserTokenAuth(hostname=self.hostname, token=self.authenticate()),
-                hostname=self.hostname,
-            )
+        # Retrieve the SDK client, rebuilding it when the token has been renewed
+        token = self.authenticate()
+        if token != self._token:
+            with self._client_lock:
+                if token != self._token:
+                    self.client = FoundryClient(
+                        auth=UserTokenAuth(hostname=self.hostname, token=token),
+                        hostname=self.hostname,
+                    )
+                    self._token = token
         return self.client
 
 
@@ -63,26 +70,26 @@ class EntraAuth:
         self._client_id = client_id
         self._client_secret = client_secret
         self.tenant_id = tenant_id
-        self.auth_url = (
-            f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
+        # Overridable so a local Graph stand-in can be used in tests.
+        login_url = getattr(settings, "ENTRA_LOGIN_URL", "https://login.microsoftonline.com")
+        self.graph_url = getattr(
+            settings, "ENTRA_GRAPH_URL", "https://graph.microsoft.com/v1.0"
         )
-        self.user_url = "https://graph.microsoft.com/v1.0/users"
+        self.auth_url = f"{login_url}/{self.tenant_id}/oauth2/v2.0/token"
+        self.user_url = f"{self.graph_url}/users"
         self.callback_url = "https://mykomatsuwebapp.azurewebsites.net/my-fleet"
         self.public_key_url = (
             f"https://externalkomatsu.ciamlogin.com/{self.tenant_id}/discovery/keys"
         )
-        self._token = None
-        self.token_expiry = None
+        self.tokens = TokenManager(
+            self.request_new_token,
+            cache_key=shared_cache_key("entra", client_id),
+        )
 
     def authenticate(self):
         try:
-            # Authenticate using the obtained access token
-            if not self._token or datetime.now() > self.token_expiry:
-                token_data = self.request_new_token()
-                self._token = token_data["access_token"]
-                expires_in = token_data["expires_in"]
-                self.token_expiry = datetime.now() + timedelta(seconds=expires_in)
-            return self._token
+            # Current access token, refreshed by the token manager as needed
+            return self.tokens.token()
         except Exception as e:
             print(f"Authentication error: {e}")
             raise
@@ -94,7 +101,13 @@ class EntraAuth:
             headers = {
                 "Content-Type": "application/x-www-form-urlencoded",
             }
-            response = requests.post(url=self.auth_url, headers=headers, data=data)
+            response = http.post(
+                self.auth_url,
+                "entra_token",
+                headers=headers,
+                data=data,
+                idempotent=True,
+            )
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
@@ -109,8 +122,10 @@ class EntraAuth:
                 "Content-Type": "application/json",
             }
             user_payload = {"emailAddress": f"{email}"}
-            request_url = f"https://graph.microsoft.com/v1.0/users/{user_id}/authentication/emailMethods"
-            response = requests.post(request_url, headers=headers, json=user_payload)
+            request_url = f"{self.user_url}/{user_id}/authentication/emailMethods"
+            response = http.post(
+                request_url, "graph_email_method", headers=headers, json=user_payload
+            )
             response.raise_for_status()
         except requests.RequestException as e:
             print(f"Error: {e}")
@@ -120,23 +135,38 @@ class EntraAuth:
     def get_public_key(
         self,
     ):
-        res = requests.get(self.public_key_url)
-        keys = res.json()["keys"]
-
         token_headers = jwt.get_unverified_header(self.authenticate())
         token_kid = token_headers["kid"]
-        public_key = None
-        for key in keys:
-            if key["kid"] == token_kid:
-                public_key = key
-
-        rsa_pem_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(public_key))
+        rsa_pem_key = get_jwks(self.public_key_url).get_key(token_kid)
         rsa_pem_key_bytes = rsa_pem_key.public_bytes(
             encoding=serialization.Encoding.PEM,
             format=serialization.PublicFormat.SubjectPublicKeyInfo,
         )
         return rsa_pem_key_bytes
 
+    def user_payload(self, first_name, last_name, email, principal_name):
+        """
+        Graph ``POST /users`` body for a new external (email sign-in) user.
+        """
+        return {
+            "accountEnabled": True,
+            "displayName": f"{first_name} {last_name}",
+            "mailNickname": f"{first_name}",
+            "userPrincipalName": f"{principal_name}",
+            "passwordProfile": {
+                "forceChangePasswordNextSignIn": True,
+                "forceChangePasswordNextSignInWithMfa": False,
+                "password": "xWwvJ]6NMw+bW",
+            },
+            "identities": [
+                {
+                    "signInType": "emailAddress",
+                    "issuer": "externalkomatsu.onmicrosoft.com",
+                    "issuerAssignedId": f"{email}",
+                }
+            ],
+        }
+
     def create_user(self, first_name, last_name, email, principal_name):
         try:
             # Create a new user and call the email_method_call function
@@ -144,25 +174,10 @@ class EntraAuth:
                 "Authorization": f"Bearer {self.authenticate()}",
                 "Content-Type": "application/json",
             }
-            user_payload = {
-                "accountEnabled": True,
-                "displayName": f"{first_name} {last_name}",
-                "mailNickname": f"{first_name}",
-                "userPrincipalName": f"{principal_name}",
-                "passwordProfile": {
-                    "forceChangePasswordNextSignIn": True,
-                    "forceChangePasswordNextSignInWithMfa": False,
-                    "password": "xWwvJ]6NMw+bW",
-                },
-                "identities": [
-                    {
-                        "signInType": "emailAddress",
-                        "issuer": "externalkomatsu.onmicrosoft.com",
-                        "issuerAssignedId": f"{email}",
-                    }
-                ],
-            }
-            response = requests.post(self.user_url, headers=headers, json=user_payload)
+            user_payload = self.user_payload(first_name, last_name, email, principal_name)
+            response = http.post(
+                self.user_url, "graph_create_user", headers=headers, json=user_payload
+            )
             response.raise_for_status()
             user_id = response.json()["id"]
             self.email_method_call(email, user_id)
@@ -174,27 +189,17 @@ class EntraAuth:
 
 
 def SendDynamic(sender, recipient_list, dynamic_data):
-    """Send a dynamic email to a list of email addresses
+    """Queue a dynamic email to a list of email addresses
 
-    :returns API response code
-    :raises Exception e: raises an exception"""
-
-    # create Mail object and populate
-    message = Mail(from_email=sender, to_emails=recipient_list)
+    The email is stored in the outbox and sent in the background, batched with
+    other emails using the same template.
 
-    # pass custom values for our HTML placeholders
-    message.dynamic_template_data = dynamic_data
-    message.template_id = settings.SENDGRID_TEMPLATE_ID
-
-    # create our sendgrid client object, pass it our key, then send and return our response objects
-    try:
-        sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
-        response = sg.send(message)
-        print("Dynamic Messages Sent!")
-    except Exception as e:
-        print("Error: {0}".format(e))
+    :returns outbox id
+    :raises Exception e: raises an exception"""
+    # Imported here: the outbox needs the app registry, this module doesn't.
+    from modules.django_komatsu_idm.komatsu_idm.outbox.dispatch import enqueue_email
 
-    return str(response.status_code)
+    return enqueue_email(sender, recipient_list, dynamic_data)
 
 
 try:
@@ -211,8 +216,9 @@ try:
         hostname=settings.PALANTIR_HOSTNAME,
     )
 
-    # Retrieve the SDK client
-    sdk_client = client.get_client
+    # Retrieve the SDK client (once per request, see komatsu_idm.request_scope)
+    def sdk_client():
+        return memoize("sdk_client", client.get_client)
 
 except Exception as e:
     print(f"Error: {e}")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from modules.django_komatsu_idm.komatsu_idm.outbox.dispatch import (
+    dispatch_pending,
+    run_dispatcher,
+)
+
+
+class Command(BaseCommand):
+    help = "Send queued outbox emails through SendGrid."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send what is due now and exit instead of dispatching forever.",
+        )
+        parser.add_argument(
+            "--interval",
+            dest="interval",
+            type=float,
+            help="Seconds between polls when running forever "
+            "(default EMAIL_OUTBOX_POLL_INTERVAL).",
+        )
+
+    def handle(self, *args, **options):
+        if not options["once"]:
+            run_dispatcher(poll_interval=options["interval"])
+            return
+
+        sent = 0
+        while True:
+            batch = dispatch_pending()
+            if not batch:
+                break
+            sent += batch
+        self.stdout.write(f"Sent {sent} email(s).")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from komatsu_idm.middleware.palantir import invalidate_palantir_user
+
+
+class Command(BaseCommand):
+    help = "Drop cached Palantir users so their next request refetches them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "entra_ids",
+            nargs="+",
+            help="Entra object ids (JWT 'oid') of the users to invalidate.",
+        )
+
+    def handle(self, *args, **options):
+        for entra_id in options["entra_ids"]:
+            invalidate_palantir_user(entra_id)
+        self.stdout.write(f"Invalidated {len(options['entra_ids'])} cached user(s).")
@@ -0,0 +1,63 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from komatsu_idm.main import entra_auth
+from komatsu_idm.provisioning import ProvisioningError, provision_users
+
+
+def read_users(path):
+    """
+    Users from a CSV file with a first_name,last_name,email,principal_name
+    header, or a JSON list of objects with those keys.
+    """
+    with open(path, newline="") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        return list(csv.DictReader(f))
+
+
+class Command(BaseCommand):
+    help = "Create Entra users in bulk with Graph $batch requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("users_file", help="CSV or JSON file of users to create.")
+        parser.add_argument(
+            "--checkpoint",
+            dest="checkpoint",
+            help="Progress file; rerun with the same file to resume "
+            "(default: <users_file>.checkpoint.json).",
+        )
+        parser.add_argument(
+            "--workers",
+            dest="workers",
+            type=int,
+            help="Concurrent $batch requests (default ENTRA_PROVISION_MAX_WORKERS).",
+        )
+
+    def handle(self, *args, **options):
+        users_file = options["users_file"]
+        checkpoint = options["checkpoint"] or f"{users_file}.checkpoint.json"
+        try:
+            report = provision_users(
+                entra_auth,
+                read_users(users_file),
+                checkpoint_path=checkpoint,
+                max_workers=options["workers"],
+            )
+        except (OSError, ValueError, ProvisioningError) as e:
+            raise CommandError(str(e))
+
+        failed = {name: entry for name, entry in report.items() if entry.get("error")}
+        self.stdout.write(
+            json.dumps(
+                {
+                    "users": len(report),
+                    "provisioned": len(report) - len(failed),
+                    "failed": failed,
+                    "checkpoint": checkpoint,
+                },
+                indent=2,
+            )
+        )
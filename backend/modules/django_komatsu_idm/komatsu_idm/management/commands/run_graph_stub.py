@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from komatsu_idm.graph_stub import GraphStub
+
+
+class Command(BaseCommand):
+    help = "Serve a local stand-in for the Entra token endpoint and Microsoft Graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", dest="port", type=int, default=8765)
+        parser.add_argument(
+            "--throttle",
+            dest="throttle",
+            type=int,
+            default=0,
+            help="Answer this many sub-requests with 429 before serving them.",
+        )
+        parser.add_argument(
+            "--retry-after",
+            dest="retry_after",
+            type=int,
+            default=1,
+            help="Retry-After seconds sent with throttled sub-requests.",
+        )
+
+    def handle(self, *args, **options):
+        stub = GraphStub(
+            port=options["port"],
+            throttle=options["throttle"],
+            retry_after=options["retry_after"],
+        ).start()
+        self.stdout.write(
+            f"ENTRA_LOGIN_URL={stub.url}\nENTRA_GRAPH_URL={stub.graph_url}"
+        )
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            stub.stop()
@@ -2,31 +2,63 @@
 Custom JWT middleware to put JWT data in request 
 so it's available anywhere in views or templates.
 """
+import asyncio
+from asgiref.sync import sync_to_async
 from django.conf import settings
 import jwt
+from komatsu_idm.jwks import claims_cache, get_jwks
 
 
-# This needs to be Entra secret key
-jwt_secret_key = settings.CLIENT_SECRET_ENTRA
 client_id = settings.CLIENT_ID_ENTRA
 tenant_id = settings.TENANT_ID_ENTRA
+jwks_url = getattr(
+    settings,
+    "JWT_JWKS_URL",
+    f"https://externalkomatsu.ciamlogin.com/{tenant_id}/discovery/keys",
+)
+# "issuer" of the tenant's OpenID metadata; External ID (CIAM) tokens aren't
+# issued by sts.windows.net.
+issuer = getattr(
+    settings,
+    "JWT_ISSUER",
+    f"https://{tenant_id}.ciamlogin.com/{tenant_id}/v2.0",
+)
 
 # Test sandbox that gets test user from entra and returns the JSON data fields.
 # https://sb-sample1app.azurewebsites.net/
 
 
 class JwtMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Lets Django see __call__ as a coroutine function under ASGI.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
 
     def __call__(self, request):
         """
         Get HTTP_AUTHORIZATION bearer token string, decode it, and add data to request for use.
         """
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
         http_auth_string = request.META.get("HTTP_AUTHORIZATION", None)
         request.jwt_data = get_jwt_data(http_auth_string)
         return self.get_response(request)
 
+    async def __acall__(self, request):
+        """
+        Async version of __call__. Decoding may fetch the signing keys, so it
+        runs on a worker thread instead of the event loop.
+        """
+        http_auth_string = request.META.get("HTTP_AUTHORIZATION", None)
+        request.jwt_data = await sync_to_async(get_jwt_data, thread_sensitive=False)(
+            http_auth_string
+        )
+        return await self.get_response(request)
+
 
 def get_jwt_data(http_auth_string):
     token_data = {}
@@ -44,18 +76,22 @@ def get_jwt_data(http_auth_string):
 
 def decode_token(token):
     """
-    Take inbound token string, decode, and return it.
+    Take inbound token string, verify its signature against the cached JWKS
+    signing keys, decode, and return it. Verified claims are reused until the
+    token expires.
     """
-    issuer = "https://sts.windows.net/{tenant_id}/".format(tenant_id=tenant_id)
+    decoded = claims_cache.get(token)
+    if decoded is not None:
+        return decoded
+
+    kid = jwt.get_unverified_header(token).get("kid")
     decoded = jwt.decode(
         token,
-        # public_key,
-        jwt_secret_key,
-        verify=True,
-        options={"verify_signature": False},
+        get_jwks(jwks_url).get_key(kid),
         algorithms=["RS256"],
         audience=[client_id],
         issuer=issuer,
     )
+    claims_cache.set(token, decoded)
 
     return decoded
@@ -2,23 +2,49 @@
 Custom Palantir middleware to retrieve user data from Palantir and put
 in request object so it's available anywhere in views or templates.
 """
+import asyncio
+import contextvars
+import copy
+import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
 from dev_mykomatsu_sdk.ontology.objects import MyKomatsuUser, MyKomatsuRole
 from komatsu_idm.main import sdk_client as client
 
+logger = logging.getLogger(__name__)
+
 
 class PalantirUserMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Lets Django see __call__ as a coroutine function under ASGI.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
 
     def __call__(self, request):
         """
         Try and get Palantir user from JWT 'oid' param and add PalantirUser to request object.
+        The lookup runs on first access, so views that never use it don't pay for it.
         """
-        request.palantir_user = get_palantir_user(request)
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        request.palantir_user = SimpleLazyObject(lambda: get_palantir_user(request))
         return self.get_response(request)
 
+    async def __acall__(self, request):
+        """
+        Async version of __call__. The user is still resolved lazily, by
+        whichever (worker) thread first reads it, never on the event loop.
+        """
+        request.palantir_user = SimpleLazyObject(lambda: get_palantir_user(request))
+        return await self.get_response(request)
+
 
 class PalantirUser:
     """
@@ -54,6 +80,21 @@ class PalantirUser:
         self.location_ids = []
         self.branch_ids = []
 
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuild a user from the output of ``to_dict`` without touching Palantir.
+        """
+        palantir_user = cls()
+        palantir_user.set_properties(copy.deepcopy(data))
+        return palantir_user
+
+    def to_dict(self):
+        """
+        The user and role data everything else is derived from, e.g. for caching.
+        """
+        return copy.deepcopy(self.__user_json)
+
     def set_properties(self, data):
         """
         Check and set props based on init data.
@@ -191,6 +232,22 @@ class PalantirUser:
         return json_data
 
 
+def palantir_user_cache_key(entra_id):
+    return f"komatsu_idm:palantir_user:{entra_id}"
+
+
+def palantir_user_cache_ttl():
+    return getattr(settings, "PALANTIR_USER_CACHE_TTL", 300)
+
+
+def invalidate_palantir_user(entra_id):
+    """
+    Drop the cached user for ``entra_id`` (Entra "object id") so the next request
+    fetches it from Palantir again. Call after changing a user or their roles.
+    """
+    cache.delete(palantir_user_cache_key(entra_id))
+
+
 def get_palantir_user(request):
     palantir_user = PalantirUser()
 
@@ -206,44 +263,17 @@ def get_palantir_user(request):
 
     if jwt_user_id:
         try:
-            sdk_client = client()
-
-            # Try and get "active" user with specified user ID from JWT (oid).
-            palantir_user_data = sdk_client.ontology.objects.MyKomatsuUser.where(
-                MyKomatsuUser.entra_id.__eq__(jwt_user_id)
-                & ~MyKomatsuUser.soft_delete_flag.__eq__(settings.DELETE_FLAG)
-            ).take(1)[0]
-
-            # Get user's roles.
-            palantir_role_data = sdk_client.ontology.objects.MyKomatsuRole.where(
-                MyKomatsuRole.user_id.__eq__(palantir_user_data.user_id)
-            )
-
-            primary_role = {
-                "customerId": None,
-                "distributorId": None,
-            }
+            cache_key = palantir_user_cache_key(jwt_user_id)
+            user_data = cache.get(cache_key)
+            if user_data is not None:
+                return PalantirUser.from_dict(user_data)
 
-            # Loop thru all user roles. If they have a primary, put it into it's own object.
-            # Put ALL OTHER roles into "roles" array.
-            user_roles = []
-            for role in palantir_role_data.iterate():
-                if role._asdict()["id"] == palantir_user_data.home_role_id:
-                    primary_role = role._asdict()
-                else:
-                    user_roles.append(role._asdict())
-
-            # Set user object with returned data and update Palantir user with it.
-            # Then we return Palantir user to be added to request.
-            user_data = palantir_user_data._asdict()
-            user_data["role_data"] = {
-                "primary_user_role": primary_role,
-                "user_roles": user_roles,
-            }
+            user_data = fetch_palantir_user_data(jwt_user_id)
 
             # Update our default palantir user object with data from palantir,
             # Then return it.
             palantir_user.set_properties(user_data)
+            cache.set(cache_key, palantir_user.to_dict(), palantir_user_cache_ttl())
 
         except Exception as ex:
             # TEMP until we get Azure Monitor setup.
@@ -251,3 +281,72 @@ def get_palantir_user(request):
             pass
 
     return palantir_user
+
+
+def fetch_palantir_user_data(jwt_user_id):
+    """
+    Fetch the user with Entra id ``jwt_user_id`` and their roles from Palantir.
+
+    The roles are read by traversing the user -> role link
+    (``PALANTIR_USER_ROLE_LINK``) from the user object set. That doesn't need
+    the user's id, so both queries are sent at once and the lookup takes one
+    round trip. If the SDK has no such link, roles are looked up by
+    ``user_id`` after the user is fetched.
+    """
+    sdk_client = client()
+
+    # Try and get "active" user with specified user ID from JWT (oid).
+    user_set = sdk_client.ontology.objects.MyKomatsuUser.where(
+        MyKomatsuUser.entra_id.__eq__(jwt_user_id)
+        & ~MyKomatsuUser.soft_delete_flag.__eq__(settings.DELETE_FLAG)
+    )
+
+    role_link = getattr(settings, "PALANTIR_USER_ROLE_LINK", "my_komatsu_roles")
+    search_around = getattr(user_set, f"search_around_{role_link}", None)
+    if search_around is not None:
+        palantir_user_data, roles = _user_and_linked_roles(user_set, search_around())
+    else:
+        logger.warning(
+            "MyKomatsuUser has no %r link, fetching roles after the user", role_link
+        )
+        palantir_user_data = user_set.take(1)[0]
+        roles = _role_dicts(
+            sdk_client.ontology.objects.MyKomatsuRole.where(
+                MyKomatsuRole.user_id.__eq__(palantir_user_data.user_id)
+            )
+        )
+
+    primary_role = {
+        "customerId": None,
+        "distributorId": None,
+    }
+
+    # Loop thru all user roles. If they have a primary, put it into it's own object.
+    # Put ALL OTHER roles into "roles" array.
+    user_roles = []
+    for role in roles:
+        if role["id"] == palantir_user_data.home_role_id:
+            primary_role = role
+        else:
+            user_roles.append(role)
+
+    # Set user object with returned data and update Palantir user with it.
+    # Then we return Palantir user to be added to request.
+    user_data = palantir_user_data._asdict()
+    user_data["role_data"] = {
+        "primary_user_role": primary_role,
+        "user_roles": user_roles,
+    }
+    return user_data
+
+
+def _user_and_linked_roles(user_set, role_set):
+    # The SDK can't return users and roles from one query; send both at once.
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        roles = pool.submit(contextvars.copy_context().run, _role_dicts, role_set)
+        palantir_user_data = user_set.take(1)[0]
+        return palantir_user_data, roles.result()
+
+
+def _role_dicts(role_set):
+    return [role._asdict() for role in role_set.iterate()]
@@ -0,0 +1,34 @@
+"""
+Middleware giving every request its own identity map for ontology lookups
+(see komatsu_idm.request_scope). Add it before any middleware that reads
+from Palantir, e.g. PalantirUserMiddleware.
+"""
+import asyncio
+from komatsu_idm.request_scope import close_scope, open_scope
+
+
+class RequestScopeMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Lets Django see __call__ as a coroutine function under ASGI.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = open_scope()
+        try:
+            return self.get_response(request)
+        finally:
+            close_scope(token)
+
+    async def __acall__(self, request):
+        token = open_scope()
+        try:
+            return await self.get_response(request)
+        finally:
+            close_scope(token)
@@ -0,0 +1,4 @@
+# Django models live in the ``outbox`` package and are always imported by
+# their full dotted path so they register exactly once, no matter which name
+# this package was imported under.
+from modules.django_komatsu_idm.komatsu_idm.outbox.models import EmailOutbox  # noqa
@@ -0,0 +1,215 @@
+"""
+Durable email outbox for SendGrid dynamic-template emails.
+
+``enqueue_email`` only writes a row, so callers don't wait on SendGrid. The
+dispatcher claims due rows, groups those sharing a sender and template into
+one SendGrid request (one personalization per row) and sends them with a
+single reused client. It runs in the ``dispatch_email_outbox`` command and,
+if ``EMAIL_OUTBOX_DISPATCH_IN_PROCESS`` is set, on a background thread of the
+web process (started on first enqueue). Any number of dispatchers can run at
+once: each row is claimed by exactly one of them.
+"""
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from sendgrid import SendGridAPIClient
+from sendgrid.helpers.mail import Mail, Personalization, To
+
+from modules.django_komatsu_idm.komatsu_idm.outbox.models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+# SendGrid accepts at most 1000 personalizations per request.
+SENDGRID_PERSONALIZATION_LIMIT = 1000
+
+# 4xx statuses that don't depend on the emails in the request.
+UNSPLIT_STATUSES = {401, 403, 429}
+
+_client = None
+_client_lock = threading.Lock()
+
+_wake = threading.Event()
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def sendgrid_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SendGridAPIClient(settings.SENDGRID_API_KEY)
+    return _client
+
+
+def enqueue_email(sender, recipient_list, dynamic_data, template_id=None):
+    """
+    Store an email for the dispatcher and return its outbox id.
+    """
+    if isinstance(recipient_list, str):
+        recipient_list = [recipient_list]
+    email = EmailOutbox.objects.create(
+        sender=sender,
+        recipients=list(recipient_list),
+        template_id=template_id or settings.SENDGRID_TEMPLATE_ID,
+        dynamic_data=dynamic_data or {},
+    )
+    if getattr(settings, "EMAIL_OUTBOX_DISPATCH_IN_PROCESS", False):
+        transaction.on_commit(wake_dispatcher)
+    return email.id
+
+
+def claim_due(limit):
+    """
+    Mark up to ``limit`` due rows as being sent and return them. Claimed rows
+    become due again after EMAIL_OUTBOX_CLAIM_TIMEOUT seconds in case this
+    dispatcher never finishes them.
+
+    The claim is a single conditional UPDATE that only matches rows still
+    due, tagged with a token of this claim, so concurrent dispatchers never
+    get the same row, on any database (``select_for_update`` is a no-op on
+    SQLite).
+    """
+    now = timezone.now()
+    claim_timeout = getattr(settings, "EMAIL_OUTBOX_CLAIM_TIMEOUT", 600)
+    due = EmailOutbox.objects.filter(
+        status__in=[EmailOutbox.PENDING, EmailOutbox.SENDING],
+        next_attempt_at__lte=now,
+    )
+    candidates = list(
+        due.order_by("next_attempt_at").values_list("id", flat=True)[:limit]
+    )
+    if not candidates:
+        return []
+    claim_id = uuid.uuid4().hex
+    due.filter(id__in=candidates).update(
+        status=EmailOutbox.SENDING,
+        next_attempt_at=now + timedelta(seconds=claim_timeout),
+        claim_id=claim_id,
+    )
+    return list(EmailOutbox.objects.filter(claim_id=claim_id).order_by("id"))
+
+
+def build_message(emails):
+    """
+    One SendGrid message for ``emails``, which share a sender and template.
+    """
+    message = Mail(from_email=emails[0].sender)
+    message.template_id = emails[0].template_id
+    for email in emails:
+        personalization = Personalization()
+        for recipient in email.recipients:
+            personalization.add_to(To(recipient))
+        personalization.dynamic_template_data = email.dynamic_data
+        message.add_personalization(personalization)
+    return message
+
+
+def send_group(emails):
+    """
+    Send ``emails`` as one request and return how many were sent. SendGrid
+    rejects the whole request when one personalization is invalid, so a 4xx
+    for several emails resends them one by one and only the rejected ones are
+    marked failed. Errors that apply to every email (bad credentials,
+    throttling) are not split.
+    """
+    ids = [email.id for email in emails]
+    try:
+        response = sendgrid_client().send(build_message(emails))
+    except Exception as e:
+        status = getattr(e, "status_code", None)
+        if (
+            len(emails) > 1
+            and status
+            and 400 <= status < 500
+            and status not in UNSPLIT_STATUSES
+        ):
+            logger.info(
+                "SendGrid rejected %s outbox emails (%s), sending them one by one",
+                len(emails),
+                status,
+            )
+            return sum(send_group([email]) for email in emails)
+        logger.warning("Sending %s outbox emails failed: %s", len(emails), e)
+        mark_failed(emails, str(e))
+        return 0
+
+    EmailOutbox.objects.filter(id__in=ids).update(
+        status=EmailOutbox.SENT,
+        response_status=str(response.status_code),
+        sent_at=timezone.now(),
+        last_error="",
+    )
+    return len(emails)
+
+
+def mark_failed(emails, error):
+    """
+    Schedule another attempt with exponential backoff, or give up after
+    EMAIL_OUTBOX_MAX_ATTEMPTS.
+    """
+    max_attempts = getattr(settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 5)
+    now = timezone.now()
+    for email in emails:
+        email.attempts += 1
+        email.last_error = error
+        if email.attempts >= max_attempts:
+            email.status = EmailOutbox.FAILED
+        else:
+            email.status = EmailOutbox.PENDING
+            email.next_attempt_at = now + timedelta(seconds=30 * 2 ** email.attempts)
+    EmailOutbox.objects.bulk_update(
+        emails, ["attempts", "last_error", "status", "next_attempt_at"]
+    )
+
+
+def dispatch_pending(limit=None):
+    """
+    Send every due email (up to ``limit``) and return how many were sent.
+    """
+    limit = limit or getattr(settings, "EMAIL_OUTBOX_BATCH_SIZE", 500)
+    groups = {}
+    for email in claim_due(limit):
+        groups.setdefault((email.sender, email.template_id), []).append(email)
+
+    sent = 0
+    for emails in groups.values():
+        for i in range(0, len(emails), SENDGRID_PERSONALIZATION_LIMIT):
+            sent += send_group(emails[i : i + SENDGRID_PERSONALIZATION_LIMIT])
+    return sent
+
+
+def run_dispatcher(poll_interval=None, stop_event=None):
+    """
+    Dispatch forever: right after each wake-up and every ``poll_interval``
+    seconds otherwise (retries come due without a wake-up).
+    """
+    poll_interval = poll_interval or getattr(settings, "EMAIL_OUTBOX_POLL_INTERVAL", 5)
+    while not (stop_event and stop_event.is_set()):
+        _wake.clear()
+        close_old_connections()
+        try:
+            while dispatch_pending():
+                pass
+        except Exception as e:
+            logger.exception("Email outbox dispatch failed: %s", e)
+        _wake.wait(poll_interval)
+
+
+def wake_dispatcher():
+    """
+    Start the in-process dispatcher thread if needed and let it run now.
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = threading.Thread(
+                target=run_dispatcher, name="email-outbox", daemon=True
+            )
+            _dispatcher.start()
+    _wake.set()
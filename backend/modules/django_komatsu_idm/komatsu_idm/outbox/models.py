@@ -0,0 +1,48 @@
+from django.db import models
+from django.utils import timezone
+
+
+class EmailOutbox(models.Model):
+    """
+    A dynamic-template email waiting to be (or already) handed to SendGrid.
+
+    Rows are written by ``SendDynamic`` and sent by the outbox dispatcher, which
+    claims due rows by pushing ``next_attempt_at`` forward while it works on
+    them, so a dispatcher that dies mid-send doesn't strand its rows.
+    ``claim_id`` tells which claim a row was last handed to.
+    """
+
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENDING, "Sending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    sender = models.CharField(max_length=255)
+    recipients = models.JSONField()
+    template_id = models.CharField(max_length=255)
+    dynamic_data = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    response_status = models.CharField(max_length=16, blank=True, default="")
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    claim_id = models.CharField(max_length=32, blank=True, default="", db_index=True)
+
+    class Meta:
+        app_label = "komatsu_idm"
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"], name="komatsu_idm_outbox_due_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.template_id} -> {', '.join(self.recipients)} ({self.status})"
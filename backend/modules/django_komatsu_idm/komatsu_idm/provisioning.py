@@ -0,0 +1,277 @@
+"""
+Bulk Entra user provisioning through Microsoft Graph JSON batching.
+
+Provisioning runs in two phases, each split into ``$batch`` requests of up to
+GRAPH_BATCH_LIMIT sub-requests sent on a bounded thread pool:
+
+1. create the users that have no Entra id yet (``POST /users``); a user
+   that already exists (created by a run that stopped before checkpointing
+   it) is looked up by ``userPrincipalName`` and counted as created,
+2. add the email authentication method for users created without one.
+
+Progress is written to a JSON checkpoint file after every batch, keyed by
+``principal_name``, so a run that stops part way can be started again with the
+same file and only does the remaining work.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from django.conf import settings
+
+from komatsu_idm import http
+
+logger = logging.getLogger(__name__)
+
+# Graph accepts at most 20 sub-requests per $batch.
+GRAPH_BATCH_LIMIT = 20
+
+# Sub-request statuses worth sending again in a later batch.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+USER_FIELDS = ["first_name", "last_name", "email", "principal_name"]
+
+
+class ProvisioningError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class Checkpoint:
+    """
+    ``{principal_name: {"id": str, "email_method": bool, "error": str}}``
+    persisted to ``path`` (when given) with an atomic replace.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, principal_name):
+        return self.entries.setdefault(principal_name, {})
+
+    def update(self, results):
+        with self._lock:
+            for principal_name, values in results.items():
+                self.get(principal_name).update(values)
+            if self.path:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(self.entries, f, indent=2)
+                os.replace(tmp_path, self.path)
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def send_batch(entra_auth, requests_by_key):
+    """
+    Send ``{key: sub_request}`` as one ``$batch`` and return
+    ``{key: sub_response}`` (``status``, ``headers``, ``body``).
+    """
+    keys = list(requests_by_key)
+    payload = {
+        "requests": [
+            {"id": str(i), **requests_by_key[key]} for i, key in enumerate(keys)
+        ]
+    }
+    response = http.post(
+        f"{entra_auth.graph_url}/$batch",
+        "graph_batch",
+        headers={
+            "Authorization": f"Bearer {entra_auth.authenticate()}",
+            "Content-Type": "application/json",
+        },
+        json=payload,
+    )
+    response.raise_for_status()
+    return {
+        keys[int(sub_response["id"])]: sub_response
+        for sub_response in response.json()["responses"]
+    }
+
+
+def run_batches(entra_auth, requests_by_key, on_response, max_workers, retries):
+    """
+    Send ``requests_by_key`` in $batch chunks on a thread pool, calling
+    ``on_response(results)`` with ``{key: sub_response}`` for every chunk.
+    Sub-requests that come back throttled or with a 5xx are resent in a later
+    round, up to ``retries`` times, after the largest ``Retry-After`` among
+    them, capped like ``http.retry_delay``; the last response is reported
+    either way.
+    """
+    pending = dict(requests_by_key)
+    attempt = 0
+    while pending:
+        retry = {}
+        retry_after = None
+
+        def run_chunk(keys):
+            nonlocal retry_after
+            sub_responses = send_batch(
+                entra_auth, {key: pending[key] for key in keys}
+            )
+            final = {}
+            for key, sub_response in sub_responses.items():
+                if sub_response["status"] in RETRY_STATUSES and attempt < retries:
+                    retry[key] = sub_response
+                    headers = sub_response.get("headers") or {}
+                    value = str(headers.get("Retry-After", ""))
+                    if value.isdigit():
+                        retry_after = max(int(value), retry_after or 0)
+                else:
+                    final[key] = sub_response
+            on_response(final)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(run_chunk, keys)
+                for keys in chunks(list(pending), GRAPH_BATCH_LIMIT)
+            ]
+        for future in futures:
+            # A whole $batch failing (after http's own retries) stops the run;
+            # the checkpoint already has everything that succeeded.
+            future.result()
+
+        if not retry:
+            return
+        delay = http.retry_delay(attempt, retry_after)
+        if delay is None:
+            logger.warning(
+                "Graph asked to wait %ss, more than IDM_HTTP_MAX_RETRY_DELAY; "
+                "giving up on %d sub-requests",
+                retry_after,
+                len(retry),
+            )
+            on_response(retry)
+            return
+        time.sleep(delay)
+        pending = {key: pending[key] for key in retry}
+        attempt += 1
+
+
+def _error(sub_response):
+    body = sub_response.get("body") or {}
+    error = body.get("error", {}) if isinstance(body, dict) else {}
+    return f"{sub_response['status']}: {error.get('message', body)}"
+
+
+def _is_conflict(sub_response):
+    """
+    Graph answers ``POST /users`` for an existing ``userPrincipalName`` with a
+    400 ``ObjectConflict`` (a 409 for other resources).
+    """
+    if sub_response["status"] == 409:
+        return True
+    if sub_response["status"] != 400:
+        return False
+    body = json.dumps(sub_response.get("body") or {})
+    return "ObjectConflict" in body or "already exists" in body
+
+
+def provision_users(entra_auth, users, checkpoint_path=None, max_workers=None, retries=None):
+    """
+    Create every user in ``users`` (dicts with USER_FIELDS) in Entra and add
+    their email authentication method.
+
+    Returns the checkpoint entries for ``users``:
+    ``{principal_name: {"id", "email_method", "error"}}``. Users with an
+    ``"error"`` failed in the phase named by the message and are retried on
+    the next run with the same checkpoint.
+    """
+    for user in users:
+        missing = [field for field in USER_FIELDS if not user.get(field)]
+        if missing:
+            raise ProvisioningError(f"User {user} is missing {', '.join(missing)}")
+
+    max_workers = max_workers or getattr(settings, "ENTRA_PROVISION_MAX_WORKERS", 4)
+    retries = retries if retries is not None else getattr(settings, "IDM_HTTP_RETRIES", 3)
+    checkpoint = Checkpoint(checkpoint_path)
+    users_by_name = {user["principal_name"]: user for user in users}
+
+    # Phase 1: users without an Entra id.
+    creates = {
+        name: {
+            "method": "POST",
+            "url": "/users",
+            "headers": {"Content-Type": "application/json"},
+            "body": entra_auth.user_payload(
+                user["first_name"], user["last_name"], user["email"], name
+            ),
+        }
+        for name, user in users_by_name.items()
+        if not checkpoint.get(name).get("id")
+    }
+
+    conflicts = []
+
+    def on_created(results):
+        entries = {}
+        for name, sub_response in results.items():
+            if sub_response["status"] == 201:
+                entries[name] = {"id": sub_response["body"]["id"], "error": None}
+            elif _is_conflict(sub_response):
+                # Created by an earlier run that stopped before checkpointing.
+                conflicts.append(name)
+            else:
+                entries[name] = {"error": f"create user {_error(sub_response)}"}
+        checkpoint.update(entries)
+
+    run_batches(entra_auth, creates, on_created, max_workers, retries)
+
+    lookups = {
+        name: {
+            "method": "GET",
+            "url": f"/users/{quote(name, safe='@')}?$select=id",
+        }
+        for name in conflicts
+    }
+
+    def on_looked_up(results):
+        checkpoint.update(
+            {
+                name: {"id": sub_response["body"]["id"], "error": None}
+                if sub_response["status"] == 200
+                else {"error": f"look up existing user {_error(sub_response)}"}
+                for name, sub_response in results.items()
+            }
+        )
+
+    run_batches(entra_auth, lookups, on_looked_up, max_workers, retries)
+
+    # Phase 2: created users still missing their email method.
+    email_methods = {
+        name: {
+            "method": "POST",
+            "url": f"/users/{checkpoint.get(name)['id']}/authentication/emailMethods",
+            "headers": {"Content-Type": "application/json"},
+            "body": {"emailAddress": user["email"]},
+        }
+        for name, user in users_by_name.items()
+        if checkpoint.get(name).get("id") and not checkpoint.get(name).get("email_method")
+    }
+
+    def on_email_method(results):
+        checkpoint.update(
+            {
+                name: {"email_method": True, "error": None}
+                if sub_response["status"] == 201 or _is_conflict(sub_response)
+                else {"error": f"email method {_error(sub_response)}"}
+                for name, sub_response in results.items()
+            }
+        )
+
+    run_batches(entra_auth, email_methods, on_email_method, max_workers, retries)
+
+    return {name: checkpoint.get(name) for name in users_by_name}
@@ -0,0 +1,70 @@
+"""
+Request-scoped identity map for ontology lookups.
+
+``RequestScopeMiddleware`` opens a fresh scope per request in a context
+variable; ``memoize`` returns what was already built for a key in the current
+scope or builds and remembers it. Outside a request (management commands,
+sync jobs) there is no scope and ``memoize`` just calls the factory.
+
+Thread pools only see the scope when the work is submitted through
+``contextvars.copy_context().run``; each submission needs its own copy.
+"""
+import contextvars
+import threading
+
+_scope = contextvars.ContextVar("komatsu_idm_request_scope", default=None)
+
+_MISSING = object()
+
+
+class RequestScope:
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+
+def open_scope():
+    """
+    Start a new scope in the current context; pass the result to close_scope.
+    """
+    return _scope.set(RequestScope())
+
+
+def close_scope(token):
+    _scope.reset(token)
+
+
+def memoize(key, factory):
+    """
+    ``factory()``, computed at most once per ``key`` in the current request.
+    Concurrent first calls may both run the factory; the first result wins.
+    """
+    scope = _scope.get()
+    if scope is None:
+        return factory()
+    value = scope.values.get(key, _MISSING)
+    if value is _MISSING:
+        value = factory()
+        with scope.lock:
+            value = scope.values.setdefault(key, value)
+    return value
+
+
+def prime(key, value):
+    """
+    Remember ``value`` for ``key`` without computing it, e.g. rows from a bulk fetch.
+    """
+    scope = _scope.get()
+    if scope is not None:
+        with scope.lock:
+            scope.values[key] = value
+
+
+def evict(key):
+    """
+    Forget ``key`` in the current request, e.g. after writing the object.
+    """
+    scope = _scope.get()
+    if scope is not None:
+        with scope.lock:
+            scope.values.pop(key, None)
@@ -0,0 +1,745 @@
+import asyncio
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from python_http_client.exceptions import BadRequestsError, UnauthorizedError
+
+from komatsu_idm import http, provisioning, request_scope
+from komatsu_idm.graph_stub import GraphStub
+from komatsu_idm.jwks import ClaimsCache, JWKSCache, UnknownSigningKey
+from komatsu_idm.main import EntraAuth
+from komatsu_idm.middleware import jwt as jwt_middleware, palantir
+from komatsu_idm.middleware.jwt import JwtMiddleware
+from komatsu_idm.middleware.palantir import PalantirUserMiddleware, get_palantir_user
+from komatsu_idm.middleware.request_scope import RequestScopeMiddleware
+from komatsu_idm.tokens import TokenManager
+from modules.django_komatsu_idm.komatsu_idm.outbox import dispatch
+from modules.django_komatsu_idm.komatsu_idm.outbox.models import EmailOutbox
+
+
+def user_data(**extra):
+    return {
+        "userId": "U1",
+        "type": "admin",
+        "role_data": {
+            "primary_user_role": {"customerId": None, "distributorId": "D1"},
+            "user_roles": [],
+        },
+        **extra,
+    }
+
+
+def jwt_request(oid="oid-1"):
+    request = RequestFactory().get("/")
+    request.jwt_data = {"oid": oid}
+    return request
+
+
+@override_settings(DEBUG=False, PALANTIR_USER_CACHE_TTL=300)
+class PalantirUserCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_second_lookup_is_served_from_cache(self):
+        with mock.patch.object(
+            palantir, "fetch_palantir_user_data", return_value=user_data()
+        ) as fetch:
+            first = get_palantir_user(jwt_request())
+            second = get_palantir_user(jwt_request())
+        fetch.assert_called_once_with("oid-1")
+        self.assertEqual(second.to_dict(), first.to_dict())
+        self.assertEqual(second.distributor_id, "D1")
+        self.assertTrue(second.is_distributor)
+
+    def test_invalidate(self):
+        with mock.patch.object(
+            palantir, "fetch_palantir_user_data", return_value=user_data()
+        ) as fetch:
+            get_palantir_user(jwt_request())
+            palantir.invalidate_palantir_user("oid-1")
+            get_palantir_user(jwt_request())
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_failed_lookup_is_not_cached(self):
+        with mock.patch.object(
+            palantir, "fetch_palantir_user_data", side_effect=IndexError
+        ) as fetch:
+            self.assertFalse(get_palantir_user(jwt_request()).is_valid_user)
+            get_palantir_user(jwt_request())
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_resolved_lazily(self):
+        request = jwt_request()
+        with mock.patch.object(
+            palantir, "fetch_palantir_user_data", return_value=user_data()
+        ) as fetch:
+            PalantirUserMiddleware(lambda request: "response")(request)
+            fetch.assert_not_called()
+            self.assertTrue(request.palantir_user.is_distributor)
+            self.assertTrue(request.palantir_user.is_valid_user)
+        fetch.assert_called_once()
+
+
+def sdk_object(**data):
+    return mock.Mock(_asdict=lambda: dict(data), **data)
+
+
+@override_settings(DELETE_FLAG="deleted")
+class PalantirUserFetchTests(SimpleTestCase):
+    def sdk(self, user_set):
+        sdk_client = mock.Mock()
+        sdk_client.ontology.objects.MyKomatsuUser.where.return_value = user_set
+        return mock.patch.object(palantir, "client", return_value=sdk_client)
+
+    def test_roles_traverse_the_user_link(self):
+        user_set = mock.Mock(spec=["take", "search_around_my_komatsu_roles"])
+        user_set.take.return_value = [
+            sdk_object(userId="U1", user_id="U1", home_role_id="R1")
+        ]
+        role_set = user_set.search_around_my_komatsu_roles.return_value
+        role_set.iterate.return_value = [
+            sdk_object(id="R1", distributorId="D1"),
+            sdk_object(id="R2", branchId="B2"),
+        ]
+        with self.sdk(user_set) as client:
+            data = palantir.fetch_palantir_user_data("oid-1")
+
+        # No query waits on the user's id.
+        client.return_value.ontology.objects.MyKomatsuRole.where.assert_not_called()
+        self.assertEqual(data["userId"], "U1")
+        self.assertEqual(
+            data["role_data"],
+            {
+                "primary_user_role": {"id": "R1", "distributorId": "D1"},
+                "user_roles": [{"id": "R2", "branchId": "B2"}],
+            },
+        )
+
+    @override_settings(PALANTIR_USER_ROLE_LINK="roles")
+    def test_without_the_link_roles_follow_the_user(self):
+        user_set = mock.Mock(spec=["take"])
+        user_set.take.return_value = [
+            sdk_object(userId="U1", user_id="U1", home_role_id="R1")
+        ]
+        with self.sdk(user_set) as client, self.assertLogs(palantir.logger, "WARNING"):
+            objects = client.return_value.ontology.objects
+            objects.MyKomatsuRole.where.return_value.iterate.return_value = [
+                sdk_object(id="R1")
+            ]
+            data = palantir.fetch_palantir_user_data("oid-1")
+
+        objects.MyKomatsuRole.where.assert_called_once()
+        self.assertEqual(data["role_data"]["primary_user_role"], {"id": "R1"})
+
+    def test_unknown_user(self):
+        user_set = mock.Mock(spec=["take", "search_around_my_komatsu_roles"])
+        user_set.take.return_value = []
+        user_set.search_around_my_komatsu_roles.return_value.iterate.return_value = []
+        with self.sdk(user_set):
+            with self.assertRaises(IndexError):
+                palantir.fetch_palantir_user_data("oid-1")
+
+
+def jwk(kid):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    data = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+    data["kid"] = kid
+    return data
+
+
+def jwks_response(*keys):
+    response = mock.Mock()
+    response.json.return_value = {"keys": list(keys)}
+    return response
+
+
+class JWKSCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.k1, self.k2 = jwk("k1"), jwk("k2")
+        self.jwks = JWKSCache("https://keys", ttl=3600, min_refresh_interval=60)
+
+    def test_hit_fetches_once(self):
+        with mock.patch(
+            "komatsu_idm.jwks.http.get", return_value=jwks_response(self.k1)
+        ) as get:
+            key = self.jwks.get_key("k1")
+            self.assertIs(self.jwks.get_key("k1"), key)
+        get.assert_called_once()
+
+    def test_rotation(self):
+        with mock.patch(
+            "komatsu_idm.jwks.http.get",
+            side_effect=[jwks_response(self.k1), jwks_response(self.k1, self.k2)],
+        ) as get:
+            self.jwks.get_key("k1")
+            self.jwks.min_refresh_interval = 0
+            self.assertIsNotNone(self.jwks.get_key("k2"))
+        self.assertEqual(get.call_count, 2)
+
+    def test_unknown_kids_are_rate_limited(self):
+        with mock.patch(
+            "komatsu_idm.jwks.http.get", return_value=jwks_response(self.k1)
+        ) as get:
+            self.jwks.get_key("k1")
+            for _ in range(5):
+                with self.assertRaises(UnknownSigningKey):
+                    self.jwks.get_key("garbage")
+            get.assert_called_once()
+
+            self.jwks._attempted_at -= 61
+            with self.assertRaises(UnknownSigningKey):
+                self.jwks.get_key("garbage")
+        self.assertEqual(get.call_count, 2)
+
+    def test_failed_refresh_keeps_cached_keys(self):
+        with mock.patch(
+            "komatsu_idm.jwks.http.get",
+            side_effect=[jwks_response(self.k1), ConnectionError("down")],
+        ) as get:
+            key = self.jwks.get_key("k1")
+            self.jwks.min_refresh_interval = 0
+            with self.assertRaises(UnknownSigningKey):
+                self.jwks.get_key("k2")
+            self.assertIs(self.jwks.get_key("k1"), key)
+        self.assertEqual(get.call_count, 2)
+
+    def test_stale_keys_served_when_refresh_fails(self):
+        with mock.patch(
+            "komatsu_idm.jwks.http.get",
+            side_effect=[jwks_response(self.k1), ConnectionError("down")],
+        ):
+            key = self.jwks.get_key("k1")
+            self.jwks.ttl = self.jwks.min_refresh_interval = 0
+            self.assertIs(self.jwks.get_key("k1"), key)
+
+
+class ClaimsCacheTests(SimpleTestCase):
+    def test_expired_claims_are_dropped(self):
+        claims = ClaimsCache(max_size=2)
+        claims.set("live", {"exp": time.time() + 60, "oid": "1"})
+        claims.set("expired", {"exp": time.time() - 1})
+        claims.set("no-exp", {"oid": "2"})
+        self.assertEqual(claims.get("live")["oid"], "1")
+        self.assertIsNone(claims.get("expired"))
+        self.assertIsNone(claims.get("no-exp"))
+
+    def test_bounded(self):
+        claims = ClaimsCache(max_size=2)
+        for token in ["a", "b", "c"]:
+            claims.set(token, {"exp": time.time() + 60})
+        self.assertIsNone(claims.get("a"))
+        self.assertIsNotNone(claims.get("c"))
+
+
+class DecodeTokenTests(SimpleTestCase):
+    def setUp(self):
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwks = mock.Mock()
+        jwks.get_key.return_value = self.key.public_key()
+        patcher = mock.patch.object(jwt_middleware, "get_jwks", return_value=jwks)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def token(self, issuer):
+        claims = {
+            "iss": issuer,
+            "aud": "entra-id",
+            "oid": "oid-1",
+            "exp": int(time.time()) + 60,
+        }
+        return jwt.encode(claims, self.key, algorithm="RS256", headers={"kid": "k1"})
+
+    def test_ciam_token(self):
+        token = self.token("https://tenant.ciamlogin.com/tenant/v2.0")
+        self.assertEqual(jwt_middleware.decode_token(token)["oid"], "oid-1")
+
+    def test_other_issuer_rejected(self):
+        with self.assertRaises(jwt.InvalidIssuerError):
+            jwt_middleware.decode_token(self.token("https://sts.windows.net/tenant/"))
+
+
+class TokenFetcher:
+    """
+    Token endpoint stand-in: hands out "t1", "t2"... and can be held back
+    with ``release`` or made to fail.
+    """
+
+    def __init__(self, expires_in=3600):
+        self.expires_in = expires_in
+        self.calls = 0
+        self.fail = False
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self):
+        self.release.wait(5)
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("token endpoint down")
+        return {"access_token": f"t{self.calls}", "expires_in": self.expires_in}
+
+
+def wait_for(condition):
+    deadline = time.time() + 5
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class TokenManagerTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_fetch(self):
+        fetch = TokenFetcher()
+        fetch.release.clear()
+        tokens = TokenManager(fetch, refresh_margin=60)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(tokens.token()))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        fetch.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(fetch.calls, 1)
+        self.assertEqual(results, ["t1"] * 10)
+
+    def test_token_reused_outside_refresh_margin(self):
+        fetch = TokenFetcher(expires_in=3600)
+        tokens = TokenManager(fetch, refresh_margin=60)
+        self.assertEqual([tokens.token() for _ in range(3)], ["t1"] * 3)
+        self.assertEqual(fetch.calls, 1)
+
+    def test_refresh_margin_refreshes_in_background(self):
+        # Valid for 60s after the leeway, so always inside a 120s margin.
+        fetch = TokenFetcher(expires_in=TokenManager.EXPIRY_LEEWAY + 60)
+        tokens = TokenManager(fetch, refresh_margin=120)
+        self.assertEqual(tokens.token(), "t1")
+
+        fetch.release.clear()
+        start_time = time.time()
+        self.assertEqual(tokens.token(), "t1")
+        self.assertEqual(tokens.token(), "t1")
+        self.assertLess(time.time() - start_time, 0.5)
+
+        fetch.release.set()
+        wait_for(lambda: fetch.calls == 2 and not tokens._refreshing.locked())
+        self.assertEqual(fetch.calls, 2)
+        self.assertEqual(tokens._state[0], "t2")
+
+    def test_failed_refresh_keeps_token_until_expiry(self):
+        fetch = TokenFetcher(expires_in=TokenManager.EXPIRY_LEEWAY + 60)
+        tokens = TokenManager(fetch, refresh_margin=120)
+        tokens.token()
+
+        fetch.fail = True
+        self.assertEqual(tokens.token(), "t1")
+        wait_for(lambda: fetch.calls == 2 and not tokens._refreshing.locked())
+        self.assertEqual(tokens.token(), "t1")
+
+        expired = time.time() + 61
+        with mock.patch("komatsu_idm.tokens.time.time", return_value=expired):
+            with self.assertRaises(ConnectionError):
+                tokens.token()
+
+
+def http_response(status, headers=None):
+    response = mock.Mock(status_code=status, headers=headers or {})
+    return response
+
+
+@override_settings(
+    IDM_HTTP_RETRIES=3, IDM_HTTP_BACKOFF=0.5, IDM_HTTP_MAX_RETRY_DELAY=30
+)
+class HttpRetryTests(SimpleTestCase):
+    def send(self, method, *outcomes):
+        session = mock.Mock()
+        session.request.side_effect = list(outcomes)
+        with mock.patch.object(http, "session", return_value=session), mock.patch(
+            "komatsu_idm.http.time.sleep"
+        ) as sleep:
+            try:
+                return http.request(method, "https://api", "test"), session, sleep
+            except Exception as e:
+                return e, session, sleep
+
+    def test_idempotent_call_retried_on_5xx(self):
+        response, session, sleep = self.send(
+            "GET", http_response(502), http_response(503), http_response(200)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.request.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_post_only_retried_when_unprocessed(self):
+        response, session, _ = self.send("POST", http_response(500))
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(session.request.call_count, 1)
+
+        response, session, _ = self.send(
+            "POST", http_response(429), http_response(201)
+        )
+        self.assertEqual(response.status_code, 201)
+
+        error, session, _ = self.send("POST", http.requests.ConnectionError())
+        self.assertIsInstance(error, http.requests.ConnectionError)
+        self.assertEqual(session.request.call_count, 1)
+
+    def test_retry_after_honoured(self):
+        _, _, sleep = self.send(
+            "GET", http_response(429, {"Retry-After": "2"}), http_response(200)
+        )
+        sleep.assert_called_once_with(2)
+
+    def test_long_retry_after_gives_up(self):
+        response, session, sleep = self.send(
+            "GET", http_response(429, {"Retry-After": "3600"}), http_response(200)
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(session.request.call_count, 1)
+        sleep.assert_not_called()
+
+    def test_backoff_is_capped(self):
+        for attempt in range(20):
+            self.assertLessEqual(http.retry_delay(attempt), 30)
+
+    @override_settings(IDM_HTTP_STATS_LOG_INTERVAL=1)
+    def test_latency_is_logged(self):
+        with mock.patch.object(http, "_latency_logged_at", 0):
+            with self.assertLogs("komatsu_idm.http", "INFO") as logs:
+                self.send("GET", http_response(200))
+        self.assertIn('"test"', logs.output[0])
+        self.assertGreaterEqual(http.latency_stats()["test"]["count"], 1)
+
+
+def graph_users(count):
+    return [
+        {
+            "first_name": "First",
+            "last_name": f"User{i}",
+            "email": f"user{i}@example.com",
+            "principal_name": f"user{i}@tenant.example.com",
+        }
+        for i in range(count)
+    ]
+
+
+@override_settings(DEBUG=False, IDM_HTTP_BACKOFF=0)
+class ProvisioningTests(SimpleTestCase):
+    def provision(self, users, stub=None, **kwargs):
+        stub = stub or GraphStub()
+        stub.start()
+        self.addCleanup(stub.stop)
+        with override_settings(ENTRA_LOGIN_URL=stub.url, ENTRA_GRAPH_URL=stub.graph_url):
+            # A fresh client id per run keeps cached tokens out of the way.
+            entra_auth = EntraAuth(f"client-{id(stub)}", "secret", "tenant")
+            report = provisioning.provision_users(entra_auth, users, **kwargs)
+        return report, stub
+
+    def test_users_created_in_batches(self):
+        users = graph_users(45)
+        report, stub = self.provision(users)
+
+        self.assertEqual(len(stub.users), 45)
+        # 3 batches of creates, 3 of email methods.
+        self.assertEqual(stub.batches, 6)
+        for user in users:
+            entry = report[user["principal_name"]]
+            created = stub.users[user["principal_name"]]
+            self.assertIsNone(entry["error"])
+            self.assertTrue(entry["email_method"])
+            self.assertEqual(entry["id"], created["id"])
+            self.assertEqual(created["emailMethods"], [user["email"]])
+
+    def test_resume_skips_checkpointed_work(self):
+        users = graph_users(3)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "checkpoint.json")
+            first, _ = self.provision(users[:2], checkpoint_path=path)
+            second, stub = self.provision(users, checkpoint_path=path)
+
+        # Only the third user reached the second stand-in.
+        self.assertEqual(list(stub.users), [users[2]["principal_name"]])
+        for user in users[:2]:
+            self.assertEqual(second[user["principal_name"]], first[user["principal_name"]])
+        self.assertTrue(second[users[2]["principal_name"]]["email_method"])
+
+    def test_conflict_after_crash_is_looked_up(self):
+        users = graph_users(3)
+        stub = GraphStub()
+        # Created by a run that died before writing its checkpoint.
+        existing = stub.add_user(users[0]["principal_name"])
+
+        report, _ = self.provision(users, stub=stub)
+
+        entry = report[users[0]["principal_name"]]
+        self.assertEqual(entry["id"], existing["id"])
+        self.assertIsNone(entry["error"])
+        self.assertTrue(entry["email_method"])
+        self.assertEqual(len(stub.users), 3)
+
+    def test_existing_email_method_counts_as_added(self):
+        users = graph_users(1)
+        stub = GraphStub()
+        stub.add_user(users[0]["principal_name"], emailMethods=[users[0]["email"]])
+
+        report, _ = self.provision(users, stub=stub)
+
+        self.assertTrue(report[users[0]["principal_name"]]["email_method"])
+        self.assertIsNone(report[users[0]["principal_name"]]["error"])
+
+    def test_throttled_sub_requests_retried_after_retry_after(self):
+        with mock.patch("komatsu_idm.provisioning.time.sleep") as sleep:
+            report, stub = self.provision(
+                graph_users(5), stub=GraphStub(throttle=3, retry_after=2)
+            )
+
+        sleep.assert_called_once_with(2)
+        self.assertTrue(all(entry["email_method"] for entry in report.values()))
+        self.assertEqual(len(stub.users), 5)
+
+    @override_settings(IDM_HTTP_MAX_RETRY_DELAY=30)
+    def test_long_retry_after_recorded_as_failure(self):
+        with mock.patch("komatsu_idm.provisioning.time.sleep") as sleep:
+            report, stub = self.provision(
+                graph_users(5), stub=GraphStub(throttle=2, retry_after=3600)
+            )
+
+        sleep.assert_not_called()
+        failed = [name for name, entry in report.items() if entry.get("error")]
+        self.assertEqual(len(failed), 2)
+        self.assertTrue(all("429" in report[name]["error"] for name in failed))
+        self.assertEqual(len(stub.users), 3)
+
+
+def sendgrid_error(cls, status):
+    return cls(status, "Bad Request", b'{"errors": []}', {})
+
+
+@override_settings(
+    SENDGRID_TEMPLATE_ID="T1",
+    EMAIL_OUTBOX_MAX_ATTEMPTS=5,
+)
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.send.side_effect = self.send
+        self.messages = []
+        self.rejected = set()
+        patcher = mock.patch.object(dispatch, "sendgrid_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, message):
+        recipients = [
+            to["email"]
+            for personalization in message.get()["personalizations"]
+            for to in personalization["to"]
+        ]
+        self.messages.append(sorted(recipients))
+        if self.rejected.intersection(recipients):
+            raise sendgrid_error(BadRequestsError, 400)
+        return mock.Mock(status_code=202)
+
+    def enqueue(self, recipient, sender="noreply@example.com", template_id=None):
+        return dispatch.enqueue_email(sender, recipient, {"name": recipient}, template_id)
+
+    def test_emails_grouped_by_sender_and_template(self):
+        self.enqueue("a@example.com")
+        self.enqueue("b@example.com")
+        self.enqueue("c@example.com", template_id="T2")
+        self.enqueue("d@example.com", sender="other@example.com")
+
+        self.assertEqual(dispatch.dispatch_pending(), 4)
+
+        self.assertCountEqual(
+            self.messages,
+            [["a@example.com", "b@example.com"], ["c@example.com"], ["d@example.com"]],
+        )
+        self.assertEqual(
+            EmailOutbox.objects.filter(status=EmailOutbox.SENT).count(), 4
+        )
+
+    def test_rejected_group_resent_one_by_one(self):
+        ids = [self.enqueue(f"user{i}@example.com") for i in range(3)]
+        self.rejected = {"user1@example.com"}
+
+        self.assertEqual(dispatch.dispatch_pending(), 2)
+
+        # The group, then each member on its own.
+        self.assertEqual(len(self.messages), 4)
+        emails = EmailOutbox.objects.in_bulk(ids)
+        self.assertEqual(emails[ids[0]].status, EmailOutbox.SENT)
+        self.assertEqual(emails[ids[2]].status, EmailOutbox.SENT)
+        failed = emails[ids[1]]
+        self.assertEqual(failed.status, EmailOutbox.PENDING)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn("400", failed.last_error)
+
+    def test_auth_error_not_split(self):
+        ids = [self.enqueue(f"user{i}@example.com") for i in range(3)]
+        self.client.send.side_effect = sendgrid_error(UnauthorizedError, 401)
+
+        self.assertEqual(dispatch.dispatch_pending(), 0)
+
+        self.assertEqual(self.client.send.call_count, 1)
+        for email in EmailOutbox.objects.filter(id__in=ids):
+            self.assertEqual(email.status, EmailOutbox.PENDING)
+            self.assertEqual(email.attempts, 1)
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=1)
+    def test_gives_up_after_max_attempts(self):
+        email_id = self.enqueue("user@example.com")
+        self.rejected = {"user@example.com"}
+
+        dispatch.dispatch_pending()
+
+        self.assertEqual(EmailOutbox.objects.get(id=email_id).status, EmailOutbox.FAILED)
+
+    def test_racing_dispatchers_claim_each_email_once(self):
+        for i in range(3):
+            self.enqueue(f"user{i}@example.com")
+        new_claim_id = dispatch.uuid.uuid4
+        claimed = {}
+
+        def uuid4():
+            # Another dispatcher claims the same candidates first.
+            if "other" not in claimed:
+                claimed["other"] = []
+                claimed["other"] = dispatch.claim_due(10)
+            return new_claim_id()
+
+        with mock.patch.object(dispatch.uuid, "uuid4", side_effect=uuid4):
+            claimed["this"] = dispatch.claim_due(10)
+
+        self.assertEqual(len(claimed["other"]), 3)
+        self.assertEqual(claimed["this"], [])
+
+    def test_in_process_dispatch_is_opt_in(self):
+        with mock.patch.object(dispatch, "wake_dispatcher") as wake:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.enqueue("a@example.com")
+            wake.assert_not_called()
+
+            with self.settings(EMAIL_OUTBOX_DISPATCH_IN_PROCESS=True):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.enqueue("b@example.com")
+            wake.assert_called_once()
+
+
+class AsyncMiddlewareTests(SimpleTestCase):
+    async def view(self, request):
+        return "response"
+
+    def test_jwt_decoded_off_the_event_loop(self):
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION="Bearer token")
+        middleware = JwtMiddleware(self.view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        loop_thread = threading.get_ident()
+        threads = []
+
+        def decode(token):
+            threads.append(threading.get_ident())
+            return {"oid": "oid-1"}
+
+        with mock.patch.object(jwt_middleware, "decode_token", side_effect=decode):
+            self.assertEqual(asyncio.run(middleware(request)), "response")
+        self.assertEqual(request.jwt_data, {"oid": "oid-1", "token_string": "token"})
+        self.assertNotEqual(threads, [loop_thread])
+
+    def test_palantir_user_still_lazy(self):
+        request = jwt_request()
+        middleware = PalantirUserMiddleware(self.view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        with mock.patch.object(
+            palantir, "fetch_palantir_user_data", return_value=user_data()
+        ) as fetch:
+            self.assertEqual(asyncio.run(middleware(request)), "response")
+            fetch.assert_not_called()
+            self.assertTrue(request.palantir_user.is_valid_user)
+        fetch.assert_called_once()
+
+    def test_sync_chain_unchanged(self):
+        request = RequestFactory().get("/")
+        middleware = JwtMiddleware(lambda request: "response")
+        self.assertFalse(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(middleware(request), "response")
+        self.assertEqual(request.jwt_data, {})
+
+
+class RequestScopeTests(SimpleTestCase):
+    def test_no_scope_outside_requests(self):
+        factory = mock.Mock(side_effect=lambda: object())
+        self.assertIsNot(
+            request_scope.memoize("k", factory), request_scope.memoize("k", factory)
+        )
+        request_scope.prime("k", 1)
+        self.assertEqual(factory.call_count, 2)
+
+    def test_memoized_per_request(self):
+        factory = mock.Mock(side_effect=lambda: object())
+
+        def view(request):
+            first = request_scope.memoize("k", factory)
+            self.assertIs(request_scope.memoize("k", factory), first)
+            return first
+
+        middleware = RequestScopeMiddleware(view)
+        request = RequestFactory().get("/")
+        self.assertIsNot(middleware(request), middleware(request))
+        self.assertEqual(factory.call_count, 2)
+        # Closed again after the response.
+        self.assertIsNone(request_scope._scope.get())
+
+    def test_prime_and_evict(self):
+        token = request_scope.open_scope()
+        try:
+            request_scope.prime("k", "primed")
+            self.assertEqual(request_scope.memoize("k", lambda: "built"), "primed")
+            request_scope.evict("k")
+            self.assertEqual(request_scope.memoize("k", lambda: "built"), "built")
+        finally:
+            request_scope.close_scope(token)
+
+    def test_pool_work_sees_the_scope_through_a_context_copy(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        token = request_scope.open_scope()
+        try:
+            request_scope.prime("k", "request")
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                copied = pool.submit(
+                    contextvars.copy_context().run,
+                    request_scope.memoize,
+                    "k",
+                    lambda: "built",
+                ).result()
+                bare = pool.submit(request_scope.memoize, "k", lambda: "built").result()
+        finally:
+            request_scope.close_scope(token)
+        self.assertEqual((copied, bare), ("request", "built"))
+
+    def test_concurrent_async_requests_get_their_own_scope(self):
+        async def view(request):
+            value = request_scope.memoize("k", lambda: request.path)
+            await asyncio.sleep(0.01)
+            return request_scope.memoize("k", lambda: "rebuilt"), value
+
+        middleware = RequestScopeMiddleware(view)
+        factory = RequestFactory()
+
+        async def serve():
+            return await asyncio.gather(
+                middleware(factory.get("/a")), middleware(factory.get("/b"))
+            )
+
+        self.assertEqual(asyncio.run(serve()), [("/a", "/a"), ("/b", "/b")])
@@ -0,0 +1,122 @@
+"""
+Client-credentials access tokens shared by every thread of a process and,
+optionally, by every worker process through the Django cache.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenManager:
+    """
+    Hands out the current access token, fetching a new one with
+    ``fetch_token`` (returns the token endpoint's JSON: ``access_token`` and
+    ``expires_in``) only when needed.
+
+    - Single flight: when the token has expired, one caller fetches while the
+      others wait for it and then reuse its result.
+    - Background refresh: within ``refresh_margin`` seconds of expiry the
+      current token is still returned and one background thread fetches the
+      next one, so callers don't wait on the token endpoint. If that fetch
+      fails the current token keeps being served until it expires.
+    - With ``cache_key`` the token is also stored in the Django cache, and a
+      token another worker already fetched is picked up instead of fetching.
+    """
+
+    # Tokens are treated as expired this many seconds early to absorb clock
+    # skew and request latency.
+    EXPIRY_LEEWAY = 30
+
+    def __init__(self, fetch_token, refresh_margin=None, cache_key=None):
+        self.fetch_token = fetch_token
+        self.refresh_margin = (
+            refresh_margin
+            if refresh_margin is not None
+            else getattr(settings, "IDM_TOKEN_REFRESH_MARGIN", 300)
+        )
+        self.cache_key = cache_key
+        # (token, expires_at), replaced as a whole under _lock.
+        self._state = (None, 0)
+        self._lock = threading.Lock()
+        # Held for the whole fetch; only callers without a valid token wait on it.
+        self._fetch_lock = threading.Lock()
+        # Held by the background refresh thread while it runs.
+        self._refreshing = threading.Lock()
+
+    def token(self):
+        token, expires_at = self._state
+        now = time.time()
+        if token and now < expires_at - self.refresh_margin:
+            return token
+        if token and now < expires_at:
+            self._refresh_in_background()
+            return token
+
+        with self._fetch_lock:
+            token, expires_at = self._state
+            if not token or time.time() >= expires_at:
+                self._refresh()
+            return self._state[0]
+
+    def _refresh(self):
+        """
+        Load a token from the shared cache if another worker has a fresh one,
+        otherwise fetch it. Called with ``_fetch_lock`` held.
+        """
+        if self.cache_key:
+            shared = cache.get(self.cache_key)
+            if shared and shared["expires_at"] - self.refresh_margin > time.time():
+                with self._lock:
+                    self._state = (shared["token"], shared["expires_at"])
+                return
+
+        token_data = self.fetch_token()
+        token = token_data["access_token"]
+        expires_at = time.time() + token_data["expires_in"] - self.EXPIRY_LEEWAY
+        with self._lock:
+            self._state = (token, expires_at)
+
+        if self.cache_key:
+            cache.set(
+                self.cache_key,
+                {"token": token, "expires_at": expires_at},
+                max(int(expires_at - time.time()), 1),
+            )
+
+    def _refresh_in_background(self):
+        if not self._refreshing.acquire(blocking=False):
+            return
+        try:
+            threading.Thread(
+                target=self._background_refresh, name="token-refresh", daemon=True
+            ).start()
+        except Exception:
+            self._refreshing.release()
+            raise
+
+    def _background_refresh(self):
+        try:
+            with self._fetch_lock:
+                if time.time() >= self._state[1] - self.refresh_margin:
+                    self._refresh()
+        except Exception as e:
+            # The current token is still valid; the next call past the
+            # refresh margin tries again.
+            logger.warning("Background token refresh failed: %s", e)
+        finally:
+            self._refreshing.release()
+
+
+def shared_cache_key(name, client_id):
+    """
+    Cache key for sharing a token across workers, or None when sharing is
+    disabled (``IDM_TOKEN_SHARED_CACHE``).
+    """
+    if not getattr(settings, "IDM_TOKEN_SHARED_CACHE", False):
+        return None
+    return f"komatsu_idm:token:{name}:{client_id}"
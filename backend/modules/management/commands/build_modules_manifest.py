@@ -0,0 +1,15 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from modules.manifest import MANIFEST_PATH, write_manifest
+
+
+class Command(BaseCommand):
+    help = "Write modules/manifest.json so startup doesn't scan the modules tree."
+
+    def handle(self, *args, **options):
+        manifest = write_manifest(settings.BASE_DIR)
+        self.stdout.write(f"Wrote {MANIFEST_PATH}:")
+        self.stdout.write(json.dumps(manifest, indent=2))
@@ -1,19 +1,127 @@
+import json
+import os
 from pathlib import Path
-from django.urls import path, include
+
+from .utils import posixpath_to_modulepath
 
 MODULES_PACKAGE_NAME = "modules"
 MODULES_DIR = f"{Path.cwd()}/{MODULES_PACKAGE_NAME}/"
-APPS = Path(MODULES_DIR).rglob("apps.py")
+
+# Written by ``manage.py build_modules_manifest`` so workers don't have to
+# walk the modules tree on every boot.
+MANIFEST_PATH = f"{MODULES_DIR}manifest.json"
+MANIFEST_VERSION = 2
+
+
+def scan_modules():
+    modules = []
+    python_package_separator = "."
+    for app in Path(MODULES_DIR).rglob("apps.py"):
+        app_name = app.as_posix().replace(MODULES_DIR, f"{MODULES_PACKAGE_NAME}/")
+        app_name = python_package_separator.join(app_name.split("/")[:-1])
+        modules.append(app_name)
+    return modules
+
+
+def scan_urls(base_dir):
+    """
+    ``[(url_prefix, urls_module)]`` for every module ``urls.py`` under
+    ``base_dir/modules``, the prefix being its directory name with dashes.
+    """
+    base_dir = Path(base_dir)
+    module_urls = []
+    for url in (base_dir / MODULES_PACKAGE_NAME).rglob("urls.py"):
+        module_name, _ = url.as_posix().split("/")[-2:]
+        if not module_name == MODULES_PACKAGE_NAME:
+            module_urls.append(
+                (
+                    module_name.replace("_", "-"),
+                    posixpath_to_modulepath(url.relative_to(base_dir)),
+                )
+            )
+    return module_urls
+
+
+def scan_options():
+    """
+    ``{directory_name: options_module}`` for every ``options.py`` under
+    ``modules/``, indexed by each directory between ``modules/`` and the file
+    so a module slug resolves the way ``get_options`` always looked it up.
+    """
+    index = {}
+    base_dir = Path(MODULES_DIR).parent
+    for options_file in sorted(Path(MODULES_DIR).rglob("options.py")):
+        relative = options_file.relative_to(base_dir)
+        options_module = posixpath_to_modulepath(relative)
+        for directory in relative.parts[1:-1]:
+            index.setdefault(directory, options_module)
+    return index
+
+
+def build_manifest(base_dir):
+    return {
+        "version": MANIFEST_VERSION,
+        "apps": scan_modules(),
+        "urls": scan_urls(base_dir),
+        "options": scan_options(),
+    }
+
+
+def write_manifest(base_dir, path=MANIFEST_PATH):
+    manifest = build_manifest(base_dir)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+    # The rename bumped the mtime of modules/ itself; make the manifest at
+    # least as new so it isn't immediately considered stale.
+    os.utime(path)
+    return manifest
+
+
+def _watched_dirs(manifest):
+    """
+    Directories whose mtime changes when a module is added or removed or a
+    listed module's files change: ``modules/``, each module root under it and
+    every package the manifest points into.
+    """
+    dirs = {MODULES_DIR}
+    with os.scandir(MODULES_DIR) as entries:
+        dirs.update(entry.path for entry in entries if entry.is_dir())
+    base_dir = os.path.dirname(MODULES_DIR.rstrip("/"))
+    for app in manifest["apps"]:
+        dirs.add(os.path.join(base_dir, *app.split(".")))
+    for _, urls_module in manifest["urls"]:
+        dirs.add(os.path.join(base_dir, *urls_module.split(".")[:-1]))
+    for options_module in manifest["options"].values():
+        dirs.add(os.path.join(base_dir, *options_module.split(".")[:-1]))
+    return dirs
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """
+    The manifest, or None when it is missing, from another version, or older
+    than any directory it describes.
+    """
+    try:
+        manifest_mtime = os.stat(path).st_mtime
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            return None
+        for directory in _watched_dirs(manifest):
+            if os.stat(directory).st_mtime > manifest_mtime:
+                return None
+    except (OSError, ValueError, KeyError):
+        return None
+    return manifest
 
 
 def get_modules():
     try:
-        modules = []
-        python_package_separator = "."
-        for app in APPS:
-            app_name = app.as_posix().replace(MODULES_DIR, f"{MODULES_PACKAGE_NAME}/")
-            app_name = python_package_separator.join(app_name.split("/")[:-1])
-            modules.append(app_name)
-        return modules
+        manifest = load_manifest()
+        if manifest is not None:
+            return manifest["apps"]
+        return scan_modules()
     except (ImportError, IndexError):
         pass
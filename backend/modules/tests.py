@@ -0,0 +1,169 @@
+import json
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from modules import manifest
+from modules.utils import OptionsRegistry
+
+
+def write_file(path, content=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def age(*paths, seconds=10):
+    # Timestamps written within one clock tick are equal, which would hide a
+    # change made right after the manifest.
+    past = time.time() - seconds
+    for path in paths:
+        os.utime(path, (past, past))
+
+
+class ManifestTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.base_dir = tmp.name
+        self.modules_dir = os.path.join(self.base_dir, "modules")
+        for name in ["apps.py", "urls.py", "options.py"]:
+            write_file(os.path.join(self.modules_dir, "django_alpha", "alpha", name))
+        patcher = mock.patch.object(manifest, "MODULES_DIR", f"{self.modules_dir}/")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.path = os.path.join(self.modules_dir, "manifest.json")
+
+    def write(self):
+        written = manifest.write_manifest(self.base_dir, path=self.path)
+        self.age_tree()
+        # Newer than the tree, older than any change a test makes next.
+        age(self.path, seconds=5)
+        return written
+
+    def age_tree(self):
+        for root, dirs, _ in os.walk(self.modules_dir):
+            age(*(os.path.join(root, d) for d in dirs))
+        age(self.modules_dir)
+
+    def test_manifest_describes_the_tree(self):
+        written = self.write()
+        self.assertEqual(written["apps"], ["modules.django_alpha.alpha"])
+        self.assertEqual(written["urls"], [("alpha", "modules.django_alpha.alpha.urls")])
+        self.assertEqual(
+            written["options"],
+            {
+                "django_alpha": "modules.django_alpha.alpha.options",
+                "alpha": "modules.django_alpha.alpha.options",
+            },
+        )
+        self.assertEqual(manifest.load_manifest(self.path)["apps"], written["apps"])
+
+    def test_new_module_makes_it_stale(self):
+        self.write()
+        write_file(os.path.join(self.modules_dir, "django_beta", "beta", "apps.py"))
+        self.assertIsNone(manifest.load_manifest(self.path))
+
+    def test_file_added_to_a_listed_module_makes_it_stale(self):
+        self.write()
+        write_file(os.path.join(self.modules_dir, "django_alpha", "alpha", "urls_v2.py"))
+        self.assertIsNone(manifest.load_manifest(self.path))
+
+    def test_other_version_or_garbage_is_ignored(self):
+        self.write()
+        with open(self.path) as f:
+            data = json.load(f)
+        data["version"] = manifest.MANIFEST_VERSION - 1
+        write_file(self.path, json.dumps(data))
+        self.assertIsNone(manifest.load_manifest(self.path))
+
+        write_file(self.path, "{")
+        self.assertIsNone(manifest.load_manifest(self.path))
+        self.assertIsNone(manifest.load_manifest(self.path + ".missing"))
+
+    def test_get_modules_prefers_a_current_manifest(self):
+        self.write()
+        with mock.patch.object(
+            manifest.load_manifest, "__defaults__", (self.path,)
+        ), mock.patch.object(manifest, "scan_modules", wraps=manifest.scan_modules) as scan:
+            self.assertEqual(manifest.get_modules(), ["modules.django_alpha.alpha"])
+            scan.assert_not_called()
+
+            write_file(os.path.join(self.modules_dir, "django_beta", "beta", "apps.py"))
+            self.assertEqual(
+                sorted(manifest.get_modules()),
+                ["modules.django_alpha.alpha", "modules.django_beta.beta"],
+            )
+            scan.assert_called_once()
+
+
+class OptionsRegistryTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "options.json")
+        write_file(
+            os.path.join(tmp.name, "options_probe", "options.py"),
+            'PAGE_SIZE = 20\nTITLE = "Customers"\n',
+        )
+        write_file(os.path.join(tmp.name, "options_probe", "__init__.py"))
+        sys.path.insert(0, tmp.name)
+        self.addCleanup(sys.path.remove, tmp.name)
+        self.addCleanup(sys.modules.pop, "options_probe", None)
+        self.addCleanup(sys.modules.pop, "options_probe.options", None)
+
+        self.registry = OptionsRegistry(self.path)
+        self.registry._options_index = {"options_probe": "options_probe.options"}
+        self.write_options({"PAGE_SIZE": 50})
+
+    def write_options(self, options, mtime=None):
+        write_file(
+            self.path, json.dumps({"module_options": {"options-probe": options}})
+        )
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_options_json_overrides_defaults(self):
+        self.assertEqual(self.registry.get("options-probe", "PAGE_SIZE"), 50)
+        self.assertEqual(self.registry.get("options-probe", "TITLE"), "Customers")
+
+    def test_defaults_imported_once(self):
+        with mock.patch(
+            "modules.utils.importlib.import_module",
+            wraps=__import__("importlib").import_module,
+        ) as import_module:
+            for _ in range(3):
+                self.registry.get("options-probe", "TITLE")
+        import_module.assert_called_once_with("options_probe.options")
+
+    def test_reloaded_when_mtime_changes(self):
+        self.write_options({"PAGE_SIZE": 50}, mtime=1000)
+        self.assertEqual(self.registry.get("options-probe", "PAGE_SIZE"), 50)
+
+        self.write_options({"PAGE_SIZE": 75}, mtime=2000)
+        # Not rechecked within the interval...
+        self.assertEqual(self.registry.get("options-probe", "PAGE_SIZE"), 50)
+        # ...but picked up after it.
+        with mock.patch("modules.utils.OPTIONS_RELOAD_CHECK_INTERVAL", -1):
+            self.assertEqual(self.registry.get("options-probe", "PAGE_SIZE"), 75)
+
+    def test_unchanged_file_not_reread(self):
+        self.registry.get("options-probe", "PAGE_SIZE")
+        with mock.patch("modules.utils.OPTIONS_RELOAD_CHECK_INTERVAL", -1), mock.patch(
+            "builtins.open", side_effect=AssertionError("reread")
+        ):
+            self.assertEqual(self.registry.get("options-probe", "PAGE_SIZE"), 50)
+
+    def test_options_module_from_manifest(self):
+        registry = OptionsRegistry(self.path)
+        with mock.patch(
+            "modules.manifest.load_manifest",
+            return_value={"options": {"options_probe": "options_probe.options"}},
+        ) as load_manifest:
+            self.assertEqual(registry.get("options-probe", "TITLE"), "Customers")
+            registry.get("options-probe", "PAGE_SIZE")
+        load_manifest.assert_called_once_with()
@@ -1,9 +1,8 @@
-from pathlib import Path
 from django.conf import settings
 from django.urls import path, include
 from django.db.utils import ProgrammingError
 
-from .utils import posixpath_to_modulepath
+from .manifest import load_manifest, scan_urls
 
 urlpatterns = []
 
@@ -12,18 +11,12 @@ urlpatterns = []
 # Crowdbotics' official modules working properly.
 
 try:
-    base_dir = Path(settings.BASE_DIR)
-    modules_dir = base_dir / "modules"
-    urls = modules_dir.rglob("urls.py")
-    for url in urls:
-        module_name, _ = url.as_posix().split("/")[-2:]
-        if not module_name == "modules":
-            module_url = module_name.replace("_", "-")
-            urlpatterns += [
-                path(
-                    f"{module_url}/",
-                    include(posixpath_to_modulepath(url.relative_to(base_dir))),
-                )  # noqa
-            ]
+    manifest = load_manifest()
+    if manifest is not None:
+        module_urls = manifest["urls"]
+    else:
+        module_urls = scan_urls(settings.BASE_DIR)
+    for module_url, urls_module in module_urls:
+        urlpatterns += [path(f"{module_url}/", include(urls_module))]  # noqa
 except (ImportError, IndexError, ProgrammingError):
     pass
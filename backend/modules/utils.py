@@ -1,33 +1,88 @@
 import importlib
 import json
+import os
+import threading
+import time
 
 from pathlib import Path
 
 GLOBAL_OPTIONS_FILE_PATH = f"{Path.cwd()}/modules/options.json"
 
+# How often (seconds) get_options checks options.json for changes.
+OPTIONS_RELOAD_CHECK_INTERVAL = 1
+
 
 def posixpath_to_modulepath(posixpath):
     module_parent_path = posixpath.parent.as_posix().replace("/", ".")
     return f"{module_parent_path}.{posixpath.stem}"
 
 
-def get_options(module_slug, option_key):
-    with open(GLOBAL_OPTIONS_FILE_PATH, "r") as f:
-        all_module_options = json.loads(f.read())
-        all_module_options = all_module_options.get("module_options", None)
+class OptionsRegistry:
+    """
+    In-process cache of ``options.json`` (reloaded when its mtime changes) and
+    of each module's ``options.py`` defaults, located through the modules
+    manifest instead of a filesystem scan whenever the manifest is current.
+    """
+
+    def __init__(self, path=GLOBAL_OPTIONS_FILE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._module_options = None
+        self._mtime = None
+        self._checked_at = 0
+        self._options_index = None
+        self._defaults = {}
+
+    def module_options(self):
+        now = time.monotonic()
+        if (
+            self._module_options is None
+            or now - self._checked_at > OPTIONS_RELOAD_CHECK_INTERVAL
+        ):
+            with self._lock:
+                mtime = os.stat(self.path).st_mtime
+                if self._module_options is None or mtime != self._mtime:
+                    with open(self.path, "r") as f:
+                        all_module_options = json.loads(f.read())
+                    self._module_options = (
+                        all_module_options.get("module_options", None) or {}
+                    )
+                    self._mtime = mtime
+                self._checked_at = now
+        return self._module_options
 
-    option_value = None
+    def options_module(self, module_slug):
+        directory = module_slug.replace("-", "_")
+        if self._options_index is None:
+            # Imported here: manifest imports this module.
+            from .manifest import load_manifest
 
-    if all_module_options:
-        module_options = all_module_options.get(module_slug, None)
-        if module_options:
-            option_value = module_options.get(option_key, None)
+            manifest = load_manifest()
+            self._options_index = manifest["options"] if manifest else {}
+        options_module = self._options_index.get(directory)
+        if options_module is None:
+            module_options_file = next(
+                Path(".").rglob(f"**/{directory}/**/options.py")
+            )
+            options_module = posixpath_to_modulepath(module_options_file)
+            self._options_index[directory] = options_module
+        return options_module
 
-    module_options_file = next(
-        Path(".").rglob(f"**/{module_slug.replace('-', '_')}/**/options.py")
-    )
+    def default(self, module_slug, option_key):
+        key = (module_slug, option_key)
+        if key not in self._defaults:
+            options_module = importlib.import_module(self.options_module(module_slug))
+            self._defaults[key] = getattr(options_module, option_key)
+        return self._defaults[key]
 
-    options_module = posixpath_to_modulepath(module_options_file)
-    default_value = getattr(importlib.import_module(options_module), option_key)
+    def get(self, module_slug, option_key):
+        module_options = self.module_options().get(module_slug, None) or {}
+        option_value = module_options.get(option_key, None)
+        return option_value if option_value else self.default(module_slug, option_key)
 
-    return option_value if option_value else default_value
+
+options_registry = OptionsRegistry()
+
+
+def get_options(module_slug, option_key):
+    return options_registry.get(module_slug, option_key)